@@ -0,0 +1,490 @@
+#!/usr/bin/env python
+#
+# Benchmarks
+#
+import argparse
+import json
+import os
+import subprocess
+import sys
+import timeit
+
+from runtests import setup_gae
+
+
+BENCHMARKS = []
+
+
+def benchmark(func):
+    """Register a benchmark function.
+
+    """
+    BENCHMARKS.append(func)
+    return func
+
+
+def get_args_parser():
+    """Build the command line argument parser
+
+    """
+    parser = argparse.ArgumentParser(
+        description='Load GAE and run the benchmarks.'
+    )
+    parser.add_argument(
+        'names',
+        nargs='*',
+        help='benchmarks to run (default to all).'
+    )
+    parser.add_argument(
+        '--gae-lib-root', '-l',
+        default=os.getenv('GAEPATH', '/usr/local/google_appengine'),
+        help='directory where to find Google App Engine SDK '
+            '(default to "/usr/local/google_appengine")'
+    )
+    parser.add_argument(
+        '--repeat', '-r',
+        type=int, default=3,
+        help='number of time to repeat each measure (default to 3).'
+    )
+    return parser
+
+
+def report(name, number, timings, unit='op'):
+    """Print the best timing of a measure.
+
+    """
+    best = min(timings)
+    print "%-40s %10.1f %s/s %10.2f us/%s" % (
+        name, number / best, unit, best * 1e6 / number, unit,
+    )
+
+
+def measure(name, func, number, repeat, unit='op'):
+    timings = timeit.Timer(func).repeat(repeat=repeat, number=number)
+    report(name, number, timings, unit)
+
+
+def measure_step(name, setup, func, repeat, unit='op'):
+    """Measure `func(setup())`, without the `setup()` time.
+
+    """
+    timings = []
+    for _ in range(repeat):
+        arg = setup()
+        start = timeit.default_timer()
+        func(arg)
+        timings.append(timeit.default_timer() - start)
+    report(name, 1, timings, unit)
+
+
+def _student(i):
+    return {
+        "id": i,
+        "firstName": u"Alice",
+        "lastName": u"Liddell %d" % i,
+        "studentId": u"A%08d" % i,
+        "email": u"alice.%d@example.com" % i,
+        "active": i % 2 == 0,
+        "score": i * 1.5,
+        "courses": [u"math", u"physics", u"computing"],
+    }
+
+
+PAYLOADS = [
+    ("student", _student(1)),
+    ("student list (100)", {"students": [_student(i) for i in range(100)]}),
+]
+
+
+def get():
+    """Get a model"""
+
+
+def define_api(size, version='1', registry=None, lazy_docs=False):
+    """Define an api with `size` models (and a resource per 10 models).
+
+    With a registry, the models should be defined with
+    `define_schemas(registry, size)`.
+
+    """
+    from webapp2ext import swagger
+
+    api = swagger.Api(
+        host="http://example.com/",
+        path='/api/v%s' % version,
+        version=version,
+        registry=registry,
+        lazy_docs=lazy_docs
+    )
+    if registry is None:
+        define_schemas(api, size)
+
+    for i in range(0, size, 10):
+        resource = api.resource("/models%d" % i, desc="Models %d" % i)
+        endpoint = resource.endpoint("/models%d/<modelId>" % i)
+        endpoint.operation(
+            type_="Model%d" % i,
+            alias="getModel%d" % i,
+            parameters=[
+                swagger.String(name="modelId", param_type="path")
+            ],
+            responses=[
+                swagger.Message(200, "Ok"),
+                swagger.Message(404, "Not found"),
+            ]
+        )(get)
+    return api
+
+
+def define_schemas(registry, size):
+    """Define `size` models in an api or a schema registry.
+
+    """
+    from webapp2ext import swagger
+
+    for i in range(size):
+        registry.schema(
+            "Model%d" % i,
+            description="Model %d" % i,
+            properties={
+                "id": swagger.Int(required=True),
+                "name": swagger.String(required=True),
+                "created": swagger.String(format="date-time"),
+                "score": swagger.Float(minimum=0, maximum=100),
+                "tags": swagger.Array(items=swagger.String()),
+                "parent": registry.ref("Model%d" % (i // 2)),
+                "related": swagger.Array(
+                    items=registry.ref("Model%d" % ((i * 7 + 1) % size))
+                ),
+            }
+        )
+
+
+_IMPORT_SCRIPT = """
+import time
+import benchmark
+start = time.time()
+import webapp2ext.swagger
+imported = time.time()
+benchmark.define_api(%d)
+print imported - start, time.time() - imported
+"""
+
+
+@benchmark
+def import_time(repeat, size=200):
+    """Package import time and api definition time (cold start).
+
+    """
+    env = dict(os.environ)
+    env['PYTHONPATH'] = os.pathsep.join(sys.path)
+    imports, definitions = [], []
+    for _ in range(repeat):
+        out = subprocess.check_output(
+            [sys.executable, '-c', _IMPORT_SCRIPT % size],
+            env=env,
+            cwd=os.path.dirname(os.path.abspath(__file__))
+        )
+        import_duration, definition_duration = out.split()[-2:]
+        imports.append(float(import_duration))
+        definitions.append(float(definition_duration))
+    report("import webapp2ext.swagger", 1, imports, 'import')
+    report("define a %d models api" % size, 1, definitions, 'api')
+
+
+@benchmark
+def startup(repeat, size=200):
+    """Api definition and freeze, with and without a snapshot (the
+    freeze timings don't include the definition).
+
+    """
+    data = define_api(size).snapshot()
+    print "snapshot size: %d bytes" % len(data)
+
+    def define():
+        define_api(size)
+
+    def freeze(api):
+        api.routes()
+
+    def freeze_with_snapshot(api):
+        assert api.load_snapshot(data)
+        api.routes()
+
+    def freeze_with_version_id(api):
+        assert api.load_snapshot(version_data, fingerprint='1.2345')
+        api.routes()
+
+    version_data = define_api(size).snapshot(fingerprint='1.2345')
+    defined = lambda: define_api(size)
+
+    measure("define", define, 1, repeat, 'api')
+    measure_step("freeze", defined, freeze, repeat, 'api')
+    measure_step(
+        "freeze (lazy docs)",
+        lambda: define_api(size, lazy_docs=True), freeze, repeat, 'api'
+    )
+    measure_step(
+        "load snapshot", defined, freeze_with_snapshot, repeat, 'api'
+    )
+    measure_step(
+        "load snapshot (version id)",
+        defined, freeze_with_version_id, repeat, 'api'
+    )
+
+
+@benchmark
+def reload(repeat, size=200):
+    """Documents of an api not frozen yet after a schema is redefined
+    (development server).
+
+    """
+    from webapp2ext import swagger
+
+    api = define_api(size)
+    resources = api.resources.values()
+    counter = [0]
+
+    def render():
+        api.schemas()
+        for resource in resources:
+            resource.api_doc()
+
+    def redefine_and_render():
+        counter[0] += 1
+        api.schema("Model0", properties={
+            "id": swagger.Int(default=counter[0]),
+        })
+        render()
+
+    render()
+    measure("render", render, 1, repeat, 'run')
+    measure(
+        "redefine a schema + render", redefine_and_render, 1, repeat, 'run'
+    )
+
+
+@benchmark
+def memory(repeat, size=200):
+    """Memory report of a frozen api, with and without lazy docs.
+
+    """
+    for lazy_docs in (False, True,):
+        api = define_api(size, lazy_docs=lazy_docs)
+        api.warmup()
+        print "lazy docs: %s" % lazy_docs
+        for name, counts in api.memory_report().iteritems():
+            print "%-20s %10d bytes  %s" % (
+                name,
+                counts['bytes'],
+                ', '.join(
+                    '%s: %d' % (k, v)
+                    for k, v in sorted(counts.iteritems()) if k != 'bytes'
+                ),
+            )
+
+
+@benchmark
+def versions(repeat, size=200, count=4):
+    """Api versions defined separately or sharing a schema registry.
+
+    """
+    from webapp2ext.swagger import SchemaRegistry
+
+    def separately():
+        for version in range(count):
+            api = define_api(size, str(version))
+            api.routes()
+            for name in ('Model0', 'Model1',):
+                api.validator(name)
+
+    def with_registry():
+        registry = SchemaRegistry()
+        define_schemas(registry, size)
+        for version in range(count):
+            api = define_api(size, str(version), registry)
+            api.routes()
+            for name in ('Model0', 'Model1',):
+                api.validator(name)
+
+    measure("%d versions" % count, separately, 1, repeat, 'run')
+    measure(
+        "%d versions with a registry" % count, with_registry, 1, repeat, 'run'
+    )
+
+
+def define_student_api():
+    """Define an api with the benchmark payloads models.
+
+    """
+    from webapp2ext import swagger
+
+    api = swagger.Api(
+        host="http://example.com/", path='/api/v1', version='1'
+    )
+    api.schema(
+        "Student",
+        properties={
+            "id": swagger.Int(required=True, minimum=0),
+            "firstName": swagger.String(required=True),
+            "lastName": swagger.String(required=True),
+            "studentId": swagger.String(),
+            "email": swagger.String(format="email"),
+            "active": swagger.Boolean(),
+            "score": swagger.Float(minimum=0),
+            "courses": swagger.Array(
+                items=swagger.String(enum=["math", "physics", "computing"])
+            ),
+        }
+    )
+    api.schema(
+        "StudentList",
+        properties={
+            "students": swagger.Array(items=api.ref("Student")),
+        }
+    )
+    return api
+
+
+@benchmark
+def validation(repeat):
+    """Payload validation with jsonschema and with generated validators.
+
+    """
+    api = define_student_api()
+    models = ("Student", "StudentList",)
+    for (name, payload), model in zip(PAYLOADS, models):
+        validate = api.compiled_validator(model)
+        measure(
+            "validate %s" % name,
+            lambda: api.validate(model, payload),
+            100, repeat
+        )
+        measure(
+            "compiled validator %s" % name,
+            lambda: validate(payload),
+            100, repeat
+        )
+        measure(
+            "load %s" % name,
+            lambda: api.load(model, payload),
+            100, repeat
+        )
+
+    payload = PAYLOADS[-1][1]
+    print "student list (100) size: %d bytes as dicts, %d as models" % (
+        _size(payload), _size(api.load("StudentList", payload)),
+    )
+
+
+def _size(value):
+    """Approximate memory size of containers and model objects (shared
+    values are counted once).
+
+    """
+    from webapp2ext.swagger import Model
+
+    seen = set()
+    size = 0
+    values = [value]
+    while values:
+        value = values.pop()
+        if id(value) in seen:
+            continue
+        seen.add(id(value))
+        size += sys.getsizeof(value)
+        if isinstance(value, dict):
+            values.extend(value.iterkeys())
+            values.extend(value.itervalues())
+        elif isinstance(value, list):
+            values.extend(value)
+        elif isinstance(value, Model):
+            values.extend(getattr(value, f) for f in value.__slots__)
+    return size
+
+
+def _codecs():
+    from webapp2ext.swagger import JsonCodec, MsgPackCodec
+
+    codecs = [JsonCodec(json)]
+    for name in ('simplejson', 'ujson',):
+        try:
+            codecs.append(JsonCodec(__import__(name)))
+        except ImportError:
+            pass
+    try:
+        codecs.append(MsgPackCodec())
+    except ImportError:
+        pass
+    return codecs
+
+
+@benchmark
+def codec(repeat):
+    """Codecs encode and decode throughput.
+
+    """
+    from webapp2ext.swagger import default_codec
+
+    print "default codec: %s" % default_codec.name
+    for codec in _codecs():
+        for name, payload in PAYLOADS:
+            text = codec.encode(payload)
+            measure(
+                "%s encode %s" % (codec.name, name,),
+                lambda: codec.encode(payload),
+                1000, repeat
+            )
+            measure(
+                "%s decode %s" % (codec.name, name,),
+                lambda: codec.decode(text),
+                1000, repeat
+            )
+
+
+@benchmark
+def encode(repeat):
+    """Model responses encoding with the codec and with generated
+    encoders.
+
+    """
+    from webapp2ext.swagger import JsonCodec
+
+    api = define_student_api()
+    models = ("Student", "StudentList",)
+    for (name, payload), model in zip(PAYLOADS, models):
+        data = api.load(model, payload)
+        encoder = api.encoder(model)
+        for codec in _codecs():
+            if isinstance(codec, JsonCodec):
+                measure(
+                    "%s encode %s" % (codec.name, name,),
+                    lambda: codec.encode(data._asdict()),
+                    1000, repeat
+                )
+        measure(
+            "generated encoder %s" % name,
+            lambda: encoder(data),
+            1000, repeat
+        )
+
+
+def main(gae_lib_root, names, repeat):
+    """Load Google App Engine SDK and run the benchmarks.
+
+    """
+    setup_gae(gae_lib_root)
+    sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+    for func in BENCHMARKS:
+        if names and func.__name__ not in names:
+            continue
+        print ""
+        print "%s: %s" % (func.__name__, func.__doc__.strip())
+        func(repeat)
+
+
+if __name__ == '__main__':
+    parser = get_args_parser()
+    args = parser.parse_args()
+    main(args.gae_lib_root, args.names, args.repeat)
@@ -4,5 +4,10 @@ setup(
     name="webapp2ext.swagger",
     version="0.1.1",
     packages=find_packages(),
-    namespace_packages=['webapp2ext']
+    namespace_packages=['webapp2ext'],
+    entry_points={
+        'console_scripts': [
+            'swagger-build-docs = webapp2ext.swagger.build:main_cli',
+        ],
+    }
 )
@@ -82,16 +82,28 @@ example usage:
 http://spacetelescope.github.io/understanding-json-schema/reference/combining.html#allof
 
 """
+import gzip
+import hashlib
 import json
+import keyword
+import logging
+import marshal
+import math
+import numbers
 import operator
+import os
 import re
+import sys
+import threading
+import time
+import types
 import weakref
-from collections import deque
+import zlib
+from collections import OrderedDict, deque
 from itertools import chain
+from StringIO import StringIO
 
 import webapp2
-from google.appengine.api import users
-from jsonschema import Draft4Validator, RefResolver
 from webapp2_extras import routes
 
 
@@ -115,7 +127,12 @@ def to_dict(root, ctx=None):
     """
     if ctx is None:
         ctx = _Context()
-    clone = root.to_dict(ctx) if hasattr(root, "to_dict") else root.copy()
+    if hasattr(root, "to_dict"):
+        clone, new = _render(ctx, root)
+        if not new:
+            return clone
+    else:
+        clone = root.copy()
     nodes = deque([clone])
 
     while nodes:
@@ -138,10 +155,24 @@ def _walk_list(ctx, node, nodes):
         _to_dict(ctx, node, i, nodes)
 
 
+def _render(ctx, obj):
+    """Return the object rendering and whether it was rendered for the
+    first time in this context.
+
+    """
+    rendered = ctx.memo.get(id(obj))
+    if rendered is not None:
+        return rendered[1], False
+    # keep a reference to the object so that its id is not reused
+    rendered = ctx.memo[id(obj)] = (obj, obj.to_dict(ctx),)
+    return rendered[1], True
+
+
 def _to_dict(ctx, node, key, nodes):
     if hasattr(node[key], "to_dict"):
-        node[key] = node[key].to_dict(ctx)
-        nodes.append(node[key])
+        node[key], new = _render(ctx, node[key])
+        if new:
+            nodes.append(node[key])
     elif hasattr(node[key], "copy"):
         node[key] = node[key].copy()
         nodes.append(node[key])
@@ -179,7 +210,7 @@ class _Type(object):
         return dict(
             (camelCase(k), v,)
                 for (k, v,) in self.__dict__.iteritems()
-                if v is not None
+                if v is not None and k[0] != '_'
         )
 
 
@@ -215,6 +246,8 @@ class Object(_Type):
         self.required = required if required else None
         self.pattern_properties = pattern_properties
         self.additional_properties = additional_properties
+        # compiled pattern properties, set by `Api.schema`
+        self._patterns = None
 
 
 class Param(_Type):
@@ -241,8 +274,9 @@ class String(_Type):
     """Json-schema string type
 
     """
-    def __init__(self, **kw):
+    def __init__(self, pattern=None, **kw):
         super(String, self).__init__(type_="string", **kw)
+        self.pattern = pattern
 
 
 class _Number(_Type):
@@ -344,399 +378,3473 @@ class Message(object):
 JSON_SCHEMA = "json-schema"
 SWAGGER_DOC = "api-doc"
 
+# name of the built documents manifest (see `webapp2ext.swagger.build`)
+MANIFEST = "manifest.json"
+
+# version of the `Api.snapshot` format
+SNAPSHOT_FORMAT = 2
+
+AUTH_LOGIN = "login"
+AUTH_ADMIN = "admin"
+
+# rate limit keys (see `RateLimit`)
+RATE_BY_USER = "user"
+RATE_BY_IP = "ip"
+RATE_BY_API_KEY = "api_key"
+
 
 class _Context(object):
+    """Rendering context.
+
+    Objects are only rendered once per context (`memo` maps their id
+    to their rendered dict), so that identical definitions (see
+    `Api.schema`) share their rendered dict.
+
+    """
 
-    def __init__(self, api=None, output=JSON_SCHEMA):
+    def __init__(self, api=None, output=JSON_SCHEMA, memo=None):
         if api is not None:
             self.api = weakref.proxy(api)
         else:
             self.api = None
         self.output = output
+        self.memo = {} if memo is None else memo
 
 
-class Api(object):
-    """Decorator (decorator builder) for webapp2 request handler.
+class JsonCodec(object):
+    """Json encoder/decoder.
 
-    Generate routes, schemas and the swagger api doc of an api.
+    Wrap a module with the `json` module `dumps` and `loads` functions
+    (e.g. `json`, `simplejson` or `ujson`). The default codec uses
+    `json`; the other modules have to be selected explicitly, since
+    they don't encode and decode exactly like it:
 
-    """
+    - `simplejson` is used with the `json` options for namedtuples
+      (arrays) and NaN (allowed), but it decodes ascii strings as
+      `str` instead of `unicode`;
+    - `ujson` encodes floats with at most 15 significant digits, and it
+      can't reject objects it can't serialize (it encodes them as `{}`,
+      or as an int for dates, instead of raising a `TypeError`). It's
+      used without escaping forward slashes.
 
-    # api doc `swaggerVersion` attribute
-    swagger_version = '1.2'
+    """
 
-    def __init__(self, host, path, version):
-        """Api constructor.
+    content_type = "application/json"
+
+    def __init__(self, module=json):
+        self.module = module
+        self.name = module.__name__
+        self._options = {}
+        if self.name == 'simplejson':
+            self._options = {
+                'namedtuple_as_object': False,
+                'allow_nan': True,
+            }
+        elif self.name == 'ujson':
+            self._options = {
+                'double_precision': 15,
+                'escape_forward_slashes': False,
+            }
+
+    def encode(self, data, pretty=False):
+        if pretty:
+            return self.module.dumps(
+                data, sort_keys=True, indent=4, **self._options
+            )
+        return self.module.dumps(data, **self._options)
 
-        `host`: used for the schema URI.
-        `path`: used a prefix for the route.
-        `version`: used for the api doc `apiVersion` attribute
+    def decode(self, text):
+        return self.module.loads(text)
 
 
-        """
-        if path[0] != '/':
-            raise ValueError('path cannot be relative')
-        self.host = host.rstrip('/')
-        self.path = path.rstrip('/')
-        self.version = version
-        self.resources = {}
-        self._schemas = {}
-        self._resolver = RefResolver(self.schema_path, {}, store={})
+default_codec = JsonCodec()
 
-    @property
-    def base_path(self):
-        return ''.join([self.host, self.path])
 
-    @property
-    def schema_path(self):
-        return "%s/json-schemas" % self.base_path
+class MsgPackCodec(object):
+    """MessagePack encoder/decoder.
 
-    def api_doc(self):
-        """Generate the api doc (as a dict).
+    Compact binary alternative to json for clients sending a
+    `application/x-msgpack` Accept header. Requires `msgpack`.
 
-        It generate a route documentation listing all the resources.
+    """
 
-        """
-        return {
-            "apiVersion": self.version,
-            "swaggerVersion": self.swagger_version,
-            "apis": sorted(
-                [r.summary() for r in self.resources.values()],
-                key=operator.itemgetter('path')
-            ),
-        }
+    content_type = "application/x-msgpack"
+    name = "msgpack"
 
-    def _json_handler(self, data, status=200):
-        resp = webapp2.Response(
-            json.dumps(data, sort_keys=True, indent=4)
-        )
-        resp.headers['Content-Type'] = "application/json"
-        resp.status = status
-        return resp
+    def __init__(self, module=None):
+        if module is None:
+            import msgpack as module
+        self.module = module
 
-    def schema_handler(self, request):
-        """http handler for the schema request.
+    def encode(self, data, pretty=False):
+        # byte strings are python 2 text: encode them as msgpack str,
+        # not bin, for the other languages clients.
+        return self.module.packb(data, use_bin_type=False)
 
-        """
-        return self._json_handler(self.schemas())
+    def decode(self, text):
+        try:
+            return self.module.unpackb(text, raw=False)
+        except Exception:
+            raise ValueError("Invalid msgpack data")
 
-    def api_doc_handler(self, request):
-        """http handler for the route api-doc request.
 
-        """
-        return self._json_handler(self.api_doc())
+def _hash_value(sha, value, memo=None):
+    """Update a hash with a definition value (an api object or a
+    primitive value, list or dict of them).
 
-    def apis_handler(self, request, path):
-        """http handler for a resource api-doc request.
+    `memo` keeps the serialization of the api objects, which are often
+    shared by several definitions (see `_Interner`).
 
-        """
-        resource = self.resources.get('/%s' % path, None)
-        if resource is None:
-            return self._json_handler({'error': 'resource not found'}, 404)
+    """
+    sha.update(_serialize(value, {} if memo is None else memo))
+
+
+def _serialize(value, memo):
+    if isinstance(value, (_Type, _Ref, Message,)):
+        # the memo keeps the object alive for its id to stay unique
+        cached = memo.get(id(value))
+        if cached is None:
+            cached = memo[id(value)] = (
+                value,
+                value.__class__.__name__ + _serialize(
+                    dict(
+                        (k, v,)
+                            for k, v in value.__dict__.iteritems()
+                            if k[0] != '_'
+                    ),
+                    memo
+                ),
+            )
+        return cached[1]
+    elif isinstance(value, dict):
+        return '{%s}' % ''.join(
+            _serialize(key, memo) + _serialize(value[key], memo)
+                for key in sorted(value)
+        )
+    elif isinstance(value, (list, tuple,)):
+        return '[%s]' % ''.join(_serialize(item, memo) for item in value)
+    return repr(value)
 
-        return self._json_handler(resource.api_doc())
 
-    def routes(self):
-        """Return a route collection for an api
-        (including the api-doc and schema):
+def _gzip(body):
+    buf = StringIO()
+    with gzip.GzipFile(filename='', mode='wb', fileobj=buf, mtime=0) as f:
+        f.write(body)
+    return buf.getvalue()
 
-        - the request handler routes are define by the
-          `swagger.ApiRequestHandler.path` class attributes.
-        - the api-doc path `<api.path>/api-docs`
-        - the schema path `<api.path>/json-schemas/`
 
-        """
-        rel_routes = []
-        rel_routes.append(
-            webapp2.Route('/api-docs', self.api_doc_handler, methods=['GET'])
-        )
-        rel_routes.append(
-            webapp2.Route(
-                '/api-docs/<path:.+>', self.apis_handler, methods=['GET']
-            )
-        )
-        rel_routes.append(
-            webapp2.Route(
-                '/json-schemas', self.schema_handler, methods=['GET']
-            )
-        )
+WARMUP_PATH = '/_ah/warmup'
 
-        for resource in self.resources.itervalues():
-            for api in resource.apis.itervalues():
-                rel_routes.append(webapp2.Route(api.path, api.handler,))
-        return routes.PathPrefixRoute(self.path, rel_routes)
 
-    def resource(self, path, desc=None):
-        """Define a new resource.
+def warmup_route(apis, path=WARMUP_PATH):
+    """Return a route warming up some apis (see `Api.warmup`).
 
-        """
-        if path not in self.resources:
-            self.resources[path] = _Resource(self, path, desc)
-        return self.resources[path]
+    App Engine sends a request to `/_ah/warmup` before sending traffic
+    to a new instance (when warmup requests are enabled in app.yaml).
+    The handler responds with the duration of each warm up step.
 
-    def schema(self, name, properties=None, additional_properties=False, **kw):
-        """Create a new schema definition.
+    """
+    def warmup_handler(request):
+        timings = OrderedDict()
+        for api in apis:
+            timings[api.path] = api.warmup()
+            logging.info(
+                "Api %s warmed up: %s",
+                api.path,
+                ', '.join('%s %.1fms' % (k, v * 1000,)
+                    for k, v in timings[api.path].iteritems())
+            )
+        resp = webapp2.Response(default_codec.encode(timings))
+        resp.headers['Content-Type'] = default_codec.content_type
+        return resp
 
-        The base schema can currently only be defined as objects
-        (swagger only define models as object).
+    return webapp2.Route(path, warmup_handler, methods=['GET'])
 
-        """
-        properties = {} if properties is None else properties
-        kw.setdefault('required', [])
 
-        for prop_name, prop in properties.iteritems():
-            if prop.required:
-                kw['required'].append(prop_name)
-            prop.required = None
+class _Interner(object):
+    """Share structurally identical values.
 
-        definition = Object(
-            id=name,
-            properties=properties,
-            additional_properties=additional_properties,
-            **kw
-        )
-        self._schemas[name] = definition
-        self._update_resolver()
+    `intern` replaces, in place, each part of a dict, list or schema
+    object by the first structurally identical part it has seen (and
+    returns the canonical value). Interned values should not be
+    modified afterward.
 
-    def schemas(self):
-        """Json-schema for all complex type defined in an API.
+    `Api.schema` uses it so that identical properties of different
+    definitions are the same objects, and so are rendered once (see
+    `_Context`). When definitions are replaced, the table is rebuilt
+    from the current definitions (see `prune`).
 
-        """
-        schemas = {
-            "id": "%s#" % self.schema_path,
-            "$schema": "http://json-schema.org/draft-04/schema#",
-        }
-        for s_id, s in self._schemas.iteritems():
-            if s is None:
-                continue
-            schemas[s_id] = s
-        return to_dict(schemas, ctx=_Context(self))
+    """
 
-    def ref(self, name, required=False):
-        """Return an object with "$ref" attribute.
+    # minimum table size before pruning
+    min_prune_size = 256
 
-        Suitable to be used in json schema document. Use Api.model if
-        the reference is to be used in swagger api document.
+    def __init__(self):
+        self._table = {}
+        self._pruned_size = 0
 
-        """
-        self._schemas.setdefault(name, None)
-        return _Ref(name, required=required)
+    def intern(self, value):
+        return self._intern(value)[1]
 
-    def _update_resolver(self):
-        self._resolver.store[self.schema_path] = self.schemas()
+    def prune(self, definitions):
+        """Forget the values not used by the definitions returned by
+        `definitions()` (e.g. the properties of replaced definitions).
 
-    def validate(self, schema, data):
-        """Create json-schema validator for a complex type.
+        The table is only rebuilt once it has doubled since it was last
+        rebuilt, so that redefining a schema doesn't intern all the
+        definitions again.
 
         """
-        with self._resolver.resolving('#/%s' % schema) as schema:
-            validator = Draft4Validator(schema, resolver=self._resolver)
-            validator.validate(data)
+        if len(self._table) < 2 * max(self._pruned_size, self.min_prune_size):
+            return
+        self._table = {}
+        for definition in definitions():
+            if definition is not None:
+                self._intern(definition.properties)
+        self._pruned_size = len(self._table)
+
+    def _intern(self, value):
+        if isinstance(value, dict):
+            key = (dict, self._intern_items(value),)
+        elif isinstance(value, list):
+            keys = []
+            for i, v in enumerate(value):
+                item_key, item = self._intern(v)
+                if item is not v:
+                    value[i] = item
+                keys.append(item_key)
+            key = (list, tuple(keys),)
+        elif isinstance(value, (_Type, _Ref,)):
+            key = (value.__class__, self._intern_items(value.__dict__),)
+        else:
+            try:
+                hash(value)
+            except TypeError:
+                return (id(value),), value
+            return (value.__class__, value,), value
 
+        canonical = self._table.setdefault(key, value)
+        return key, canonical
 
-class _Resource(object):
-    """An api resource.
+    def _intern_items(self, mapping):
+        items = []
+        for k, v in mapping.iteritems():
+            item_key, item = self._intern(v)
+            if item is not v:
+                mapping[k] = item
+            items.append((k, item_key,))
+        return frozenset(items)
 
-    The path parameter defines the relative of the resource api-doc
-    (relative to `/api-doc`). It should match the root path
-    of a resource it doesn't need to.
 
-    """
-    def __init__(self, api, path, desc):
-        self.api = weakref.proxy(api)
-        self.path = path
-        self.description = desc
-        self.apis = {}
-        self.models = set()
+def _hoist_inline_objects(schemas, schema_path):
+    """Replace inline objects repeated in a rendered json-schema
+    document by references to a shared definition.
 
-    def add_model(self, type_):
-        """Add a model to the resource api documentation.
+    Identical inline objects are expected to share the same dict (see
+    `_Context` and `Api.schema`).
 
-        It will walk the model to find nested complex type requirement.
+    """
+    counts = {}
+    occurrences = []
+    nodes = deque(
+        v for k, v in schemas.iteritems() if isinstance(v, dict)
+    )
+    while nodes:
+        node = nodes.pop()
+        children = node.iteritems() if isinstance(node, dict) else (
+            enumerate(node)
+        )
+        for key, child in children:
+            if not isinstance(child, (dict, list,)):
+                continue
+            nodes.append(child)
+            if (
+                isinstance(child, dict)
+                and child.get('type') == 'object'
+                and 'id' not in child
+            ):
+                counts[id(child)] = counts.get(id(child), 0) + 1
+                occurrences.append((node, key, child,))
+
+    # named before any nested object is replaced by a reference
+    names = {}
+    for parent, key, child in occurrences:
+        if counts[id(child)] > 1 and id(child) not in names:
+            names[id(child)] = 'Inline%s' % hashlib.sha1(
+                json.dumps(child, sort_keys=True)
+            ).hexdigest()[:8]
+
+    for parent, key, child in occurrences:
+        name = names.get(id(child))
+        if name is None:
+            continue
+        schemas[name] = child
+        parent[key] = {"$ref": "%s#/%s" % (schema_path, name,)}
+
+
+class _FrozenDict(dict):
+    """Read-only dict used by frozen api registries.
 
-        """
-        if type_ in _primitives:
-            return
-        if type_ in self.models:
-            return
-        if type_ not in self.api._schemas:
-            raise ValueError("No schema with that id (%s)." % type_)
+    """
 
-        skip = set(self.models)
-        to_check = deque([type_])
+    def _readonly(self, *args, **kw):
+        raise TypeError("A frozen api registry cannot be modified.")
 
-        while len(to_check) > 0:
-            name = to_check.pop()
-            to_check.extend(self._check_type(name, skip))
-            skip.add(name)
-            self.models.add(name)
+    __setitem__ = __delitem__ = _readonly
+    clear = pop = popitem = setdefault = update = _readonly
 
-    def _check_type(self, type_, skip):
-        if type_ in skip:
-            return ()
 
-        schema = self.api._schemas[type_]
-        if schema is None:
-            return ()
+class _LRUCache(object):
+    """Thread safe mapping keeping the `size` most recently used items.
 
-        schemas_to_check = []
+    """
 
-        pp = schema.pattern_properties or {}
-        for prop in chain(schema.properties.itervalues(), pp.itervalues()):
-            if isinstance(prop, _Ref):
-                schemas_to_check.append(prop.name)
-                continue
+    def __init__(self, size):
+        self.size = size
+        self._items = OrderedDict()
+        self._lock = threading.Lock()
 
-            if not isinstance(prop, Array):
-                continue
+    def __len__(self):
+        return len(self._items)
 
-            if isinstance(prop.items, _Ref):
-                schemas_to_check.append(prop.items.name)
-                continue
-        return schemas_to_check
+    def get(self, key):
+        with self._lock:
+            value = self._items.pop(key, None)
+            if value is not None:
+                self._items[key] = value
+            return value
 
-    def summary(self):
-        """Api doc summary for that resource
-        (used for the root api doc).
+    def setdefault(self, key, value):
+        with self._lock:
+            value = self._items.pop(key, value)
+            self._items[key] = value
+            while len(self._items) > self.size:
+                self._items.popitem(last=False)
+            return value
 
-        """
-        return {
-            'path': self.path,
-            'description': self.description,
-        }
 
-    def endpoint(self, path):
-        """Add an api URL for that resource.
+# Pre-encoded error bodies, keyed by status code and message.
+_error_bodies = {}
+_ERROR_BODIES_MAX_SIZE = 512
 
-        """
-        if path not in self.apis:
-            self.apis[path] = _EndPoint(self, path)
-        return self.apis[path]
+# Status messages missing from older webob versions.
+_STATUS_MESSAGES = {429: "Too Many Requests"}
 
-    def api_doc(self):
-        """Return the the api-doc of that resource (as a dict)
 
-        """
-        models = {}
-        for name in self.models:
-            schema = self.api._schemas[name]
-            if schema is None:
-                continue
-            models[name] = schema
+def _error_body(code, msg):
+    """Return the json encoded body of an error response.
 
-        return to_dict(
-            {
-                "apiVersion": str(self.api.version),
-                "swaggerVersion": self.api.swagger_version,
-                "basePath": self.api.base_path,
-                "resourcePath": self.path,
-                "apis": self.apis.values(),
-                "models": models
-            },
-            ctx=_Context(self, SWAGGER_DOC)
+    Encoded bodies are kept in a table to skip re-encoding; the table
+    stops growing when it's full (e.g. with messages including request
+    data).
+
+    """
+    if msg is None:
+        msg = _STATUS_MESSAGES.get(code) or (
+            webapp2.Response.http_status_message(code)
         )
+    key = (code, msg,)
+    body = _error_bodies.get(key)
+    if body is None:
+        body = default_codec.encode({"error": msg})
+        if len(_error_bodies) < _ERROR_BODIES_MAX_SIZE:
+            _error_bodies[key] = body
+    return body
 
 
-class _EndPoint(object):
-    """An Api URL and a collection of operation associated to that URL.
+def _body_too_large(request, limit):
+    """Check the request body is larger than `limit` bytes.
 
-    The path should be defined as a webapp2.Route URL pattern
-    (with `<` and `>` to delimite path variables).
+    The Content-Length header is checked without reading the body; a
+    body streamed without it (chunked encoding) is read up to the limit
+    and kept in the request.
 
     """
-    param_pattern = re.compile(r"<([^>:]+)(:[^>]+)?>")
+    length = request.content_length
+    if length is not None:
+        return length > limit
+    if not request.is_body_readable:
+        return False
+    body = request.body_file_raw.read(limit + 1)
+    if len(body) > limit:
+        return True
+    request.body = body
+    return False
 
-    def __init__(self, resource, path):
-        self.resource = weakref.proxy(resource)
-        self.path = path
-        self.swagger_path = self.param_pattern.sub(r"{\1}", path)
-        self.operations = []
-        self.handler = None
 
-    def bind(self, handler):
-        """Bind a request handler to an endpoint.
+# Prefixes of the headers set by App Engine infrastructure (stripped
+# from external requests), in WSGI environ form.
+_INFRASTRUCTURE_HEADERS = ('X_APPENGINE_', 'X_GOOGLE_',)
 
-        """
-        self.handler = handler
 
-    def operation(self, type_, alias, items=None, parameters=(), responses=()):
-        """Decoration to define metadata about an operation.
+def _infrastructure_header(name):
+    """Check a header name is reserved to App Engine infrastructure.
 
-        It will use the method name to know the operation http method
-        and method doc to define a summary.
+    """
+    return name.upper().replace('-', '_').startswith(
+        _INFRASTRUCTURE_HEADERS
+    )
 
-        TODO: use the remaining method documentation to define the
-        operation description attribute.
 
-        """
-        if items:
-            self.resource.add_model(items.name)
-        else:
-            self.resource.add_model(type_)
+# Compiled patterns of the schema definitions.
+_regexes = {}
 
-        for param in parameters:
-            if isinstance(param, Param):
-                self.resource.add_model(param.type)
 
-        def deco(meth):
-            self.operations.append(
-                Operation(
-                    method=meth.__name__.upper(),
-                    summary=meth.__doc__.strip().splitlines()[0],
-                    type_=type_,
-                    items=items,
-                    alias=alias,
-                    parameters=parameters,
-                    responses=responses
-                )
-            )
-            return meth
-        return deco
+def _regex(pattern):
+    """Return a compiled pattern.
 
-    def to_dict(self, ctx):
-        return {
-            "path": self.swagger_path,
-            "operations": self.operations
-        }
+    Unlike the `re` module cache, the cache isn't purged; patterns are
+    compiled when a schema is defined (see `_index_patterns`), and
+    then only looked up.
 
+    """
+    regex = _regexes.get(pattern)
+    if regex is None:
+        regex = _regexes[pattern] = re.compile(pattern)
+    return regex
 
-class Operation(object):
-    """Document a request handler.
 
-    - the `type_` argument should the name of a model.
-    - the `parameters` argument should be list of `Param` or `_Type`
-      instances.
-    - the `responses` argument should the a list `Message` the operation
-      might answer with.
+def _index_patterns(definition):
+    """Compile the patterns of a definition and of its inline objects,
+    and index each object pattern properties (`Object._patterns`).
 
     """
+    nodes = deque([definition])
+    while nodes:
+        node = nodes.pop()
+        if isinstance(node, Object):
+            patterns = node.pattern_properties or {}
+            node._patterns = tuple(
+                (pattern, _regex(pattern), schema,)
+                    for pattern, schema in patterns.iteritems()
+            )
+            if patterns:
+                # used to find additional properties
+                _regex('|'.join(patterns))
+        elif isinstance(node, String) and node.pattern is not None:
+            _regex(node.pattern)
+
+        if isinstance(node, _Type):
+            nodes.extend(
+                v for k, v in node.__dict__.iteritems() if k[0] != '_'
+            )
+        elif isinstance(node, dict):
+            nodes.extend(node.itervalues())
+        elif isinstance(node, (list, tuple,)):
+            nodes.extend(node)
 
-    def __init__(
-        self, method, summary, type_, alias, items=None, parameters=(), responses=()
-    ):
-        self.method = method
-        self.summary = summary
-        self.type = type_
-        self.items = items
-        self.alias = alias
-        self.parameters = parameters
-        self.responses = responses
 
-    def to_dict(self, ctx):
-        result = {
-            "method": self.method,
-            "summary": self.summary,
-            "type": self.type,
-            "nickname": self.alias,
-            "parameters": self.parameters,
-            "responseMessages": self.responses,
-        }
-        if self.items:
-            result["items"] = self.items
-        return result
+# loaded with jsonschema (see `_draft4_validator`)
+_Draft4Validator = None
 
 
-class MetaRequestHandler(type):
+def _draft4_validator():
+    """Return jsonschema Draft 4 validator class, extended to use the
+    compiled patterns.
+
+    """
+    global _Draft4Validator
+
+    if _Draft4Validator is None:
+        from jsonschema import Draft4Validator, ValidationError
+        from jsonschema._utils import extras_msg
+        from jsonschema.validators import extend
+
+        def find_additional_properties(instance, schema):
+            properties = schema.get("properties", {})
+            patterns = "|".join(schema.get("patternProperties", {}))
+            search = _regex(patterns).search if patterns else None
+            for property in instance:
+                if property not in properties:
+                    if search is not None and search(property):
+                        continue
+                    yield property
+
+        def additional_properties(validator, aP, instance, schema):
+            if not validator.is_type(instance, "object"):
+                return
+
+            extras = set(find_additional_properties(instance, schema))
+
+            if validator.is_type(aP, "object"):
+                for extra in extras:
+                    for error in validator.descend(
+                        instance[extra], aP, path=extra
+                    ):
+                        yield error
+            elif not aP and extras:
+                error = (
+                    "Additional properties are not allowed "
+                    "(%s %s unexpected)"
+                )
+                yield ValidationError(error % extras_msg(extras))
+
+        def pattern_properties(validator, patternProperties, instance, schema):
+            if not validator.is_type(instance, "object"):
+                return
+
+            for pattern, subschema in patternProperties.iteritems():
+                search = _regex(pattern).search
+                for k, v in instance.iteritems():
+                    if search(k):
+                        for error in validator.descend(
+                            v, subschema, path=k, schema_path=pattern
+                        ):
+                            yield error
+
+        def pattern(validator, patrn, instance, schema):
+            if (
+                validator.is_type(instance, "string") and
+                not _regex(patrn).search(instance)
+            ):
+                yield ValidationError(
+                    "%r does not match %r" % (instance, patrn)
+                )
+
+        _Draft4Validator = extend(Draft4Validator, {
+            "additionalProperties": additional_properties,
+            "patternProperties": pattern_properties,
+            "pattern": pattern,
+        })
+    return _Draft4Validator
+
+
+def _definition(interner, name, properties, additional_properties, kw):
+    """Build a schema definition (see `Api.schema`).
+
+    """
+    properties = {} if properties is None else properties
+    kw.setdefault('required', [])
+
+    for prop_name, prop in properties.iteritems():
+        if prop.required:
+            kw['required'].append(prop_name)
+        prop.required = None
+
+    # share the properties identical to other definitions'.
+    definition = Object(
+        id=name,
+        properties=interner.intern(dict(properties)),
+        additional_properties=additional_properties,
+        **kw
+    )
+    _index_patterns(definition)
+    return definition
+
+
+def _schema_refs(schema):
+    """Return the names of the schemas a definition references,
+    including the ones referenced by its inline objects.
+
+    """
+    refs = set()
+    nodes = deque([schema])
+    while nodes:
+        node = nodes.pop()
+        if isinstance(node, _Ref):
+            refs.add(node.name)
+        elif isinstance(node, _Type):
+            nodes.extend(node.__dict__.itervalues())
+        elif isinstance(node, dict):
+            nodes.extend(node.itervalues())
+        elif isinstance(node, (list, tuple,)):
+            nodes.extend(node)
+    return refs
+
+
+def _model_refs(schema):
+    """Return the names of the schemas a definition properties, or
+    their items, reference (the models a swagger api-doc requires).
+
+    """
+    refs = []
+    pp = schema._patterns or ()
+    for prop in chain(
+        schema.properties.itervalues(), (s for _, _, s in pp)
+    ):
+        if isinstance(prop, _Ref):
+            refs.append(prop.name)
+            continue
+
+        if not isinstance(prop, Array):
+            continue
+
+        if isinstance(prop.items, _Ref):
+            refs.append(prop.items.name)
+            continue
+    return refs
+
+
+def _closure(schemas, name, refs):
+    """Return the names of the schemas reachable from a schema, using
+    `refs` to find the schemas a definition references.
+
+    """
+    names = set()
+    to_check = deque([name])
+    while to_check:
+        name = to_check.pop()
+        if name in names:
+            continue
+        names.add(name)
+        schema = schemas.get(name)
+        if schema is not None:
+            to_check.extend(refs(schema))
+    return frozenset(names)
+
+
+class SchemaRegistry(object):
+    """Schema definitions shared by several apis (e.g. by the versions
+    of an api).
+
+    An api created with a registry (`Api(..., registry=registry)`) uses
+    the registry definitions, unless it overrides them with
+    `Api.schema`. The definitions it doesn't override are shared, and
+    so are their rendering in the resource api-docs and, once the apis
+    are frozen, their validators.
+
+    The registry is frozen with the first of its apis.
+
+    """
+
+    def __init__(self):
+        self.frozen = False
+        self._lock = threading.RLock()
+        self._schemas = {}
+        self._interner = _Interner()
+        self._apis = weakref.WeakSet()
+        # swagger doc rendering of the definitions
+        self._doc_memo = {}
+        self._validators = {}
+        self._compiled = {}
+        self._closures = {}
+
+    def schema(self, name, properties=None, additional_properties=False, **kw):
+        """Create a new schema definition shared by the registry apis
+        (see `Api.schema`).
+
+        """
+        with self._lock:
+            self._check_not_frozen()
+            replaced = self._schemas.get(name) is not None
+            definition = _definition(
+                self._interner, name, properties, additional_properties, kw
+            )
+            schemas = dict(self._schemas)
+            schemas[name] = definition
+            self._schemas = schemas
+            self._doc_memo = {}
+            self._validators = {}
+            self._compiled = {}
+            self._closures = {}
+            apis = list(self._apis)
+        self._notify(apis, name)
+        if replaced:
+            self._interner.prune(self._definitions)
+
+    def ref(self, name, required=False):
+        """Return an object with "$ref" attribute (see `Api.ref`).
+
+        """
+        if name not in self._schemas:
+            with self._lock:
+                self._check_not_frozen()
+                schemas = dict(self._schemas)
+                schemas.setdefault(name, None)
+                self._schemas = schemas
+                apis = list(self._apis)
+            self._notify(apis, name)
+        return _Ref(name, required=required)
+
+    def _notify(self, apis, name):
+        """Update the apis with a (re)defined schema.
+
+        It's called without holding the registry lock: the apis take
+        their own lock, and may then request the registry's.
+
+        """
+        for api in apis:
+            api._registry_updated(name)
+
+    def _closure(self, name, refs):
+        key = (name, refs,)
+        closure = self._closures.get(key)
+        if closure is None:
+            closure = self._closures[key] = _closure(
+                self._schemas, name, refs
+            )
+        return closure
+
+    def _definitions(self):
+        """Return the definitions of the registry and of its apis
+        (which share its interner).
+
+        """
+        with self._lock:
+            definitions = self._schemas.values()
+            for api in self._apis:
+                definitions.extend(api._schemas.itervalues())
+        return definitions
+
+    def _add_api(self, api):
+        # a frozen registry won't update its apis
+        with self._lock:
+            if not self.frozen:
+                self._apis.add(api)
+
+    def _freeze(self):
+        with self._lock:
+            if not self.frozen:
+                self._schemas = _FrozenDict(self._schemas)
+                self.frozen = True
+
+    def _check_not_frozen(self):
+        if self.frozen:
+            raise RuntimeError(
+                "The schema registry is frozen "
+                "(Api.routes() was called on one of its apis)."
+            )
+
+
+class Api(object):
+    """Decorator (decorator builder) for webapp2 request handler.
+
+    Generate routes, schemas and the swagger api doc of an api.
+
+    """
+
+    # api doc `swaggerVersion` attribute
+    swagger_version = '1.2'
+
+    def __init__(
+        self,
+        host,
+        path,
+        version,
+        codec=None,
+        codecs=(),
+        hoist_inline=False,
+        registry=None,
+        lazy_docs=False,
+        max_body_bytes=None
+    ):
+        """Api constructor.
+
+        `host`: used for the schema URI.
+        `path`: used a prefix for the route.
+        `version`: used for the api doc `apiVersion` attribute
+        `codec`: json encoder/decoder (default to `default_codec`).
+        `codecs`: extra encoders/decoders (e.g. `MsgPackCodec`)
+        request handlers can negotiate with the client.
+        `hoist_inline`: if set, inline objects repeated in the served
+        json-schema document are replaced by references to a shared
+        definition (named `Inline<hash>`).
+        `registry`: `SchemaRegistry` with the schema definitions shared
+        with other apis.
+        `lazy_docs`: if set, the resource api-docs are rendered on their
+        first request instead of when the api is frozen, and only the
+        `max_cached_docs` most recently requested ones are kept.
+        `max_body_bytes`: default maximum size of the operations request
+        body (see `_EndPoint.operation`) and of batch requests.
+
+
+        """
+        if path[0] != '/':
+            raise ValueError('path cannot be relative')
+        self.host = host.rstrip('/')
+        self.path = path.rstrip('/')
+        self.version = version
+        self.codec = default_codec if codec is None else codec
+        self.codecs = [self.codec] + list(codecs)
+        self.media_types = [c.content_type for c in self.codecs]
+        self.resources = {}
+        self.frozen = False
+        self._lock = threading.RLock()
+        self._schemas = {}
+        self._docs = None
+        self._gzipped = {}
+        self._resolver = None
+        # rendered definitions, by output, and json-schema document of
+        # an api not frozen yet (see `Api._schema_changed`).
+        self._fragments = {JSON_SCHEMA: {}, SWAGGER_DOC: {}}
+        self._schemas_doc = None
+        self._root_doc = None
+        self.lazy_docs = lazy_docs
+        self._resource_docs = None
+        self.max_body_bytes = max_body_bytes
+        self._clear_caches()
+        self.hoist_inline = hoist_inline
+        self.registry = registry
+        # names of the registry definitions overridden by the api
+        self._overrides = set()
+        if registry is None:
+            self._interner = _Interner()
+        else:
+            self._interner = registry._interner
+            with registry._lock:
+                registry._add_api(self)
+                self._schemas = dict(registry._schemas)
+
+    @property
+    def base_path(self):
+        return ''.join([self.host, self.path])
+
+    @property
+    def schema_path(self):
+        return "%s/json-schemas" % self.base_path
+
+    def freeze(self):
+        """Freeze the api registry.
+
+        The schemas, resources, endpoints and operations cannot be
+        modified afterward and the documents are pre-rendered, so that
+        requests can read them concurrently without locks or copies.
+
+        It's called by `Api.routes()`.
+
+        """
+        self._freeze()
+
+    def _freeze(self, snapshot=None, lazy=False):
+        # the registry lock can be requested while holding an api lock,
+        # never the reverse (see `SchemaRegistry._notify`).
+        if self.registry is not None:
+            self.registry._freeze()
+
+        with self._lock:
+            if self.frozen:
+                return
+
+            # models rendered once and shared by the resource api-docs
+            # (and by the other apis of the registry).
+            memo = self._registry_memo()
+            lazy = lazy or self.lazy_docs
+
+            self._schemas = _FrozenDict(self._schemas)
+            self.resources = _FrozenDict(self.resources)
+            self._resource_docs = _LRUCache(self.max_cached_docs)
+            for path, resource in self.resources.iteritems():
+                if snapshot is None:
+                    resource.freeze(memo=memo, lazy=lazy)
+                else:
+                    resource.freeze(snapshot['resources'][path], lazy=lazy)
+
+            if snapshot is None:
+                docs = {
+                    'api_doc': self.api_doc(),
+                    'schemas': self.schemas(),
+                }
+                docs['api_doc_body'] = self._encode_doc(docs['api_doc'])
+                docs['schemas_body'] = self._encode_doc(
+                    self._served_schemas()
+                )
+            else:
+                docs = snapshot['docs']
+            self._docs = docs
+            self._fragments = {JSON_SCHEMA: {}, SWAGGER_DOC: {}}
+            self._schemas_doc = None
+            self._root_doc = None
+            self._interner = None
+            self.frozen = True
+        self._update_registry_memo(memo)
+
+    def _registry_memo(self):
+        if self.registry is None:
+            return {}
+        return dict(self.registry._doc_memo)
+
+    def _update_registry_memo(self, memo):
+        if self.registry is None:
+            return
+        with self.registry._lock:
+            for definition in self.registry._schemas.itervalues():
+                rendered = memo.get(id(definition))
+                if rendered is not None:
+                    self.registry._doc_memo.setdefault(
+                        id(definition), rendered
+                    )
+
+    def fingerprint(self):
+        """Hash of the api definitions.
+
+        """
+        sha = hashlib.sha1()
+        memo = {}
+        _hash_value(
+            sha,
+            [
+                self.base_path,
+                self.version,
+                self.swagger_version,
+                self.media_types,
+                self.hoist_inline,
+                self.codec.name,
+                self._schemas,
+            ],
+            memo
+        )
+        for path in sorted(self.resources):
+            resource = self.resources[path]
+            _hash_value(sha, [path, resource.description], memo)
+            for endpoint_path in sorted(resource.apis):
+                _hash_value(sha, endpoint_path, memo)
+                for op in resource.apis[endpoint_path].operations:
+                    _hash_value(sha, op.to_dict(None), memo)
+        return sha.hexdigest()
+
+    def snapshot(self, fingerprint=None):
+        """Export the frozen state of the api: rendered documents,
+        resource models and routes.
+
+        It freezes the api. The snapshot can be loaded by an api
+        with the same definitions (see `Api.load_snapshot`) and the same
+        version of Python.
+
+        """
+        self.freeze()
+        # only the encoded documents are exported; they are decoded when
+        # requested (see `Api._frozen_doc` and `_Resource.api_doc`).
+        docs = {
+            'api_doc_body': self._docs['api_doc_body'],
+            'schemas_body': self._docs['schemas_body'],
+        }
+        if self.hoist_inline:
+            # the served document isn't the one validators compile from
+            docs['schemas_source'] = self.codec.encode(self.schemas())
+        return zlib.compress(marshal.dumps({
+            'format': SNAPSHOT_FORMAT,
+            'fingerprint': fingerprint or self.fingerprint(),
+            'docs': docs,
+            'routes': self._route_table(),
+            'resources': dict(
+                (
+                    path,
+                    {
+                        'models': sorted(r.models),
+                        'api_doc_body': (
+                            None if self.lazy_docs else r._body()
+                        ),
+                    },
+                )
+                    for path, r in self.resources.iteritems()
+            ),
+        }))
+
+    def load_snapshot(self, data, fingerprint=None):
+        """Freeze the api using a snapshot of its frozen state instead
+        of rendering its documents.
+
+        The snapshot is ignored if it was made with different api
+        definitions; `fingerprint` defaults to `Api.fingerprint()`
+        but it could be set to a cheaper value identifying the
+        source (e.g. the application version id).
+
+        Return True if the snapshot was loaded.
+
+        """
+        try:
+            snapshot = marshal.loads(zlib.decompress(data))
+        except (zlib.error, EOFError, ValueError, TypeError):
+            return False
+        if (
+            not isinstance(snapshot, dict)
+            or snapshot.get('format') != SNAPSHOT_FORMAT
+        ):
+            return False
+
+        with self._lock:
+            if self.frozen:
+                return False
+            if fingerprint is None:
+                fingerprint = self.fingerprint()
+            if (
+                snapshot['fingerprint'] != fingerprint
+                or snapshot['routes'] != self._route_table()
+                or set(snapshot['resources']) != set(self.resources)
+            ):
+                return False
+            self._freeze(snapshot)
+        return True
+
+    def _route_table(self):
+        return sorted(
+            (r.path, e.path)
+                for r in self.resources.itervalues()
+                for e in r.apis.itervalues()
+        )
+
+    def _check_not_frozen(self):
+        if self.frozen:
+            raise RuntimeError(
+                "The api registry is frozen (Api.routes() was called)."
+            )
+
+    def api_doc(self):
+        """Generate the api doc (as a dict).
+
+        It generate a route documentation listing all the resources.
+
+        Once the api is frozen, it returns the same pre-rendered
+        document; it shouldn't be modified. Before, the document is
+        kept until a resource is added.
+
+        """
+        if self.frozen:
+            return self._frozen_doc('api_doc')
+
+        doc = self._root_doc
+        if doc is None:
+            doc = self._root_doc = {
+                "apiVersion": self.version,
+                "swaggerVersion": self.swagger_version,
+                "apis": sorted(
+                    [r.summary() for r in self.resources.values()],
+                    key=operator.itemgetter('path')
+                ),
+            }
+        return doc
+
+    def _encode_doc(self, data):
+        return self.codec.encode(data, pretty=True)
+
+    def _frozen_doc(self, name):
+        """Return a frozen document (`api_doc` or `schemas`), decoded
+        from its body if the api was loaded from a snapshot.
+
+        """
+        doc = self._docs.get(name)
+        if doc is None:
+            body = self._docs.get('%s_source' % name)
+            if body is None:
+                body = self._docs['%s_body' % name]
+            doc = self._docs.setdefault(name, self.codec.decode(body))
+        return doc
+
+    def _json_handler(self, data, status=200, body=None):
+        if body is None:
+            body = self._encode_doc(data)
+        resp = webapp2.Response(body)
+        resp.headers['Content-Type'] = self.codec.content_type
+        resp.status = status
+        return resp
+
+    def _doc_response(self, request, body, gzipped=None):
+        """Response for a pre-encoded document, gzipped if the client
+        accepts it.
+
+        """
+        if 'gzip' not in request.accept_encoding:
+            resp = self._json_handler(None, body=body)
+        else:
+            if gzipped is None:
+                gzipped = self._gzip(body)
+            resp = self._json_handler(None, body=gzipped)
+            resp.headers['Content-Encoding'] = 'gzip'
+        resp.headers['Vary'] = 'Accept-Encoding'
+        return resp
+
+    def _gzip(self, body):
+        gzipped = self._gzipped.get(body)
+        if gzipped is None:
+            gzipped = self._gzipped[body] = _gzip(body)
+        return gzipped
+
+    def schema_handler(self, request):
+        """http handler for the schema request.
+
+        """
+        if self.frozen:
+            return self._doc_response(request, self._docs['schemas_body'])
+        return self._json_handler(self._served_schemas())
+
+    def api_doc_handler(self, request):
+        """http handler for the route api-doc request.
+
+        """
+        if self.frozen:
+            return self._doc_response(request, self._docs['api_doc_body'])
+        return self._json_handler(self.api_doc())
+
+    def apis_handler(self, request, path):
+        """http handler for a resource api-doc request.
+
+        """
+        resource = self.resources.get('/%s' % path, None)
+        if resource is None:
+            return self._json_handler({'error': 'resource not found'}, 404)
+
+        if resource.frozen:
+            if resource.api_doc_body is not None:
+                return self._doc_response(request, resource.api_doc_body)
+            _, body, gzipped = resource._lazy_doc()
+            return self._doc_response(request, body, gzipped)
+        return self._json_handler(resource.api_doc())
+
+    # maximum number of resource api-docs kept with `lazy_docs`
+    max_cached_docs = 32
+
+    # maximum number of requests in a batch
+    max_batch_size = 20
+
+    # number of threads running the GET requests of a batch
+    batch_workers = 1
+
+    def batch_handler(self, request):
+        """http handler for a batch of api requests.
+
+        The request body should be a list of requests, each
+        with a `path` (relative to the api path), a `method`
+        (default to GET) and optionally a json `body` and `headers`.
+
+        The requests are dispatched in order through the application
+        router (without going through WSGI again); consecutive GET
+        requests can run concurrently (see `batch_workers`). It
+        responds with the list of responses, each with a `status`
+        and a `body`.
+
+        """
+        if (
+            self.max_body_bytes is not None
+            and _body_too_large(request, self.max_body_bytes)
+        ):
+            return self._json_handler(None, 413, _error_body(413, None))
+
+        try:
+            batch = self.codec.decode(request.body)
+        except ValueError:
+            return self._json_handler({'error': 'Invalid json body'}, 400)
+        if not isinstance(batch, list) or not batch:
+            return self._json_handler(
+                {'error': 'The batch should be a list of requests'}, 400
+            )
+        if len(batch) > self.max_batch_size:
+            return self._json_handler(
+                {
+                    'error': 'Batches are limited to %d requests' % (
+                        self.max_batch_size,
+                    )
+                },
+                400
+            )
+
+        try:
+            sub_requests = [self._sub_request(request, r) for r in batch]
+        except ValueError, e:
+            return self._json_handler({'error': str(e)}, 400)
+
+        app = request.app
+        responses = [None] * len(sub_requests)
+        start = 0
+        while start < len(sub_requests):
+            end = start + 1
+            if (
+                self.batch_workers > 1
+                and sub_requests[start].method == 'GET'
+            ):
+                while (
+                    end < len(sub_requests)
+                    and sub_requests[end].method == 'GET'
+                ):
+                    end += 1
+            if end - start > 1:
+                self._dispatch_concurrently(
+                    app, sub_requests, responses, start, end
+                )
+            else:
+                responses[start] = self._dispatch(
+                    app, sub_requests[start], request
+                )
+            start = end
+
+        resp = webapp2.Response(
+            '[%s]' % ', '.join(self._batch_entry(r) for r in responses)
+        )
+        resp.headers['Content-Type'] = self.codec.content_type
+        return resp
+
+    def _sub_request(self, request, data):
+        if not isinstance(data, dict) or not data.get('path'):
+            raise ValueError("Each request of the batch requires a path")
+
+        path = '%s/%s' % (self.path, data['path'].lstrip('/'),)
+        if path.split('?')[0] == '%s/batch' % self.path:
+            raise ValueError("Batch requests cannot be nested")
+
+        headers = data.get('headers') or {}
+        if not isinstance(headers, dict):
+            raise ValueError("The request headers should be an object")
+        # infrastructure headers can't be trusted in a request body
+        headers = dict(
+            (k, v,) for k, v in headers.iteritems()
+                if not _infrastructure_header(k)
+        )
+
+        environ = dict(
+            (k, v,)
+                for k, v in request.environ.iteritems()
+                if (
+                    k.startswith('HTTP_')
+                    and not _infrastructure_header(k[len('HTTP_'):])
+                ) or k == 'REMOTE_ADDR'
+        )
+        environ.pop('HTTP_CONTENT_LENGTH', None)
+        environ.pop('HTTP_CONTENT_TYPE', None)
+        environ['HTTP_ACCEPT'] = self.codec.content_type
+
+        sub = webapp2.Request.blank(
+            path,
+            environ=environ,
+            headers=headers,
+            method=data.get('method', 'GET').upper()
+        )
+        if data.get('body') is not None:
+            sub.body = self.codec.encode(data['body'])
+            sub.content_type = self.codec.content_type
+        sub.app = request.app
+        return sub
+
+    def _dispatch(self, app, request, parent=None):
+        """Dispatch a sub-request, setting it as the active request
+        (see `webapp2.get_request`); the `parent` request is restored
+        afterward, or the globals cleared in a worker thread.
+
+        """
+        app.set_globals(app=app, request=request)
+        response = app.response_class()
+        try:
+            rv = app.router.dispatch(request, response)
+            if rv is not None:
+                response = rv
+        except webapp2.HTTPException, e:
+            response = self._error_response(e.code, e.detail)
+        except Exception:
+            logging.exception("Failed to dispatch a batch request")
+            response = self._error_response(500, None)
+        finally:
+            if parent is not None:
+                app.set_globals(app=app, request=parent)
+            else:
+                app.clear_globals()
+        return response
+
+    def _dispatch_concurrently(self, app, requests, responses, start, end):
+        indexes = iter(range(start, end))
+        lock = threading.Lock()
+
+        def work():
+            while True:
+                with lock:
+                    i = next(indexes, None)
+                if i is None:
+                    return
+                responses[i] = self._dispatch(app, requests[i])
+
+        workers = [
+            threading.Thread(target=work)
+                for _ in range(min(self.batch_workers, end - start))
+        ]
+        for worker in workers:
+            worker.start()
+        for worker in workers:
+            worker.join()
+
+    def _error_response(self, code, msg):
+        resp = webapp2.Response(_error_body(code, msg))
+        resp.headers['Content-Type'] = default_codec.content_type
+        resp.status = code
+        return resp
+
+    def _batch_entry(self, response):
+        body = response.body
+        if not body:
+            body = 'null'
+        elif response.content_type != self.codec.content_type:
+            body = self.codec.encode(body)
+        return '{"status": %d, "body": %s}' % (response.status_int, body,)
+
+    def static_docs(self):
+        """Return the encoded api-doc, resource api-docs and schemas,
+        as a list of (path, body) tuples; the path is relative to the
+        api path (e.g. `/api-docs/students`).
+
+        It freezes the api registry.
+
+        """
+        self.freeze()
+        docs = [
+            ('/api-docs', self._docs['api_doc_body'],),
+            ('/json-schemas', self._docs['schemas_body'],),
+        ]
+        for path, resource in sorted(self.resources.iteritems()):
+            docs.append(('/api-docs%s' % path, resource._body(),))
+        return docs
+
+    def routes(self, batch=False, batch_workers=None, static_docs=None,
+               doc_routes=True, memory_report=False):
+        """Return a route collection for an api
+        (including the api-doc and schema).
+
+        It freezes the api registry (see `Api.freeze`):
+
+        - the request handler routes are define by the
+          `swagger.ApiRequestHandler.path` class attributes.
+        - the api-doc path `<api.path>/api-docs`
+        - the schema path `<api.path>/json-schemas/`
+        - the batch path `<api.path>/batch`, if `batch` is set
+          (see `Api.batch_handler`). `batch_workers` sets the number of
+          threads running a batch GET requests.
+        - the memory report path `<api.path>/_memory`, for
+          administrators, if `memory_report` is set
+          (see `Api.memory_report`).
+
+        The api-doc and schema routes serve the files built by
+        `webapp2ext.swagger.build` if `static_docs` is set to the build
+        directory. They are skipped if `doc_routes` is False (e.g. when
+        a static file handler serves them); in both cases, the resource
+        api-docs are not pre-rendered.
+
+        """
+        self._freeze(lazy=static_docs is not None or not doc_routes)
+
+        rel_routes = []
+        if static_docs is not None:
+            docs = _StaticDocs(
+                os.path.join(static_docs, self.path.lstrip('/'))
+            )
+        else:
+            docs = self
+        if doc_routes:
+            rel_routes.append(
+                webapp2.Route(
+                    '/api-docs', docs.api_doc_handler, methods=['GET']
+                )
+            )
+            rel_routes.append(
+                webapp2.Route(
+                    '/api-docs/<path:.+>', docs.apis_handler, methods=['GET']
+                )
+            )
+            rel_routes.append(
+                webapp2.Route(
+                    '/json-schemas', docs.schema_handler, methods=['GET']
+                )
+            )
+
+        if batch:
+            if batch_workers is not None:
+                self.batch_workers = batch_workers
+            rel_routes.append(
+                webapp2.Route('/batch', self.batch_handler, methods=['POST'])
+            )
+
+        if memory_report:
+            rel_routes.append(
+                webapp2.Route(
+                    '/_memory', self.memory_report_handler, methods=['GET']
+                )
+            )
+
+        for resource in self.resources.itervalues():
+            for api in resource.apis.itervalues():
+                rel_routes.append(_EndPointRoute(api))
+        prefix = routes.PathPrefixRoute(self.path, rel_routes)
+        # the prefix route collects its children on the first match,
+        # which isn't thread safe: concurrent first requests could see
+        # an empty route list.
+        list(prefix.get_match_children())
+        return prefix
+
+    def resource(self, path, desc=None):
+        """Define a new resource.
+
+        """
+        resource = self.resources.get(path)
+        if resource is not None:
+            return resource
+
+        with self._lock:
+            self._check_not_frozen()
+            resources = dict(self.resources)
+            resource = resources.setdefault(path, _Resource(self, path, desc))
+            self.resources = resources
+            self._root_doc = None
+        return resource
+
+    def schema(self, name, properties=None, additional_properties=False, **kw):
+        """Create a new schema definition.
+
+        The base schema can currently only be defined as objects
+        (swagger only define models as object).
+
+        With a registry, the definition overrides the registry one
+        for this api only.
+
+        """
+        with self._lock:
+            self._check_not_frozen()
+            previous = self._schemas.get(name)
+            definition = _definition(
+                self._interner, name, properties, additional_properties, kw
+            )
+            schemas = dict(self._schemas)
+            schemas[name] = definition
+            self._schemas = schemas
+            if previous is not None and name in self._overrides:
+                self._prune_interner()
+            self._overrides.add(name)
+            self._clear_caches()
+            self._schema_changed(name, previous)
+            self._update_resolver()
+
+    def _prune_interner(self):
+        if self.registry is None:
+            self._interner.prune(self._schemas.values)
+        else:
+            self._interner.prune(self.registry._definitions)
+
+    def _registry_updated(self, name):
+        # read the current definition: notifications of concurrent
+        # definitions may arrive out of order.
+        definition = self.registry._schemas.get(name)
+        with self._lock:
+            if self.frozen or name in self._overrides:
+                return
+            if definition is None and name in self._schemas:
+                return
+            previous = self._schemas.get(name)
+            schemas = dict(self._schemas)
+            schemas[name] = definition
+            self._schemas = schemas
+            self._clear_caches()
+            self._schema_changed(name, previous)
+            self._update_resolver()
+
+    def _clear_caches(self):
+        """Reset the caches depending on the schema definitions.
+
+        """
+        self._validators = {}
+        self._compiled = {}
+        self._closures = {}
+        self._model_classes = {}
+        self._loaders = {}
+        self._encoders = {}
+        self._projections = {}
+
+    def _schema_changed(self, name, previous):
+        """Invalidate the rendered documents depending on a (re)defined
+        schema: its rendered definitions, the json-schema document and
+        the api-doc of the resources requiring it (and their models, if
+        the schema references others than its `previous` definition).
+
+        The other definitions are not rendered again (see
+        `Api._fragment_memo`).
+
+        """
+        for fragments in self._fragments.itervalues():
+            fragments.pop(name, None)
+        self._schemas_doc = None
+        definition = self._schemas.get(name)
+        refs_changed = (
+            previous is None
+            or definition is None
+            or set(_model_refs(previous)) != set(_model_refs(definition))
+        )
+        for resource in self.resources.itervalues():
+            if name not in resource.models:
+                continue
+            if refs_changed:
+                resource._update_models()
+            else:
+                resource._invalidate()
+
+    def _fragment_memo(self, output):
+        """Return a rendering memo (see `_Context`) with the rendered
+        definitions still current.
+
+        """
+        memo = {}
+        schemas = self._schemas
+        for name, (definition, rendered) in (
+            self._fragments[output].iteritems()
+        ):
+            if schemas.get(name) is definition:
+                memo[id(definition)] = (definition, rendered,)
+        return memo
+
+    def _save_fragments(self, output, memo):
+        """Keep the definitions rendered with a memo.
+
+        """
+        fragments = self._fragments[output]
+        for name, definition in self._schemas.iteritems():
+            rendered = memo.get(id(definition))
+            if rendered is not None:
+                fragments[name] = rendered
+
+    def schemas(self):
+        """Json-schema for all complex type defined in an API.
+
+        Once the api is frozen, it returns the same pre-rendered
+        document; it shouldn't be modified. Before, the document is
+        kept until a schema is (re)defined and only the new definitions
+        are rendered again.
+
+        """
+        if self.frozen:
+            return self._frozen_doc('schemas')
+
+        with self._lock:
+            if self._schemas_doc is not None:
+                return self._schemas_doc
+
+            memo = self._fragment_memo(JSON_SCHEMA)
+            schemas = to_dict(
+                self._schemas_definitions(), ctx=_Context(self, memo=memo)
+            )
+            self._save_fragments(JSON_SCHEMA, memo)
+            self._schemas_doc = schemas
+            return schemas
+
+    def _schemas_definitions(self):
+        schemas = {
+            "id": "%s#" % self.schema_path,
+            "$schema": "http://json-schema.org/draft-04/schema#",
+        }
+        for s_id, s in self._schemas.iteritems():
+            if s is None:
+                continue
+            schemas[s_id] = s
+        return schemas
+
+    def _served_schemas(self):
+        """Json-schema document served by the api.
+
+        With `hoist_inline`, it's a new rendering of `Api.schemas` with
+        the repeated inline objects hoisted; validators, loaders and
+        encoders keep compiling from `Api.schemas`.
+
+        """
+        if not self.hoist_inline:
+            return self.schemas()
+        # hoisting modifies the rendered definitions
+        schemas = to_dict(self._schemas_definitions(), ctx=_Context(self))
+        _hoist_inline_objects(schemas, self.schema_path)
+        return schemas
+
+    def ref(self, name, required=False):
+        """Return an object with "$ref" attribute.
+
+        Suitable to be used in json schema document. Use Api.model if
+        the reference is to be used in swagger api document.
+
+        """
+        if name not in self._schemas:
+            with self._lock:
+                self._check_not_frozen()
+                schemas = dict(self._schemas)
+                schemas.setdefault(name, None)
+                self._schemas = schemas
+        return _Ref(name, required=required)
+
+    def _get_resolver(self):
+        """Return the json-schema reference resolver.
+
+        The resolver (and jsonschema) is only loaded on first use.
+
+        """
+        if self._resolver is None:
+            from jsonschema import RefResolver
+
+            with self._lock:
+                if self._resolver is None:
+                    self._resolver = RefResolver(
+                        self.schema_path, self.schemas(), store={}
+                    )
+        return self._resolver
+
+    def _update_resolver(self):
+        if self._resolver is not None:
+            self._resolver.store[self.schema_path] = self.schemas()
+
+    def validator(self, schema):
+        """Return the json-schema validator for a complex type.
+
+        Validators are cached until a schema is (re)defined. Once
+        frozen, apis sharing a registry share the validators of the
+        schemas whose references they don't override.
+
+        """
+        validator = self._validators.get(schema)
+        if validator is None:
+            shared = self._shares_validator(schema)
+            if shared:
+                validator = self.registry._validators.get(schema)
+            if validator is None:
+                resolver = self._get_resolver()
+                # absolute uri: the resolver scope is left pushed while
+                # the error of an other validation is referenced.
+                uri = '%s#/%s' % (self.schema_path, schema,)
+                with resolver.resolving(uri) as definition:
+                    validator = _draft4_validator()(
+                        definition, resolver=resolver
+                    )
+                if shared:
+                    validator = self.registry._validators.setdefault(
+                        schema, validator
+                    )
+            self._validators[schema] = validator
+        return validator
+
+    def _shares_validator(self, schema):
+        """Check a validator can be shared with the other apis of the
+        registry: the api is frozen and the schema and the ones it
+        references (recursively) are the registry definitions.
+
+        """
+        return self.frozen and self._shared_closure(
+            schema, _schema_refs
+        ) is not None
+
+    def _shared_closure(self, name, refs):
+        """Return the registry closure of a schema (see `_closure`) if
+        the api doesn't override any of its schemas, or None.
+
+        """
+        if self.registry is None or name not in self.registry._schemas:
+            return None
+        closure = self.registry._closure(name, refs)
+        if closure & self._overrides:
+            return None
+        return closure
+
+    def _closure(self, name, refs):
+        """Return the names of the schemas reachable from a schema
+        (see `_closure`).
+
+        Closures are cached until a schema is (re)defined, and shared
+        with the apis of the registry.
+
+        """
+        key = (name, refs,)
+        closure = self._closures.get(key)
+        if closure is None:
+            closure = self._shared_closure(name, refs)
+            if closure is None:
+                closure = _closure(self._schemas, name, refs)
+            self._closures[key] = closure
+        return closure
+
+    def compiled_validator(self, schema):
+        """Return a function validating data against a complex type
+        json-schema, generated from the schema definitions.
+
+        The generated functions inline the checks instead of
+        interpreting the schema on each call; they raise the same
+        `jsonschema.ValidationError` as `Api.validate` (invalid data
+        is validated again by the jsonschema validator to build the
+        error). Schemas using keywords the generator doesn't support
+        are validated by the jsonschema validator.
+
+        Like validators, they are cached until a schema is (re)defined
+        and shared by the frozen apis of a registry.
+
+        """
+        validate = self._compiled.get(schema)
+        if validate is None:
+            shared = self._shares_validator(schema)
+            if shared:
+                validate = self.registry._compiled.get(schema)
+            if validate is None:
+                validate = self._compile_validator(schema)
+                if shared:
+                    validate = self.registry._compiled.setdefault(
+                        schema, validate
+                    )
+            self._compiled[schema] = validate
+        return validate
+
+    def _compile_validator(self, schema):
+        validator = self.validator(schema)
+        try:
+            check = _ValidatorCompiler(
+                self.schemas(), self.schema_path
+            ).compile(schema)
+        except _Unsupported as e:
+            logging.debug(
+                "Cannot compile %s validator (%s unsupported).", schema, e
+            )
+            return validator.validate
+
+        def validate(data):
+            if not check(data):
+                validator.validate(data)
+
+        return validate
+
+    def model_class(self, schema):
+        """Return the model class of a complex type (see `Model`).
+
+        Classes are cached until a schema is (re)defined.
+
+        """
+        cls = self._model_classes.get(schema)
+        if cls is None:
+            definition = self.schemas().get(schema)
+            if not isinstance(definition, dict):
+                raise ValueError("No schema with that id (%s)." % schema)
+            cls = self._model_classes.setdefault(
+                schema, _model_class(schema, definition)
+            )
+        return cls
+
+    def load(self, schema, data):
+        """Validate decoded data against a complex type json-schema and
+        return it as a model object (see `Api.model_class`).
+
+        Validation and construction are done in a single pass by a
+        generated function (see `Api.compiled_validator`). Raise
+        `jsonschema.ValidationError` if the data is invalid.
+
+        """
+        return self._loader(schema)(data)
+
+    def _loader(self, schema):
+        loader = self._loaders.get(schema)
+        if loader is None:
+            loader = self._loaders.setdefault(
+                schema, self._compile_loader(schema)
+            )
+        return loader
+
+    def decode(self, schema, body, codec=None):
+        """Decode a request body (with the api codec by default) and load
+        it as a model object (see `Api.load`).
+
+        """
+        codec = self.codec if codec is None else codec
+        return self.load(schema, codec.decode(body))
+
+    def _compile_loader(self, schema):
+        validator = self.validator(schema)
+        schemas = self.schemas()
+        builders = []
+
+        def unchecked_build():
+            if not builders:
+                builders.append(_ValidatorCompiler(
+                    schemas, self.schema_path, self.model_class, checks=False
+                ).compile(schema, build=True))
+            return builders[0]
+
+        try:
+            build = _ValidatorCompiler(
+                schemas, self.schema_path, self.model_class
+            ).compile(schema, build=True)
+        except _Unsupported as e:
+            logging.debug(
+                "Cannot compile %s loader (%s unsupported).", schema, e
+            )
+
+            def load(data):
+                validator.validate(data)
+                return unchecked_build()(data)
+        else:
+            def load(data):
+                model = build(data)
+                if model is _invalid:
+                    validator.validate(data)
+                    model = unchecked_build()(data)
+                return model
+
+        return load
+
+    def encoder(self, schema, many=False):
+        """Return a function encoding objects as json with the properties
+        of a complex type (or a list of them, with `many` set).
+
+        The encoding is generated from the schema: keys are encoded
+        beforehand and values are encoded according to their type,
+        without converting the objects to dicts. Objects can be model
+        objects (see `Api.model_class`), dicts or any objects with the
+        properties as attributes (e.g. ndb entities); other keys and
+        attributes are not encoded. Properties set to None are skipped.
+
+        Encoders are cached until a schema is (re)defined.
+
+        """
+        encode = self._encoders.get((schema, many,))
+        if encode is None:
+            encode = self._encoders.get((schema, False,))
+            if encode is None:
+                codec = self.codec
+                if not isinstance(codec, JsonCodec):
+                    codec = default_codec
+                encode = self._encoders.setdefault(
+                    (schema, False,),
+                    _EncoderCompiler(
+                        self.schemas(), self.schema_path, self.model_class,
+                        codec
+                    ).compile(schema)
+                )
+            if many:
+                item_encoder = encode
+                encode = lambda data: '[%s]' % ','.join(
+                    [item_encoder(item) for item in data]
+                )
+                encode = self._encoders.setdefault((schema, many,), encode)
+        return encode
+
+    def validate(self, schema, data):
+        """Validate data against a complex type json-schema.
+
+        See `Api.compiled_validator` for a faster validation.
+
+        """
+        self.validator(schema).validate(data)
+
+    def warmup(self):
+        """Do the work lazily done by the first requests: freeze the
+        api (rendering the documents and building the indexes), load
+        jsonschema and the reference resolver, build every validator,
+        compiled validator, model class, loader and encoder, and
+        compress every document.
+
+        Return the duration of each step, in seconds.
+
+        """
+        timings = OrderedDict()
+
+        start = time.time()
+        self.freeze()
+        timings['freeze'] = time.time() - start
+
+        start = time.time()
+        self._get_resolver()
+        timings['resolver'] = time.time() - start
+
+        names = [n for n, s in self._schemas.iteritems() if s is not None]
+        for step, build in (
+            ('validators', self.validator,),
+            ('compiled validators', self.compiled_validator,),
+            ('model classes', self.model_class,),
+            ('loaders', self._loader,),
+            ('encoders', self.encoder,),
+        ):
+            start = time.time()
+            for name in names:
+                try:
+                    build(name)
+                except ValueError as e:
+                    # e.g. a reference to an undefined schema; the
+                    # requests using it will fail the same way.
+                    logging.warning("Cannot build %s %s: %s", name, step, e)
+            timings[step] = time.time() - start
+
+        start = time.time()
+        self._gzip(self._docs['api_doc_body'])
+        self._gzip(self._docs['schemas_body'])
+        for resource in self.resources.itervalues():
+            # lazy docs are compressed when rendered
+            if resource.api_doc_body is not None:
+                self._gzip(resource.api_doc_body)
+        timings['compression'] = time.time() - start
+
+        return timings
+
+    def memory_report(self):
+        """Count the api objects and estimate their memory size (in
+        bytes), by category:
+
+        - `schemas`: the schema definitions (`types` counts their
+          `_Type` instances);
+        - `documents`: the rendered and encoded documents;
+        - `operations`: the resources, endpoints and operations;
+        - `resolver`: the json-schema resolver store;
+        - `validators`: the cached validators, model classes, loaders,
+          encoders and projections.
+
+        Objects shared by several categories are counted in the first
+        one only. Sizes are estimated with `sys.getsizeof`, so they
+        don't include the memory allocator overhead.
+
+        """
+        seen = set()
+        report = OrderedDict()
+
+        definitions = [s for s in self._schemas.itervalues() if s]
+        size, count = _deep_size([self._schemas], seen)
+        report['schemas'] = {
+            'count': len(definitions), 'types': count, 'bytes': size,
+        }
+
+        resources = self.resources.values()
+        documents = [
+            self._docs, self._gzipped, self._fragments, self._schemas_doc,
+            self._root_doc,
+        ]
+        documents.extend((r._api_doc, r.api_doc_body,) for r in resources)
+        if self._resource_docs is not None:
+            documents.append(self._resource_docs._items)
+        size, _ = _deep_size(documents, seen)
+        count = 0
+        if self._docs is not None:
+            count += 2
+        count += sum(1 for r in resources if r.api_doc_body is not None)
+        if self._resource_docs is not None:
+            count += len(self._resource_docs)
+        report['documents'] = {'count': count, 'bytes': size}
+
+        endpoints = [e for r in resources for e in r.apis.itervalues()]
+        size, _ = _deep_size([self.resources], seen)
+        report['operations'] = {
+            'count': sum(len(e.operations) for e in endpoints),
+            'bytes': size,
+        }
+
+        resolver = self._resolver
+        size, _ = _deep_size([resolver], seen)
+        report['resolver'] = {
+            'count': len(resolver.store) if resolver is not None else 0,
+            'bytes': size,
+        }
+
+        caches = [
+            self._validators, self._compiled, self._model_classes,
+            self._loaders, self._encoders, self._projections,
+        ]
+        size, _ = _deep_size(caches, seen)
+        report['validators'] = {
+            'count': sum(len(c) for c in caches), 'bytes': size,
+        }
+
+        report['total'] = {
+            'bytes': sum(r['bytes'] for r in report.itervalues()),
+        }
+        return report
+
+    def memory_report_handler(self, request):
+        """http handler for the memory report (admin only).
+
+        """
+        from google.appengine.api import users
+
+        if not users.is_current_user_admin():
+            return self._json_handler({'error': 'Admin only'}, 403)
+        return self._json_handler(self.memory_report())
+
+    # maximum number of field projections to cache
+    max_projections = 256
+
+    def projection(self, type_, fields):
+        """Return a function selecting some fields of a model
+        (e.g. to support partial responses).
+
+        `fields` should be a comma separated list of property names;
+        nested properties of referenced models (directly or as array
+        items) are selected with a dot (e.g. `students.name`).
+
+        Raise a ValueError if a field is not a property of the model.
+
+        """
+        key = (type_, fields,)
+        func = self._projections.get(key)
+        if func is None:
+            func = _compile_projection(self._field_tree(type_, fields))
+            if len(self._projections) < self.max_projections:
+                self._projections[key] = func
+        return func
+
+    def _field_tree(self, type_, fields):
+        tree = {}
+        for field in fields.split(','):
+            field = field.strip()
+            if not field:
+                continue
+
+            # validate the whole path, even if a parent field is
+            # already selected.
+            names = field.split('.')
+            schema = self._schemas.get(type_)
+            for name in names:
+                schema = self._field_schema(schema, name, field)
+
+            node = tree
+            for name in names[:-1]:
+                child = node.setdefault(name, {})
+                if child is None:
+                    break
+                node = child
+            else:
+                node[names[-1]] = None
+
+        if not tree:
+            raise ValueError("No field selected.")
+        return tree
+
+    def _field_schema(self, schema, name, field):
+        prop = None
+        if schema is not None:
+            prop = schema.properties.get(name)
+        if prop is None:
+            raise ValueError("Unknown field (%s)." % field)
+
+        if isinstance(prop, Array):
+            prop = prop.items
+        if isinstance(prop, _Ref):
+            return self._schemas.get(prop.name)
+        if isinstance(prop, Object):
+            return prop
+
+
+def _compile_projection(tree):
+    """Build a function selecting the fields of an object (or of the
+    objects of a list) defined by a tree of property names.
+
+    """
+    fields = [
+        (name, None if sub is None else _compile_projection(sub),)
+            for name, sub in tree.iteritems()
+    ]
+
+    def project(data):
+        if isinstance(data, list):
+            return [project(i) for i in data]
+        if not isinstance(data, dict):
+            return data
+
+        result = {}
+        for name, sub in fields:
+            if name in data:
+                value = data[name]
+                result[name] = value if sub is None else sub(value)
+        return result
+
+    return project
+
+
+class _Unsupported(Exception):
+    """Raised when a json-schema keyword cannot be compiled.
+
+    """
+
+
+_missing = object()
+_invalid = object()
+
+
+class _ValidatorCompiler(object):
+    """Generate functions checking data against the definitions of a
+    json-schema document (see `Api.compiled_validator`).
+
+    The functions only return whether the data is valid; they follow
+    jsonschema Draft 4 validator rules for the keywords `Api.schema`
+    definitions use, and raise `_Unsupported` for the others.
+
+    It can also generate functions building the models of valid data
+    (see `Api.load`), returning `_invalid` for invalid data. With
+    `checks` unset, they don't check the data (which should be
+    validated beforehand) and ignore unsupported keywords.
+
+    """
+
+    _type_checks = {
+        "array": "isinstance(%s, list)",
+        "boolean": "isinstance(%s, bool)",
+        "integer": "(isinstance(%s, (int, long)) "
+            "and not isinstance(%s, bool))",
+        "null": "%s is None",
+        "number": "(isinstance(%s, _Number) and not isinstance(%s, bool))",
+        "object": "isinstance(%s, dict)",
+        "string": "isinstance(%s, basestring)",
+    }
+
+    # keywords only checked for some instance types.
+    _object_keywords = (
+        "required", "properties", "patternProperties", "additionalProperties",
+    )
+    _array_keywords = ("items", "uniqueItems",)
+    _number_keywords = ("minimum", "maximum", "multipleOf",)
+
+    def __init__(self, schemas, schema_path, model_class=None, checks=True):
+        from jsonschema import Draft4Validator
+        from jsonschema._utils import uniq
+        from jsonschema._validators import FLOAT_TOLERANCE
+
+        self.schemas = schemas
+        self.prefix = '%s#/' % schema_path
+        self.keywords = Draft4Validator.VALIDATORS
+        self.env = {
+            '_FLOAT_TOLERANCE': FLOAT_TOLERANCE,
+            '_invalid': _invalid,
+            '_missing': _missing,
+            '_Number': numbers.Number,
+            '_uniq': uniq,
+        }
+        self.model_class = model_class
+        self.checks = checks
+        self.lines = []
+        self.functions = {}
+        self.pending = deque()
+        self.consts = 0
+        self.vars = 0
+        # statement failing the function being generated
+        self.fail = 'return False'
+        # properties of the model being built, and their variable
+        self.fields = None
+
+    def compile(self, name, build=False):
+        """Return the function checking data against a definition (or
+        building its model).
+
+        """
+        func_name = self._function(name, build)
+        while self.pending:
+            self._define(*self.pending.popleft())
+        code = compile('\n'.join(self.lines), '<%s validator>' % name, 'exec')
+        exec code in self.env
+        return self.env[func_name]
+
+    def _function(self, name, build=False):
+        key = (name, build,)
+        func_name = self.functions.get(key)
+        if func_name is None:
+            if not isinstance(self.schemas.get(name), dict):
+                raise _Unsupported(name)
+            func_name = self.functions[key] = '%s_%d' % (
+                'build' if build else 'check', len(self.functions),
+            )
+            self.pending.append((name, func_name, build,))
+        return func_name
+
+    def _define(self, name, func_name, build):
+        schema = self.schemas[name]
+        self.lines.append('def %s(v):' % func_name)
+        if not build:
+            self.fail = 'return False'
+            self._check(schema, 'v', 1)
+            self.lines.append('    return True')
+            return
+
+        self.fail = 'return _invalid'
+        self.fields = {}
+        self._check(schema, 'v', 1, build=True)
+        cls = self.model_class(name)
+        args = [
+            '(None if %s is _missing else %s)' % (
+                self.fields[prop], self.fields[prop],
+            ) if prop in self.fields else 'None'
+                for prop in cls._names
+        ]
+        if cls._extra:
+            properties = self._const(frozenset(cls._names))
+            args.append(
+                'None if %s.issuperset(v) else dict((k, x) '
+                'for k, x in v.iteritems() if k not in %s)' % (
+                    properties, properties,
+                )
+            )
+        self.lines.append('    return %s(%s)' % (
+            self._const(cls), ', '.join(args),
+        ))
+        self.fields = None
+
+    def _const(self, value):
+        self.consts += 1
+        name = '_c%d' % self.consts
+        self.env[name] = value
+        return name
+
+    def _var(self):
+        self.vars += 1
+        return 'v%d' % self.vars
+
+    def _emit(self, depth, line):
+        if line.endswith(': return False'):
+            line = '%s: %s' % (line[:-len(': return False')], self.fail)
+        self.lines.append('%s%s' % ('    ' * depth, line))
+
+    def _builds(self, schema):
+        """Tell if the value of a schema is built (a model or a list
+        of models), instead of being kept as is.
+
+        """
+        if '$ref' in schema:
+            return True
+        items = schema.get('items')
+        return isinstance(items, dict) and self._builds(items)
+
+    def _check(self, schema, var, depth, build=False):
+        ref = schema.get('$ref')
+        if ref is not None:
+            if not ref.startswith(self.prefix):
+                raise _Unsupported('$ref')
+            name = ref[len(self.prefix):]
+            if build:
+                self._emit(depth, '%s = %s(%s)' % (
+                    var, self._function(name, True), var,
+                ))
+                self._emit(depth, 'if %s is _invalid: %s' % (var, self.fail))
+            elif self.checks:
+                self._emit(depth, 'if not %s(%s): return False' % (
+                    self._function(name), var,
+                ))
+            return
+
+        # keywords order doesn't matter to tell valid data; the type is
+        # checked first so other checks don't need to guard it.
+        keywords = [k for k in schema if k in self.keywords and k != 'type']
+        if not self.checks:
+            keywords = [k for k in keywords if k in ('properties', 'items',)]
+        type_ = schema.get('type')
+        if type_ is not None and self.checks:
+            self._check_type(schema, type_, var, depth)
+        groups = (
+            (self._object_keywords, ('object',), 'object',),
+            (self._array_keywords, ('array',), 'array',),
+            (self._number_keywords, ('number', 'integer',), 'number',),
+        )
+        for group, types, guard in groups:
+            group = [k for k in keywords if k in group]
+            if not group:
+                continue
+            keywords = [k for k in keywords if k not in group]
+            if type_ in types:
+                self._keywords(schema, group, var, depth, build)
+                continue
+            start = len(self.lines)
+            self._emit(depth, 'if %s:' % self._type_check(guard, var))
+            if not self._keywords(schema, group, var, depth + 1, build):
+                del self.lines[start:]
+        self._keywords(schema, keywords, var, depth, build)
+
+    def _keywords(self, schema, keywords, var, depth, build=False):
+        start = len(self.lines)
+        for keyword in keywords:
+            method = getattr(self, '_check_%s' % keyword, None)
+            if method is None:
+                raise _Unsupported(keyword)
+            if keyword in ('properties', 'items',):
+                method(schema, schema[keyword], var, depth, build)
+            else:
+                method(schema, schema[keyword], var, depth)
+        return len(self.lines) > start
+
+    def _type_check(self, type_, var):
+        check = self._type_checks.get(type_)
+        if check is None:
+            raise _Unsupported(type_)
+        return check.replace('%s', var)
+
+    def _check_type(self, schema, types, var, depth):
+        if not isinstance(types, list):
+            types = [types]
+        self._emit(depth, 'if not (%s): return False' % ' or '.join(
+            self._type_check(t, var) for t in types
+        ))
+
+    def _check_enum(self, schema, enums, var, depth):
+        self._emit(
+            depth, 'if %s not in %s: return False' % (var, self._const(enums))
+        )
+
+    def _check_format(self, schema, format, var, depth):
+        # validators are not created with a format checker.
+        pass
+
+    def _check_required(self, schema, required, var, depth):
+        if not isinstance(required, list):
+            raise _Unsupported('required')
+        if required:
+            self._emit(depth, 'if %s: return False' % ' or '.join(
+                '%r not in %s' % (name, var) for name in required
+            ))
+
+    def _check_properties(self, schema, properties, var, depth, build=False):
+        # only the properties of the built model are built
+        build = build and var == 'v' and self.fields is not None
+        for name, subschema in properties.iteritems():
+            start = len(self.lines)
+            value = self._var()
+            self._emit(depth, '%s = %s.get(%r, _missing)' % (value, var, name))
+            self._emit(depth, 'if %s is not _missing:' % value)
+            self._check(
+                subschema, value, depth + 1, build and self._builds(subschema)
+            )
+            if build:
+                self.fields[name] = value
+                if len(self.lines) == start + 2:
+                    del self.lines[start + 1:]
+            elif len(self.lines) == start + 2:
+                del self.lines[start:]
+
+    def _check_patternProperties(self, schema, patterns, var, depth):
+        for pattern, subschema in patterns.iteritems():
+            start = len(self.lines)
+            key, value = self._var(), self._var()
+            self._emit(depth, 'for %s, %s in %s.iteritems():' % (
+                key, value, var,
+            ))
+            self._emit(depth + 1, 'if %s.search(%s):' % (
+                self._const(_regex(pattern)), key,
+            ))
+            self._check(subschema, value, depth + 2)
+            if len(self.lines) == start + 2:
+                del self.lines[start:]
+
+    def _check_additionalProperties(self, schema, aP, var, depth):
+        if aP and not isinstance(aP, dict):
+            return
+
+        properties = self._const(frozenset(schema.get('properties', {})))
+        patterns = '|'.join(schema.get('patternProperties', {}))
+        if not patterns and not aP:
+            self._emit(depth, 'if not %s.issuperset(%s): return False' % (
+                properties, var,
+            ))
+            return
+
+        key, value = self._var(), self._var()
+        condition = '%s not in %s' % (key, properties,)
+        if patterns:
+            condition += ' and not %s.search(%s)' % (
+                self._const(_regex(patterns)), key,
+            )
+        self._emit(depth, 'for %s, %s in %s.iteritems():' % (key, value, var))
+        if not aP:
+            self._emit(depth + 1, 'if %s: return False' % condition)
+            return
+        start = len(self.lines)
+        self._emit(depth + 1, 'if %s:' % condition)
+        self._check(aP, value, depth + 2)
+        if len(self.lines) == start + 1:
+            del self.lines[start - 1:]
+
+    def _check_items(self, schema, items, var, depth, build=False):
+        if not isinstance(items, dict):
+            raise _Unsupported('items')
+        item = self._var()
+        if build:
+            built = self._var()
+            self._emit(depth, '%s = []' % built)
+            self._emit(depth, 'for %s in %s:' % (item, var))
+            self._check(items, item, depth + 1, True)
+            self._emit(depth + 1, '%s.append(%s)' % (built, item))
+            self._emit(depth, '%s = %s' % (var, built))
+            return
+        start = len(self.lines)
+        self._emit(depth, 'for %s in %s:' % (item, var))
+        self._check(items, item, depth + 1)
+        if len(self.lines) == start + 1:
+            del self.lines[start:]
+
+    def _check_pattern(self, schema, pattern, var, depth):
+        self._emit(
+            depth,
+            'if isinstance(%s, basestring) and not %s.search(%s): '
+            'return False' % (var, self._const(_regex(pattern)), var)
+        )
+
+    def _check_uniqueItems(self, schema, unique, var, depth):
+        if unique:
+            self._emit(depth, 'if not _uniq(%s): return False' % var)
+
+    def _check_minimum(self, schema, minimum, var, depth):
+        op = '<=' if schema.get('exclusiveMinimum', False) else '<'
+        self._emit(depth, 'if float(%s) %s %s: return False' % (
+            var, op, self._const(minimum),
+        ))
+
+    def _check_maximum(self, schema, maximum, var, depth):
+        op = '>=' if schema.get('exclusiveMaximum', False) else '>'
+        self._emit(depth, 'if float(%s) %s %s: return False' % (
+            var, op, self._const(maximum),
+        ))
+
+    def _check_multipleOf(self, schema, dB, var, depth):
+        dB = self._const(dB)
+        if not isinstance(self.env[dB], float):
+            self._emit(depth, 'if %s %% %s: return False' % (var, dB))
+            return
+        mod = self._var()
+        self._emit(depth, '%s = %s %% %s' % (mod, var, dB))
+        self._emit(
+            depth,
+            'if %s > _FLOAT_TOLERANCE and (%s - %s) > _FLOAT_TOLERANCE: '
+            'return False' % (mod, dB, mod)
+        )
+
+
+class Model(object):
+    """Base class of the model classes `Api.model_class` generates.
+
+    Model objects store the properties of their schema definition in
+    slots (missing properties are set to None); with additional or
+    pattern properties, the other properties are kept in a dict
+    (`_extra`, or None). Nested models are model objects too, but
+    inline objects are kept as dicts.
+
+    """
+    __slots__ = ()
+
+    # schema, property names and the matching attribute names
+    _schema = None
+    _names = ()
+    _fields = ()
+
+    # has additional properties
+    _extra = False
+
+    def __eq__(self, other):
+        return (
+            self.__class__ is other.__class__
+            and all(
+                getattr(self, f) == getattr(other, f) for f in self.__slots__
+            )
+        )
+
+    def __ne__(self, other):
+        return not self == other
+
+    def __repr__(self):
+        return '%s(%s)' % (self.__class__.__name__, ', '.join(
+            '%s=%r' % (f, getattr(self, f),) for f in self._fields
+        ))
+
+    def _asdict(self):
+        """Return the model as a dict (without the properties set to
+        None).
+
+        """
+        data = {}
+        if self._extra and self._extra_properties is not None:
+            data.update(self._extra_properties)
+        for name, f in zip(self._names, self._fields):
+            value = getattr(self, f)
+            if value is None:
+                continue
+            if isinstance(value, Model):
+                value = value._asdict()
+            elif isinstance(value, list):
+                value = [
+                    i._asdict() if isinstance(i, Model) else i for i in value
+                ]
+            data[name] = value
+        return data
+
+
+def _deep_size(roots, seen):
+    """Estimate the memory size of objects and of the objects they
+    reference, skipping the ones in `seen` (a set of ids, updated).
+
+    Return the size and the number of `_Type` instances found.
+
+    Modules, classes (except model classes), weak references and
+    module globals are not followed.
+
+    """
+    size = types_count = 0
+    nodes = list(roots)
+    while nodes:
+        node = nodes.pop()
+        if node is None or id(node) in seen:
+            continue
+        seen.add(id(node))
+        size += sys.getsizeof(node)
+
+        if isinstance(node, weakref.ProxyTypes):
+            continue
+        elif isinstance(node, dict):
+            nodes.extend(node.iterkeys())
+            nodes.extend(node.itervalues())
+        elif isinstance(node, (list, tuple, set, frozenset, deque,)):
+            nodes.extend(node)
+        elif isinstance(node, types.FunctionType):
+            nodes.append(node.func_code)
+            nodes.extend(node.func_defaults or ())
+            nodes.extend(c.cell_contents for c in node.func_closure or ())
+            # generated functions namespace
+            if '__name__' not in node.func_globals:
+                nodes.append(node.func_globals)
+        elif isinstance(node, types.CodeType):
+            nodes.append(node.co_code)
+            nodes.extend(node.co_consts)
+        elif isinstance(node, type):
+            if issubclass(node, Model) and node is not Model:
+                nodes.extend(vars(node).values())
+        elif isinstance(node, (types.ModuleType, types.MethodType,)):
+            continue
+        else:
+            if isinstance(node, _Type):
+                types_count += 1
+            if hasattr(node, '__dict__'):
+                nodes.append(node.__dict__)
+            for cls in type(node).__mro__:
+                for slot in getattr(cls, '__slots__', ()):
+                    nodes.append(getattr(node, slot, None))
+    return size, types_count
+
+
+def _plain(data):
+    """Convert model objects (or a list of them) to dicts.
+
+    """
+    if isinstance(data, Model):
+        return data._asdict()
+    if isinstance(data, list) and data and isinstance(data[0], Model):
+        return [i._asdict() for i in data]
+    return data
+
+
+class _EncoderCompiler(object):
+    """Generate functions encoding objects as json with the properties
+    of a definition (see `Api.encoder`).
+
+    The objects can be the definition model objects, dicts, or any
+    object with the properties as attributes (e.g. ndb entities).
+
+    """
+
+    # json encoding of a value of a known type, or None to use the
+    # codec.
+    _type_encoders = {
+        "string": "(_esc(%s) if isinstance(%s, basestring) else _value(%s))",
+        "integer": "(str(%s) if %s.__class__ is int else _value(%s))",
+        "number": (
+            "(repr(%s) if %s.__class__ is float and -_inf < %s < _inf "
+            "else str(%s) if %s.__class__ is int else _value(%s))"
+        ),
+        "boolean": (
+            "(('true' if %s else 'false') if %s.__class__ is bool "
+            "else _value(%s))"
+        ),
+    }
+
+    def __init__(self, schemas, schema_path, model_class, codec):
+        from json.encoder import encode_basestring_ascii
+
+        self.schemas = schemas
+        self.prefix = '%s#/' % schema_path
+        self.model_class = model_class
+        self.env = {
+            '_esc': encode_basestring_ascii,
+            '_inf': float('inf'),
+            '_value': lambda value: codec.encode(_plain(value)),
+        }
+        self.lines = []
+        self.functions = {}
+        self.pending = deque()
+        self.consts = 0
+        self.vars = 0
+
+    def compile(self, name):
+        """Return the function encoding an object with the properties
+        of a definition.
+
+        """
+        func_name = self._function(name)
+        while self.pending:
+            self._define(*self.pending.popleft())
+        code = compile('\n'.join(self.lines), '<%s encoder>' % name, 'exec')
+        exec code in self.env
+        return self.env[func_name]
+
+    def _function(self, name):
+        func_name = self.functions.get(name)
+        if func_name is None:
+            if not isinstance(self.schemas.get(name), dict):
+                raise ValueError("No schema with that id (%s)." % name)
+            func_name = self.functions[name] = 'encode_%d' % len(
+                self.functions
+            )
+            self.pending.append((name, func_name,))
+        return func_name
+
+    def _const(self, value):
+        self.consts += 1
+        name = '_c%d' % self.consts
+        self.env[name] = value
+        return name
+
+    def _var(self):
+        self.vars += 1
+        return 'v%d' % self.vars
+
+    def _define(self, name, func_name):
+        properties = self.schemas[name].get('properties', {})
+        cls = self.model_class(name)
+        attrs = dict(zip(cls._names, cls._fields))
+        # same (sorted) order as the model class properties
+        values = [(prop, self._var(),) for prop in cls._names]
+
+        lines = self.lines
+        lines.append('def %s(o):' % func_name)
+        lines.append('    if o.__class__ is %s:' % self._const(cls))
+        lines.extend(
+            '        %s = o.%s' % (var, attrs[prop],) for prop, var in values
+        )
+        lines.append('    elif isinstance(o, dict):')
+        lines.extend(
+            '        %s = o.get(%r)' % (var, prop,) for prop, var in values
+        )
+        lines.append('    else:')
+        lines.extend(
+            '        %s = getattr(o, %r, None)' % (var, prop,)
+                for prop, var in values
+        )
+        lines.append('    parts = []')
+        for prop, var in values:
+            # precomputed key fragment
+            key = self._const('%s:' % json.dumps(prop))
+            lines.append('    if %s is not None:' % var)
+            lines.append('        parts.append(%s + %s)' % (
+                key, self._value(properties[prop], var),
+            ))
+        if cls._extra:
+            lines.append(
+                '    if o.__class__ is %s and o._extra_properties:'
+                % self._const(cls)
+            )
+            lines.append(
+                '        parts.extend(_esc(k) + ":" + _value(x) '
+                'for k, x in o._extra_properties.iteritems())'
+            )
+        lines.append("    return '{%s}' % ','.join(parts)")
+
+    def _value(self, schema, var):
+        """Return the expression encoding the value of a property.
+
+        """
+        ref = schema.get('$ref')
+        if ref is not None and ref.startswith(self.prefix):
+            return '%s(%s)' % (self._function(ref[len(self.prefix):]), var)
+
+        type_ = schema.get('type')
+        items = schema.get('items')
+        if type_ == 'array' and isinstance(items, dict):
+            item = self._var()
+            return (
+                "('[%%s]' %% ','.join([%s for %s in %s]) "
+                "if isinstance(%s, (list, tuple)) else _value(%s))" % (
+                    self._value(items, item), item, var, var, var,
+                )
+            )
+
+        encoder = self._type_encoders.get(type_)
+        if encoder is None:
+            return '_value(%s)' % var
+        return encoder.replace('%s', var)
+
+
+def _attribute_name(name, taken):
+    attr = re.sub(r'\W', '_', name) or '_'
+    if attr[0].isdigit() or keyword.iskeyword(attr) or attr[0] == '_':
+        attr = 'p_%s' % attr
+    while attr in taken:
+        attr = '%s_' % attr
+    taken.add(attr)
+    return attr
+
+
+def _model_class(name, schema):
+    """Generate the model class of a rendered definition.
+
+    """
+    names = tuple(sorted(schema.get('properties', {})))
+    taken = set()
+    fields = tuple(str(_attribute_name(n, taken)) for n in names)
+    extra = (
+        schema.get('additionalProperties', True) is not False
+        or bool(schema.get('patternProperties'))
+    )
+    slots = fields + (('_extra_properties',) if extra else ())
+
+    source = ['def __init__(self, %s):' % ', '.join(
+        ['%s=None' % f for f in slots]
+    )]
+    source.extend('    self.%s = %s' % (f, f,) for f in slots)
+    source.append('    pass')
+    env = {}
+    exec compile('\n'.join(source), '<%s model>' % name, 'exec') in env
+
+    return type(str(_attribute_name(name, set())), (Model,), {
+        '__doc__': schema.get('description'),
+        '__slots__': slots,
+        '__init__': env['__init__'],
+        '_schema': name,
+        '_names': names,
+        '_fields': fields,
+        '_extra': extra,
+    })
+
+
+class _StaticDocs(object):
+    """Serve the documents built by `webapp2ext.swagger.build`.
+
+    `directory` should be the build directory of an api (the
+    build root directory joined with the api path). Documents are
+    served with their content hash as ETag, gzipped if the client
+    accepts it (with a `-gzip` suffixed ETag).
+
+    """
+
+    def __init__(self, directory):
+        self.directory = directory
+        with open(os.path.join(directory, MANIFEST)) as f:
+            self.manifest = json.load(f)
+
+    def api_doc_handler(self, request):
+        return self._serve(request, '/api-docs')
+
+    def apis_handler(self, request, path):
+        return self._serve(request, '/api-docs/%s' % path)
+
+    def schema_handler(self, request):
+        return self._serve(request, '/json-schemas')
+
+    def _serve(self, request, path):
+        entry = self.manifest.get(path)
+        if entry is None:
+            resp = webapp2.Response(_error_body(404, 'resource not found'))
+            resp.headers['Content-Type'] = "application/json"
+            resp.status = 404
+            return resp
+
+        resp = webapp2.Response()
+        resp.headers['Content-Type'] = "application/json"
+        resp.cache_control = 'public, max-age=600'
+        resp.headers['Vary'] = 'Accept-Encoding'
+
+        # each encoding is a different representation, with its own etag
+        gzipped = 'gzip' in request.accept_encoding
+        etag = '%s-gzip' % entry['hash'] if gzipped else entry['hash']
+        resp.etag = etag
+        if etag in request.if_none_match:
+            resp.status = 304
+            return resp
+
+        file_name = entry['file']
+        if gzipped:
+            file_name = entry['gzip']
+            resp.headers['Content-Encoding'] = 'gzip'
+        with open(os.path.join(self.directory, file_name), 'rb') as f:
+            resp.body = f.read()
+        return resp
+
+
+class _Resource(object):
+    """An api resource.
+
+    The path parameter defines the relative of the resource api-doc
+    (relative to `/api-doc`). It should match the root path
+    of a resource it doesn't need to.
+
+    """
+    def __init__(self, api, path, desc):
+        self.api = weakref.proxy(api)
+        self.path = path
+        self.description = desc
+        self.apis = {}
+        self.models = set()
+        # models added with `add_model`, before walking their references
+        self._types = frozenset()
+        self.frozen = False
+        self.api_doc_body = None
+        self._api_doc = None
+
+    def _invalidate(self):
+        """Discard the api-doc rendered before the resource is frozen.
+
+        """
+        self._api_doc = None
+
+    def _update_models(self):
+        """Walk the references of the added models again, after one of
+        the resource models was redefined.
+
+        """
+        models = set()
+        for type_ in self._types:
+            models.update(self.api._closure(type_, _model_refs))
+        self.models = models
+        self._invalidate()
+
+    def freeze(self, snapshot=None, memo=None, lazy=False):
+        """Freeze the resource endpoints and models and pre-render
+        its api-doc (see `Api.freeze`).
+
+        `memo` can be used to share the rendered models with other
+        resources. With `lazy` set, the api-doc is rendered when
+        requested instead (see `_Resource._lazy_doc`).
+
+        """
+        self.apis = _FrozenDict(self.apis)
+        for endpoint in self.apis.itervalues():
+            endpoint.freeze()
+        if snapshot is None:
+            self.models = frozenset(self.models)
+            if lazy:
+                self._api_doc = self.api_doc_body = None
+            else:
+                self._api_doc = self._render_api_doc(memo)
+                self.api_doc_body = self.api._encode_doc(self._api_doc)
+        else:
+            self.models = frozenset(snapshot['models'])
+            # decoded when requested
+            self._api_doc = None
+            self.api_doc_body = None if lazy else snapshot['api_doc_body']
+        self.frozen = True
+
+    def add_model(self, type_):
+        """Add a model to the resource api documentation.
+
+        It will walk the model to find nested complex type requirement.
+
+        """
+        if type_ in _primitives:
+            return
+        if type_ in self.models:
+            return
+        if type_ not in self.api._schemas:
+            raise ValueError("No schema with that id (%s)." % type_)
+
+        with self.api._lock:
+            self.api._check_not_frozen()
+            self._types = self._types.union([type_])
+            self.models = self.models.union(
+                self.api._closure(type_, _model_refs)
+            )
+            self._invalidate()
+
+    def summary(self):
+        """Api doc summary for that resource
+        (used for the root api doc).
+
+        """
+        return {
+            'path': self.path,
+            'description': self.description,
+        }
+
+    def endpoint(self, path):
+        """Add an api URL for that resource.
+
+        """
+        endpoint = self.apis.get(path)
+        if endpoint is not None:
+            return endpoint
+
+        with self.api._lock:
+            self.api._check_not_frozen()
+            apis = dict(self.apis)
+            endpoint = apis.setdefault(path, _EndPoint(self, path))
+            self.apis = apis
+            self._invalidate()
+        return endpoint
+
+    def api_doc(self):
+        """Return the the api-doc of that resource (as a dict)
+
+        Once the api is frozen, it returns the same pre-rendered
+        document; it shouldn't be modified. Before, the document is
+        kept until the resource or one of its models is (re)defined.
+
+        """
+        if self.frozen:
+            if self._api_doc is not None:
+                return self._api_doc
+            if self.api_doc_body is None:
+                return self._lazy_doc()[0]
+            # loaded from a snapshot
+            self._api_doc = self.api.codec.decode(self.api_doc_body)
+            return self._api_doc
+
+        api = self.api
+        with api._lock:
+            if self._api_doc is None:
+                memo = api._fragment_memo(SWAGGER_DOC)
+                self._api_doc = self._render_api_doc(memo)
+                api._save_fragments(SWAGGER_DOC, memo)
+            return self._api_doc
+
+    def _lazy_doc(self):
+        """Return the api-doc, its encoded and gzipped bodies, rendered
+        when first requested and kept in the api cache of recently
+        requested api-docs.
+
+        """
+        api = self.api
+        cache = api._resource_docs
+        doc = cache.get(self.path)
+        if doc is None:
+            api_doc = self._render_api_doc(api._registry_memo())
+            body = api._encode_doc(api_doc)
+            doc = cache.setdefault(self.path, (api_doc, body, _gzip(body),))
+        return doc
+
+    def _body(self):
+        """Return the encoded api-doc (once frozen).
+
+        """
+        if self.api_doc_body is None:
+            return self._lazy_doc()[1]
+        return self.api_doc_body
+
+    def _render_api_doc(self, memo=None):
+        models = {}
+        for name in self.models:
+            schema = self.api._schemas[name]
+            if schema is None:
+                continue
+            models[name] = schema
+
+        return to_dict(
+            {
+                "apiVersion": str(self.api.version),
+                "swaggerVersion": self.api.swagger_version,
+                "basePath": self.api.base_path,
+                "resourcePath": self.path,
+                "apis": self.apis.values(),
+                "models": models
+            },
+            ctx=_Context(self, SWAGGER_DOC, memo)
+        )
+
+
+class _EndPoint(object):
+    """An Api URL and a collection of operation associated to that URL.
+
+    The path should be defined as a webapp2.Route URL pattern
+    (with `<` and `>` to delimite path variables).
+
+    """
+    param_pattern = re.compile(r"<([^>:]+)(:[^>]+)?>")
+
+    def __init__(self, resource, path):
+        self.resource = weakref.proxy(resource)
+        self.path = path
+        self.swagger_path = self.param_pattern.sub(r"{\1}", path)
+        self.operations = []
+        self.handler = None
+        self._methods = {}
+
+    def bind(self, handler):
+        """Bind a request handler to an endpoint.
+
+        """
+        self.handler = handler
+
+    def freeze(self):
+        self.operations = tuple(self.operations)
+        self._methods = _FrozenDict(self._methods)
+
+    def get_operation(self, method):
+        """Return the operation documenting a http method (or None).
+
+        """
+        return self._methods.get(method.upper())
+
+    def operation(
+        self,
+        type_,
+        alias,
+        items=None,
+        parameters=(),
+        responses=(),
+        single_flight=False,
+        auth=None,
+        paginate=False,
+        max_limit=100,
+        max_body_bytes=None,
+        max_concurrent=None,
+        queue_timeout=0,
+        retry_after=1,
+        rate_limit=None
+    ):
+        """Decoration to define metadata about an operation.
+
+        It will use the method name to know the operation http method
+        and method doc to define a summary.
+
+        With `single_flight` set, concurrent GET requests with the same
+        key wait for the first one and share its response instead of
+        running the handler again. The key defaults to the request
+        path and query string, and the current user id for operations
+        with an `auth` requirement (requests of users without id don't
+        share flights); `single_flight` can also be a
+        callable taking the request handler and returning the key (e.g.
+        to add the current user id when the response depends on it).
+        The shared response `Set-Cookie` headers are not copied to the
+        waiting requests.
+
+        `auth` can be set to `AUTH_LOGIN` or `AUTH_ADMIN` to require
+        the user to be logged in (or to be an admin) before the request
+        is dispatched to the handler method.
+
+        With `paginate` set, the operation gets `limit` and `cursor`
+        query parameters; the handler method should respond with
+        `ApiRequestHandler.render_page`. `paginate` can be set to the
+        default page size (default to 20); `max_limit` is the maximum
+        page size a client can request.
+
+        Requests with a body larger than `max_body_bytes` (default to
+        the api `max_body_bytes`) are rejected with a 413 error before
+        the body is read (see `ApiRequestHandler.check_operation`).
+
+        With `max_concurrent` set, the operation handles at most that
+        many requests at a time (per instance); extra requests wait up
+        to `queue_timeout` seconds for one to end, and are then
+        rejected with a 503 error and a `Retry-After` header set to
+        `retry_after` seconds.
+
+        `rate_limit` can be set to a `RateLimit` to throttle clients
+        before the request is dispatched to the handler method; the
+        operations sharing a `RateLimit` share its limit.
+
+        TODO: use the remaining method documentation to define the
+        operation description attribute.
+
+        """
+        self.resource.api._check_not_frozen()
+        if auth not in (None, AUTH_LOGIN, AUTH_ADMIN,):
+            raise ValueError("Unknown auth requirement (%s)." % auth)
+
+        if items:
+            self.resource.add_model(items.name)
+        else:
+            self.resource.add_model(type_)
+
+        for param in parameters:
+            if isinstance(param, Param):
+                self.resource.add_model(param.type)
+
+        if paginate:
+            if paginate is True:
+                paginate = Operation.default_limit
+            parameters = list(parameters) + [
+                Int(
+                    name="limit",
+                    description="Maximum number of items to return",
+                    param_type="query",
+                    default=paginate,
+                    minimum=1,
+                    maximum=max_limit
+                ),
+                String(
+                    name="cursor",
+                    description="Cursor of the page to return",
+                    param_type="query"
+                ),
+            ]
+
+        def deco(meth):
+            op = Operation(
+                method=meth.__name__.upper(),
+                summary=meth.__doc__.strip().splitlines()[0],
+                type_=type_,
+                items=items,
+                alias=alias,
+                parameters=parameters,
+                responses=responses,
+                single_flight=single_flight,
+                auth=auth,
+                produces=self.resource.api.media_types,
+                paginate=paginate,
+                max_limit=max_limit,
+                max_body_bytes=max_body_bytes,
+                max_concurrent=max_concurrent,
+                queue_timeout=queue_timeout,
+                retry_after=retry_after,
+                rate_limit=rate_limit
+            )
+            with self.resource.api._lock:
+                self.resource.api._check_not_frozen()
+                methods = dict(self._methods)
+                methods[op.method] = op
+                self.operations = self.operations + [op]
+                self._methods = methods
+                self.resource._invalidate()
+            return meth
+        return deco
+
+    def to_dict(self, ctx):
+        return {
+            "path": self.swagger_path,
+            "operations": self.operations
+        }
+
+
+class _EndPointRoute(webapp2.Route):
+    """Route to an endpoint request handler.
+
+    Keep a reference to the endpoint so that the request handler can
+    find the operation it is dispatching to.
+
+    """
+
+    def __init__(self, endpoint):
+        super(_EndPointRoute, self).__init__(endpoint.path, endpoint.handler)
+        self.endpoint = endpoint
+
+
+class Operation(object):
+    """Document a request handler.
+
+    - the `type_` argument should the name of a model.
+    - the `parameters` argument should be list of `Param` or `_Type`
+      instances.
+    - the `responses` argument should the a list `Message` the operation
+      might answer with.
+
+    """
+
+    # default page size of paginated operations
+    default_limit = 20
+
+    def __init__(
+        self,
+        method,
+        summary,
+        type_,
+        alias,
+        items=None,
+        parameters=(),
+        responses=(),
+        single_flight=False,
+        auth=None,
+        produces=None,
+        paginate=False,
+        max_limit=100,
+        max_body_bytes=None,
+        max_concurrent=None,
+        queue_timeout=0,
+        retry_after=1,
+        rate_limit=None
+    ):
+        self.method = method
+        self.summary = summary
+        self.type = type_
+        self.items = items
+        self.alias = alias
+        self.parameters = parameters
+        self.responses = responses
+        self.single_flight = single_flight
+        self.flights = _SingleFlight() if single_flight else None
+        self.auth = auth
+        self.produces = produces
+        self.paginate = paginate
+        self.max_limit = max_limit
+        self.max_body_bytes = max_body_bytes
+        self.admission = None
+        if max_concurrent is not None:
+            self.admission = _Admission(max_concurrent, queue_timeout)
+        self.retry_after = str(retry_after)
+        self.rate_limit = rate_limit
+        self.error_bodies = dict(
+            (m.code, _error_body(m.code, m.message),)
+                for m in responses
+                if m.code >= 400
+        )
+
+    def flight_key(self, handler):
+        """Key identifying requests sharing a single flight, or None if
+        the request shouldn't share one.
+
+        """
+        if callable(self.single_flight):
+            key = self.single_flight(handler)
+        elif self.auth is not None:
+            user = handler.get_current_user()
+            user_id = user.user_id() if user else None
+            if not user_id:
+                return None
+            key = (user_id, handler.request.path_qs,)
+        else:
+            key = handler.request.path_qs
+        return (handler.codec.content_type, key,)
+
+    def to_dict(self, ctx):
+        result = {
+            "method": self.method,
+            "summary": self.summary,
+            "type": self.type,
+            "nickname": self.alias,
+            "parameters": self.parameters,
+            "responseMessages": self.responses,
+        }
+        if self.items:
+            result["items"] = self.items
+        if self.produces and len(self.produces) > 1:
+            result["produces"] = self.produces
+            result["consumes"] = self.produces
+        return result
+
+
+class _SingleFlight(object):
+    """Group of in-flight calls, indexed by key.
+
+    Only one call per key runs at a time; concurrent calls with the
+    same key wait for it and get its result. If it fails, they run
+    their own call.
+
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._calls = {}
+
+    def do(self, key, func):
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = self._calls[key] = _Call()
+
+        if not leader:
+            call.done.wait()
+            if call.failed:
+                return func()
+            return call.result
+
+        try:
+            call.result = func()
+        except:
+            call.failed = True
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            call.done.set()
+        return call.result
+
+
+class _Admission(object):
+    """Limit the number of concurrent calls.
+
+    Calls over the limit wait up to `timeout` seconds for a running
+    call to end; they're rejected afterward.
+
+    """
+
+    def __init__(self, limit, timeout=0):
+        self.limit = limit
+        self.timeout = timeout
+        self.running = 0
+        self._cond = threading.Condition(threading.Lock())
+
+    def acquire(self):
+        """Return True if the call can run (and should be followed by
+        `release`), or False if it should be rejected.
+
+        """
+        with self._cond:
+            if self.running >= self.limit and self.timeout:
+                deadline = time.time() + self.timeout
+                while self.running >= self.limit:
+                    remaining = deadline - time.time()
+                    if remaining <= 0:
+                        break
+                    self._cond.wait(remaining)
+            if self.running >= self.limit:
+                return False
+            self.running += 1
+            return True
+
+    def release(self):
+        with self._cond:
+            self.running -= 1
+            self._cond.notify()
+
+
+class RateLimit(object):
+    """Token bucket rate limit of one or more operations
+    (see `_EndPoint.operation`).
+
+    Each client gets a bucket of `burst` tokens (default to `rate`),
+    refilled at `rate` tokens per `period` seconds; a request takes a
+    token or is rejected with a 429 error while the bucket is empty.
+
+    Clients are identified by `key`: `RATE_BY_USER` (the current user
+    id), `RATE_BY_IP` (the request remote address), `RATE_BY_API_KEY`
+    (the `api_key_header` request header) or a callable taking the
+    request handler and returning the key. Requests without user or
+    api key are identified by their remote address.
+
+    `RATE_BY_API_KEY` requires `api_key_validator`, a callable
+    returning True for the known api keys: requests with an unknown
+    key are identified by their remote address, so that a client can't
+    get new buckets (and evict the other clients') by rotating keys.
+
+    Buckets are local to the instance; only the `max_keys` most recently
+    used are kept. With `sync_interval` set, the tokens taken are also
+    counted in memcache, in batches sent at most every `sync_interval`
+    seconds, and the tokens other instances took are removed from the
+    local buckets, so that the limit applies across instances (with a
+    `sync_interval` delay).
+
+    """
+
+    # memcache counters window, in seconds
+    sync_window = 60
+
+    def __init__(
+        self,
+        rate,
+        period=1,
+        burst=None,
+        key=RATE_BY_USER,
+        api_key_header='X-Api-Key',
+        api_key_validator=None,
+        sync_interval=None,
+        namespace='webapp2ext.swagger.rate',
+        max_keys=10000
+    ):
+        rate_keys = (RATE_BY_USER, RATE_BY_IP, RATE_BY_API_KEY,)
+        if not callable(key) and key not in rate_keys:
+            raise ValueError("Unknown rate limit key (%s)." % key)
+        if key == RATE_BY_API_KEY and api_key_validator is None:
+            raise ValueError(
+                "Rate limits by api key require an api key validator."
+            )
+        self.rate = float(rate) / period
+        self.burst = rate if burst is None else burst
+        self.key = key
+        self._prefix = 'key' if callable(key) else key
+        self.api_key_header = api_key_header
+        self.api_key_validator = api_key_validator
+        self.sync_interval = sync_interval
+        self.namespace = namespace
+        self.max_keys = max_keys
+        self._lock = threading.Lock()
+        # key -> [tokens, last refill time]
+        self._buckets = OrderedDict()
+        self._sync_lock = threading.Lock()
+        self._last_sync = 0
+        self._window = None
+        # key -> tokens taken since the last sync, by the instance in
+        # the current window and by the other instances.
+        self._pending = {}
+        self._taken = {}
+        self._others = {}
+
+    def client_key(self, handler):
+        """Return the key identifying the client of a request.
+
+        """
+        key = None
+        if callable(self.key):
+            key = self.key(handler)
+        elif self.key == RATE_BY_USER:
+            key = handler.get_current_user_id()
+        elif self.key == RATE_BY_API_KEY:
+            key = handler.request.headers.get(self.api_key_header)
+            if key and not self.api_key_validator(key):
+                key = None
+        if not key:
+            return 'ip:%s' % handler.request.remote_addr
+        return '%s:%s' % (self._prefix, key,)
+
+    def take(self, key, now=None):
+        """Take a token from the client bucket.
+
+        Return 0 if the request is allowed, or the number of seconds
+        before a token is available.
+
+        """
+        if now is None:
+            now = time.time()
+        if (
+            self.sync_interval is not None
+            and now - self._last_sync >= self.sync_interval
+        ):
+            self.sync(now)
+
+        with self._lock:
+            bucket = self._buckets.pop(key, None)
+            if bucket is None:
+                bucket = [self.burst, now]
+            else:
+                bucket[0] = min(
+                    self.burst, bucket[0] + (now - bucket[1]) * self.rate
+                )
+                bucket[1] = now
+            self._buckets[key] = bucket
+            if len(self._buckets) > self.max_keys:
+                self._buckets.popitem(last=False)
+
+            if bucket[0] < 1:
+                return (1 - bucket[0]) / self.rate
+            bucket[0] -= 1
+            if self.sync_interval is not None:
+                self._pending[key] = self._pending.get(key, 0) + 1
+        return 0
+
+    def sync(self, now=None):
+        """Send the tokens taken since the last sync to memcache and
+        remove the ones other instances took from the local buckets.
+
+        Only one thread syncs at a time; the others skip it.
+
+        """
+        if not self._sync_lock.acquire(False):
+            return
+        try:
+            self._sync(time.time() if now is None else now)
+        finally:
+            self._sync_lock.release()
+
+    def _sync(self, now):
+        from google.appengine.api import memcache
+
+        with self._lock:
+            self._last_sync = now
+            pending, self._pending = self._pending, {}
+        window = int(now // self.sync_window)
+        if window != self._window:
+            self._window = window
+            self._taken = {}
+            self._others = {}
+
+        # also read the counters of the keys used earlier in the window
+        offsets = dict.fromkeys(self._taken, 0)
+        offsets.update(pending)
+        if not offsets:
+            return
+
+        try:
+            totals = memcache.offset_multi(
+                offsets,
+                key_prefix='%d:' % window,
+                namespace=self.namespace,
+                initial_value=0
+            )
+        except Exception:
+            logging.exception("Failed to sync the rate limit counters.")
+            return
+
+        with self._lock:
+            for key, count in offsets.iteritems():
+                taken = self._taken[key] = self._taken.get(key, 0) + count
+                total = totals.get(key)
+                if total is None:
+                    continue
+                others = total - taken
+                delta = others - self._others.get(key, 0)
+                self._others[key] = others
+                bucket = self._buckets.get(key)
+                if bucket is not None and delta > 0:
+                    bucket[0] -= delta
+
+
+class _Call(object):
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.failed = False
+
+
+class MetaRequestHandler(type):
     """Metaclass use to bind a request handler to a endpoint and a
     route.
 
@@ -763,21 +3871,220 @@ class ApiRequestHandler(webapp2.RequestHandler):
     """
     __metaclass__ = MetaRequestHandler
 
-    def render_json(self, data, status_code=200):
+    @webapp2.cached_property
+    def operation(self):
+        """Operation documenting the request method (or None).
+
+        """
+        endpoint = getattr(self.request.route, 'endpoint', None)
+        if endpoint is None:
+            return None
+        return endpoint.get_operation(self.request.method)
+
+    # fields selection function set when the request has a `fields`
+    # query parameter (see `Api.projection`)
+    projection = None
+
+    # page size and start cursor of paginated operations
+    page_limit = None
+    page_cursor = None
+
+    @webapp2.cached_property
+    def api(self):
+        """Api of the request handler endpoint (or None).
+
+        """
+        endpoint = getattr(self.request.route, 'endpoint', None)
+        if endpoint is None:
+            return None
+        return endpoint.resource.api
+
+    @webapp2.cached_property
+    def codecs(self):
+        if self.api is None:
+            return [default_codec]
+        return self.api.codecs
+
+    @webapp2.cached_property
+    def codec(self):
+        """Response encoder, negotiated with the request Accept header.
+
+        Default to the api json codec.
+
+        """
+        codecs = self.codecs
+        if len(codecs) == 1 or 'Accept' not in self.request.headers:
+            return codecs[0]
+        match = self.request.accept.best_match(
+            [c.content_type for c in codecs]
+        )
+        for codec in codecs:
+            if codec.content_type == match:
+                return codec
+        return codecs[0]
+
+    @webapp2.cached_property
+    def request_codec(self):
+        """Request body decoder, selected with the request Content-Type
+        header.
+
+        Default to the api json codec.
+
+        """
+        content_type = self.request.content_type
+        for codec in self.codecs:
+            if codec.content_type == content_type:
+                return codec
+        return self.codecs[0]
+
+    def dispatch(self):
+        op = self.operation
+        if op is None:
+            # undocumented methods still get the api body limit
+            if (
+                self.api is not None
+                and self.api.max_body_bytes is not None
+                and _body_too_large(self.request, self.api.max_body_bytes)
+            ):
+                return self.render_error(413)
+            return super(ApiRequestHandler, self).dispatch()
+
+        try:
+            code = self.check_operation(op)
+        except Exception, e:
+            return self.handle_exception(e, self.app.debug)
+        if code is not None:
+            return self.render_error(code)
+
+        admission = op.admission
+        if admission is None:
+            return self._dispatch_operation(op)
+        if not admission.acquire():
+            self.response.headers['Retry-After'] = op.retry_after
+            return self.render_error(503)
+        try:
+            return self._dispatch_operation(op)
+        finally:
+            admission.release()
+
+    def _dispatch_operation(self, op):
+        if not op.single_flight or self.request.method != 'GET':
+            return super(ApiRequestHandler, self).dispatch()
+
+        key = op.flight_key(self)
+        if key is None:
+            return super(ApiRequestHandler, self).dispatch()
+
+        status, headers, body = op.flights.do(key, self._dispatch_response)
+        if self._flight_leader:
+            return
+        self.response.status = status
+        self.response.headerlist = list(headers)
+        self.response.body = body
+
+    # set when the request ran the handler of a single flight
+    _flight_leader = False
+
+    def _dispatch_response(self):
+        self._flight_leader = True
+        super(ApiRequestHandler, self).dispatch()
+        # cookies are specific to the leader request
+        return (
+            self.response.status,
+            tuple(
+                h for h in self.response.headerlist
+                if h[0].lower() != 'set-cookie'
+            ),
+            self.response.body,
+        )
+
+    def render_json(self, data, status_code=200, type_=None):
+        """Encode the response data.
+
+        With `type_` (the complex type of the data, or of its items
+        when it's a list), json responses are encoded by the api
+        generated encoder (see `Api.encoder`). It defaults to the type
+        of model objects (see `Api.model_class`).
+
+        """
+        if type_ is None and data:
+            model = data[0] if isinstance(data, list) else data
+            if isinstance(model, Model):
+                type_ = model._schema
+
         self.response.status = status_code
-        self.response.headers['Content-Type'] = "application/json"
-        self.response.write(json.dumps(data))
+        self.response.headers['Content-Type'] = self.codec.content_type
+        self._set_vary()
+        if self.projection is not None and status_code < 400:
+            data = self.projection(_plain(data))
+        elif (
+            type_ is not None
+            and self.api is not None
+            and isinstance(self.codec, JsonCodec)
+        ):
+            encode = self.api.encoder(type_, many=isinstance(data, list))
+            self.response.write(encode(data))
+            return
+        self.response.write(self.codec.encode(_plain(data)))
+
+    def parse_json(self, msg="Invalid json body"):
+        """Decode the request json body (or the body in any other format
+        the api supports, according to the request Content-Type).
+
+        Abort with a 400 error if the body is not valid.
+
+        """
+        try:
+            return self.request_codec.decode(self.request.body)
+        except ValueError:
+            self.abort(400, msg)
+
+    def parse_model(self, type_, msg="Invalid json body"):
+        """Decode the request body, validate it and load it as a model
+        object (see `Api.load`).
+
+        Abort with a 400 error if the body is not valid.
+
+        """
+        from jsonschema import ValidationError
+
+        data = self.parse_json(msg)
+        try:
+            return self.api.load(type_, data)
+        except ValidationError as e:
+            self.abort(400, e.message)
+
+    @webapp2.cached_property
+    def _current_user(self):
+        from google.appengine.api import users
 
-    @staticmethod
-    def get_current_user():
         return users.get_current_user()
 
-    @classmethod
-    def get_current_user_id(cls):
-        user = cls.get_current_user()
+    @webapp2.cached_property
+    def _current_user_is_admin(self):
+        from google.appengine.api import users
+
+        return users.is_current_user_admin()
+
+    def get_current_user(self):
+        """Current user (or None). Only looked up once per request.
+
+        It's an instance method (it used to be a static method).
+        Subclasses can override it: `get_current_user_id`,
+        `is_current_user_admin` and the `auth`, `rate_limit` and
+        `single_flight` operation options go through it.
+
+        """
+        return self._current_user
+
+    def get_current_user_id(self):
+        user = self.get_current_user()
         if user:
             return int(user.user_id() or 0)
 
+    def is_current_user_admin(self):
+        return bool(self.get_current_user()) and self._current_user_is_admin
+
     def login_required(self, msg=None):
         user = self.get_current_user()
         if not user:
@@ -787,17 +4094,139 @@ class ApiRequestHandler(webapp2.RequestHandler):
 
     def admin_required(self, msg=None, admin_msg=None):
         user = self.login_required(msg=msg)
-        if not users.is_current_user_admin():
+        if not self.is_current_user_admin():
             self.abort(403, admin_msg)
         return user
 
+    def check_operation(self, op):
+        """Enforce the operation requirements before dispatching
+        the request to the handler method.
+
+        Return the http status code to reject the request with (or None).
+        Authentication failures, too large bodies and rate limited
+        requests don't raise an exception for them to stay cheap under
+        abusive traffic; an invalid `fields` query parameter aborts with
+        a 400 error.
+
+        """
+        limit = op.max_body_bytes
+        if limit is None and self.api is not None:
+            limit = self.api.max_body_bytes
+        if limit is not None and _body_too_large(self.request, limit):
+            return 413
+
+        if op.auth is not None:
+            if not self.get_current_user():
+                return 401
+            if op.auth == AUTH_ADMIN and not self.is_current_user_admin():
+                return 403
+
+        if op.rate_limit is not None:
+            wait = op.rate_limit.take(op.rate_limit.client_key(self))
+            if wait:
+                self.response.headers['Retry-After'] = str(
+                    int(math.ceil(wait))
+                )
+                return 429
+
+        fields = self.request.GET.get('fields')
+        if fields:
+            type_ = op.items.name if op.items else op.type
+            try:
+                self.projection = self.api.projection(type_, fields)
+            except ValueError, e:
+                self.abort(400, str(e))
+
+        if op.paginate:
+            self.page_limit = self._page_limit(op)
+            self.page_cursor = self._page_cursor()
+
+    def _page_limit(self, op):
+        limit = self.request.GET.get('limit')
+        if not limit:
+            return op.paginate
+        try:
+            limit = int(limit)
+        except ValueError:
+            limit = 0
+        if limit < 1 or limit > op.max_limit:
+            self.abort(
+                400, "limit should be between 1 and %d." % op.max_limit
+            )
+        return limit
+
+    def _page_cursor(self):
+        cursor = self.request.GET.get('cursor')
+        if not cursor:
+            return None
+
+        from google.appengine.api import datastore_errors
+        from google.appengine.ext import ndb
+
+        try:
+            return ndb.Cursor(urlsafe=cursor)
+        except datastore_errors.BadValueError:
+            self.abort(400, "Invalid cursor.")
+
+    def render_page(self, query, items="items", to_dict=None):
+        """Render a page of a datastore query results.
+
+        The page size and the start cursor are taken from the
+        `limit` and `cursor` query parameters of a paginated operation.
+
+        The response will have the list of results (converted by
+        `to_dict`; default to the entity `to_dict` method) set to the
+        `items` attribute and a `cursor` attribute set to the cursor of
+        the next page (or None if it's the last page).
+
+        """
+        limit = self.page_limit or Operation.default_limit
+        results, cursor, more = query.fetch_page(
+            limit, start_cursor=self.page_cursor, batch_size=limit
+        )
+        if to_dict is None:
+            to_dict = operator.methodcaller('to_dict')
+        self.render_json({
+            items: [to_dict(e) for e in results],
+            "cursor": cursor.urlsafe() if more and cursor else None,
+        })
+
+    def render_error(self, code, msg=None):
+        """Render an error response using a pre-encoded body.
+
+        If the message is not set, it will use the message declared
+        for that status code by the operation.
+
+        """
+        body = None
+        op = self.operation
+        if msg is None and op is not None:
+            body = op.error_bodies.get(code)
+        if body is None:
+            body = _error_body(code, msg)
+        if code in _STATUS_MESSAGES:
+            self.response.status = '%d %s' % (code, _STATUS_MESSAGES[code])
+        else:
+            self.response.status = code
+        self.response.headers['Content-Type'] = "application/json"
+        self._set_vary()
+        self.response.write(body)
+
+    def _set_vary(self):
+        """Let caches know the response depends on the Accept header
+        when the api supports other formats than json.
+
+        """
+        if len(self.codecs) > 1:
+            self.response.headers['Vary'] = 'Accept'
+
     def handle_exception(self, e, debug):
         if (
             isinstance(e, webapp2.HTTPException)
             and e.code >= 400
             and e.code < 500
         ):
-            self.render_json({"error": str(e)}, e.code)
+            self.render_error(e.code, e.detail)
         else:
             super(ApiRequestHandler, self).handle_exception(e, debug)
 
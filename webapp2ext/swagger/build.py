@@ -0,0 +1,195 @@
+"""Build the api documents as static files.
+
+usage:
+    python -m webapp2ext.swagger.build -o docs/ myapp.api
+
+It imports the application modules, finds their `swagger.Api`
+instances and, for each api, writes in `<output>/<api.path>/`:
+
+- `api-docs.json`, the root api-doc;
+- `api-docs/<resource>.json`, each resource api-doc;
+- `json-schemas.json`, the json-schema document;
+- a gzipped copy of each document (`.json.gz`);
+- `manifest.json`, mapping each document path (relative to the api
+  path) to its files and content hash;
+- `snapshot.bin`, the api snapshot, with the `--snapshot` option (see
+  `Api.snapshot`). Load it with `Api.load_snapshot` before calling
+  `Api.routes()` to skip rendering the documents on start up.
+
+The api routes can then serve those files
+(`api.routes(static_docs='docs/')`), or skip the doc routes
+(`api.routes(doc_routes=False)`) and let a static file handler serve
+them, e.g. in app.yaml:
+
+    - url: /api/v1/api-docs
+      static_files: docs/api/v1/api-docs.json
+      upload: docs/api/v1/api-docs.json
+      mime_type: application/json
+    - url: /api/v1/api-docs/(.*)
+      static_files: docs/api/v1/api-docs/\\1.json
+      upload: docs/api/v1/api-docs/.*\\.json
+      mime_type: application/json
+    - url: /api/v1/json-schemas
+      static_files: docs/api/v1/json-schemas.json
+      upload: docs/api/v1/json-schemas.json
+      mime_type: application/json
+
+"""
+import argparse
+import gzip
+import hashlib
+import importlib
+import json
+import os
+import sys
+
+from webapp2ext.swagger import Api, MANIFEST
+
+
+SNAPSHOT = "snapshot.bin"
+
+
+def get_args_parser():
+    """Build the command line argument parser
+
+    """
+    parser = argparse.ArgumentParser(
+        description='Write the api documents of the application modules '
+            'as static files.'
+    )
+    parser.add_argument(
+        'modules',
+        nargs='+',
+        help='modules defining the apis (e.g. "myapp.api").'
+    )
+    parser.add_argument(
+        '--output', '-o',
+        default='./docs',
+        help='directory to write the documents to (default to "./docs").'
+    )
+    parser.add_argument(
+        '--snapshot', '-s',
+        default=False, action='store_true',
+        help='should write the api snapshot.'
+    )
+    parser.add_argument(
+        '--fingerprint', '-f',
+        default=None,
+        help='snapshot fingerprint (default to the api definitions hash).'
+    )
+    parser.add_argument(
+        '--gae-lib-root', '-l',
+        default=None,
+        help='directory where to find Google App Engine SDK, '
+            'if the modules require it.'
+    )
+    return parser
+
+
+def find_apis(module):
+    """Return the `Api` instances defined in a module.
+
+    """
+    apis = []
+    for value in vars(module).itervalues():
+        if isinstance(value, Api) and value not in apis:
+            apis.append(value)
+    return sorted(apis, key=lambda api: api.path)
+
+
+def write_docs(api, output):
+    """Write the api documents and their manifest.
+
+    Return the list of files written.
+
+    """
+    root = os.path.join(output, api.path.lstrip('/'))
+    manifest = {}
+    written = []
+
+    for path, body in api.static_docs():
+        file_name = '%s.json' % path.lstrip('/')
+        gzip_name = '%s.gz' % file_name
+        manifest[path] = {
+            'file': file_name,
+            'gzip': gzip_name,
+            'hash': hashlib.sha1(body).hexdigest(),
+        }
+
+        file_path = os.path.join(root, file_name)
+        _makedirs(os.path.dirname(file_path))
+        with open(file_path, 'wb') as f:
+            f.write(body)
+        with open(os.path.join(root, gzip_name), 'wb') as f:
+            # set mtime so that builds are reproducible
+            with gzip.GzipFile(
+                filename='', mode='wb', fileobj=f, mtime=0
+            ) as gz:
+                gz.write(body)
+        written.extend([file_path, os.path.join(root, gzip_name)])
+
+    manifest_path = os.path.join(root, MANIFEST)
+    with open(manifest_path, 'wb') as f:
+        json.dump(manifest, f, sort_keys=True, indent=4)
+    written.append(manifest_path)
+    return written
+
+
+def write_snapshot(api, output, fingerprint=None):
+    """Write the api snapshot and return its path.
+
+    """
+    root = os.path.join(output, api.path.lstrip('/'))
+    _makedirs(root)
+    file_path = os.path.join(root, SNAPSHOT)
+    with open(file_path, 'wb') as f:
+        f.write(api.snapshot(fingerprint))
+    return file_path
+
+
+def _makedirs(path):
+    if not os.path.isdir(path):
+        os.makedirs(path)
+
+
+def setup_gae(gae_lib_root):
+    sys.path.insert(0, gae_lib_root)
+    import dev_appserver
+    dev_appserver.fix_sys_path()
+
+
+def main(
+    modules, output, snapshot=False, fingerprint=None, gae_lib_root=None
+):
+    """Import the modules and write the documents of the apis found.
+
+    """
+    if gae_lib_root is not None:
+        setup_gae(gae_lib_root)
+    sys.path.insert(0, os.getcwd())
+
+    for name in modules:
+        apis = find_apis(importlib.import_module(name))
+        if not apis:
+            print "No api found in %s." % name
+        for api in apis:
+            for file_path in write_docs(api, output):
+                print file_path
+            if snapshot:
+                print write_snapshot(api, output, fingerprint)
+
+
+def main_cli():
+    parser = get_args_parser()
+    args = parser.parse_args()
+    main(
+        args.modules,
+        args.output,
+        args.snapshot,
+        args.fingerprint,
+        args.gae_lib_root
+    )
+
+
+if __name__ == '__main__':
+    main_cli()
@@ -0,0 +1,152 @@
+import gzip
+import json
+import os
+import shutil
+import tempfile
+import types
+from StringIO import StringIO
+
+import webapp2
+
+from webapp2ext import swagger
+from webapp2ext.swagger import build
+from webapp2ext.swagger.tests.utils import TestCase
+
+
+class Handler(object):
+
+    def get(self):
+        """List resource"""
+
+
+class TestBuild(TestCase):
+
+    def setUp(self):
+        super(TestBuild, self).setUp()
+        self.output = tempfile.mkdtemp()
+        self.api = swagger.Api(
+            host="http://example.com/",
+            path='/api/v1/',
+            version='1'
+        )
+        self.api.schema('Student', properties={"name": swagger.String()})
+        students = self.api.resource(path="/students", desc="Students")
+        endpoint = students.endpoint('/students')
+        endpoint.operation(type_="Student", alias="getStudents")(Handler.get)
+        endpoint.bind(Handler)
+
+    def tearDown(self):
+        shutil.rmtree(self.output)
+        super(TestBuild, self).tearDown()
+
+    def _read(self, path):
+        with open(os.path.join(self.output, path), 'rb') as f:
+            return f.read()
+
+    def test_find_apis(self):
+        module = types.ModuleType('app')
+        module.api = self.api
+        module.alias = self.api
+        module.other = object()
+        self.assertEqual([self.api], build.find_apis(module))
+
+    def test_write_docs(self):
+        build.write_docs(self.api, self.output)
+
+        manifest = json.loads(self._read('api/v1/manifest.json'))
+        self.assertEqual(
+            ['/api-docs', '/api-docs/students', '/json-schemas'],
+            sorted(manifest)
+        )
+        for path, doc in (
+            ('/api-docs', self.api.api_doc(),),
+            (
+                '/api-docs/students',
+                self.api.resources['/students'].api_doc(),
+            ),
+            ('/json-schemas', self.api.schemas(),),
+        ):
+            entry = manifest[path]
+            body = self._read(os.path.join('api/v1', entry['file']))
+            self.assertEqual(doc, json.loads(body))
+            gzipped = self._read(os.path.join('api/v1', entry['gzip']))
+            self.assertEqual(
+                body, gzip.GzipFile(fileobj=StringIO(gzipped)).read()
+            )
+        self.assertEqual(
+            'api-docs/students.json', manifest['/api-docs/students']['file']
+        )
+
+    def test_write_snapshot(self):
+        file_path = build.write_snapshot(self.api, self.output, 'v1')
+        self.assertEqual(
+            os.path.join(self.output, 'api/v1/snapshot.bin'), file_path
+        )
+        self.assertEqual(self.api.snapshot('v1'), self._read(file_path))
+
+    def test_serve_static_docs(self):
+        build.write_docs(self.api, self.output)
+        app = webapp2.WSGIApplication(
+            [self.api.routes(static_docs=self.output)]
+        )
+
+        resp = app.get_response('/api/v1/api-docs/students')
+        self.assertEqual(200, resp.status_int)
+        self.assertEqual(
+            self.api.resources['/students'].api_doc(), json.loads(resp.body)
+        )
+
+        resp = app.get_response(
+            '/api/v1/json-schemas', headers={'Accept-Encoding': 'gzip'}
+        )
+        self.assertEqual('gzip', resp.headers['Content-Encoding'])
+        self.assertEqual(
+            self.api.schemas(),
+            json.loads(gzip.GzipFile(fileobj=StringIO(resp.body)).read())
+        )
+
+        resp = app.get_response(
+            '/api/v1/api-docs', headers={'If-None-Match': resp.etag}
+        )
+        self.assertEqual(200, resp.status_int)
+        resp = app.get_response(
+            '/api/v1/api-docs', headers={'If-None-Match': resp.etag}
+        )
+        self.assertEqual(304, resp.status_int)
+
+        resp = app.get_response('/api/v1/api-docs/tutors')
+        self.assertEqual(404, resp.status_int)
+
+    def test_static_docs_encodings(self):
+        build.write_docs(self.api, self.output)
+        app = webapp2.WSGIApplication(
+            [self.api.routes(static_docs=self.output)]
+        )
+
+        resp = app.get_response('/api/v1/api-docs')
+        gzipped = app.get_response(
+            '/api/v1/api-docs', headers={'Accept-Encoding': 'gzip'}
+        )
+        for r in (resp, gzipped,):
+            self.assertEqual('Accept-Encoding', r.headers['Vary'])
+        self.assertNotEqual(resp.etag, gzipped.etag)
+
+        # an etag only validates its own encoding
+        resp = app.get_response(
+            '/api/v1/api-docs', headers={'If-None-Match': gzipped.etag}
+        )
+        self.assertEqual(200, resp.status_int)
+        self.assertNotIn('Content-Encoding', resp.headers)
+        resp = app.get_response(
+            '/api/v1/api-docs',
+            headers={
+                'If-None-Match': gzipped.etag, 'Accept-Encoding': 'gzip'
+            }
+        )
+        self.assertEqual(304, resp.status_int)
+
+    def test_skip_doc_routes(self):
+        routes = self.api.routes(doc_routes=False)
+        self.assertEqual(
+            ["/api/v1/students"], [r.template for r in routes.routes]
+        )
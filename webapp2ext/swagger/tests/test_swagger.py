@@ -1,9 +1,53 @@
+import collections
+import gzip
+import json
+import threading
+import time
+import unittest
+from StringIO import StringIO
+
+import webapp2
+from google.appengine.api import memcache
+from google.appengine.ext import ndb
 from jsonschema import ValidationError
 
 from webapp2ext import swagger
 from webapp2ext.swagger import Api, String, Int, Array, Message, Param
 from webapp2ext.swagger.tests.utils import TestCase
 
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+
+try:
+    import ujson
+except ImportError:
+    ujson = None
+
+try:
+    import simplejson
+except ImportError:
+    simplejson = None
+
+
+class HeaderUser(object):
+    """User identified by the `X-User` request header.
+
+    """
+
+    def __init__(self, user_id):
+        self._user_id = user_id
+
+    def user_id(self):
+        return self._user_id
+
+    @classmethod
+    def from_request(cls, request):
+        user_id = request.headers.get('X-User')
+        if user_id:
+            return cls(user_id)
+
 
 class Handler(object):
     """Some resource
@@ -553,6 +597,676 @@ class TestApi(TestCase):
         except ValidationError:
             self.fail("Validation was suppose to pass. It failed instead")
 
+    def test_lazy_resolver(self):
+        api = Api(
+            host="http://example.com/",
+            path='/api/v1/',
+            version='1'
+        )
+        api.schema('Student', properties={"name": String(required=True)})
+        self.assertEqual(None, api._resolver)
+
+        self.assertRaises(ValidationError, api.validate, 'Student', {})
+        self.assertNotEqual(None, api._resolver)
+
+        api.schema('Tutor', properties={"name": String(required=True)})
+        self.assertRaises(ValidationError, api.validate, 'Tutor', {})
+
+    def test_patterns(self):
+        api = Api(
+            host="http://example.com/",
+            path='/api/v1/',
+            version='1'
+        )
+        api.schema(
+            'Student',
+            properties={"id": String(pattern=r"^\d+$")},
+            pattern_properties={"^x-": Int(), "^y-": api.ref('Tutor')}
+        )
+        api.schema('Tutor', properties={})
+        definition = api._schemas['Student']
+
+        self.assertIs(swagger._regexes[r"^\d+$"], swagger._regex(r"^\d+$"))
+        self.assertEqual(
+            [("^x-", swagger._regex("^x-"),), ("^y-", swagger._regex("^y-"),)],
+            sorted(p[:2] for p in definition._patterns)
+        )
+        self.assertNotIn('Patterns', api.schemas()['Student'])
+        self.assertEqual(['Tutor'], swagger._model_refs(definition))
+
+        api.validate('Student', {"id": "1", "x-a": 1, "y-b": {}})
+        for data in ({"id": "a"}, {"x-a": "1"}, {"z-a": 1},):
+            self.assertRaises(ValidationError, api.validate, 'Student', data)
+            self.assertRaises(
+                ValidationError, api.compiled_validator('Student'), data
+            )
+        with self.assertRaises(ValidationError) as ctx:
+            api.validate('Student', {"id": "a"})
+        self.assertEqual(
+            "'a' does not match %r" % r"^\d+$", ctx.exception.message
+        )
+
+    def test_shared_definitions(self):
+        api = Api(
+            host="http://example.com/",
+            path='/api/v1/',
+            version='1'
+        )
+        api.schema('Student', properties={
+            "name": String(required=True),
+            "tags": Array(items=String()),
+        })
+        api.schema('Tutor', properties={
+            "name": String(required=True),
+            "tags": Array(items=String()),
+        })
+
+        schemas = api.schemas()
+        self.assertEqual(
+            {"type": "array", "items": {"type": "string"}},
+            schemas['Student']['properties']['tags']
+        )
+        self.assertIs(
+            schemas['Student']['properties']['tags'],
+            schemas['Tutor']['properties']['tags']
+        )
+        self.assertEqual(['name'], schemas['Tutor']['required'])
+
+    def test_shared_resource_models(self):
+        api = Api(
+            host="http://example.com/",
+            path='/api/v1/',
+            version='1'
+        )
+        api.schema('Student', properties={"name": String()})
+        for path in ('/students', '/tutors',):
+            resource = api.resource(path=path, desc="Operations")
+            resource.endpoint(path).operation(
+                type_="Student", alias="get"
+            )(Handler.get)
+        api.freeze()
+
+        self.assertIs(
+            api.resources['/students'].api_doc()['models']['Student'],
+            api.resources['/tutors'].api_doc()['models']['Student']
+        )
+
+    def test_hoist_inline(self):
+        api = Api(
+            host="http://example.com/",
+            path='/api/v1/',
+            version='1',
+            hoist_inline=True
+        )
+        address = lambda: swagger.Object(properties={"city": String()})
+        api.schema('Student', properties={"address": address()})
+        api.schema('Tutor', properties={"address": address()})
+
+        app = webapp2.WSGIApplication([api.routes()])
+        schemas = json.loads(app.get_response('/api/v1/json-schemas').body)
+        ref = schemas['Student']['properties']['address']['$ref']
+        self.assertEqual(ref, schemas['Tutor']['properties']['address']['$ref'])
+        name = ref.split('#/')[1]
+        self.assertEqual(
+            {"type": "string"}, schemas[name]['properties']['city']
+        )
+
+        # only the served document is hoisted
+        self.assertNotIn(name, api.schemas())
+        api.validate('Student', {"address": {"city": "London"}})
+        self.assertRaises(
+            ValidationError, api.validate, 'Tutor', {"address": {"city": 1}}
+        )
+        student = api.load('Student', {"address": {"city": "London"}})
+        self.assertEqual({"city": "London"}, student.address)
+        self.assertEqual(
+            {"address": {"city": "London"}},
+            json.loads(api.encoder('Student')(student))
+        )
+
+    def test_hoist_nested_inline(self):
+        api = Api(
+            host="http://example.com/",
+            path='/api/v1/',
+            version='1',
+            hoist_inline=True
+        )
+        address = lambda: swagger.Object(properties={
+            "city": String(),
+            "geo": swagger.Object(properties={"lat": swagger.Float()}),
+        })
+        api.schema(
+            'Student', properties={"home": address(), "school": address()}
+        )
+        api.schema('Tutor', properties={"home": address()})
+
+        app = webapp2.WSGIApplication([api.routes()])
+        schemas = json.loads(app.get_response('/api/v1/json-schemas').body)
+        hoisted = sorted(k for k in schemas if k.startswith('Inline'))
+        # the address and geo objects, each under a single name
+        self.assertEqual(2, len(hoisted))
+        refs = set(
+            schemas[model]['properties'][prop]['$ref']
+            for model, prop in (
+                ('Student', 'home'), ('Student', 'school'), ('Tutor', 'home'),
+            )
+        )
+        self.assertEqual(1, len(refs))
+
+    def test_interner_pruning(self):
+        api = Api(
+            host="http://example.com/",
+            path='/api/v1/',
+            version='1'
+        )
+        api._interner.min_prune_size = 8
+        api.schema('Student', properties={"name": String()})
+        for i in range(100):
+            api.schema('Student', properties={"name%d" % i: String()})
+        # the replaced definitions' properties are forgotten
+        self.assertLessEqual(len(api._interner._table), 16)
+
+
+    def test_redefined_model_refs(self):
+        api = Api(
+            host="http://example.com/",
+            path='/api/v1/',
+            version='1'
+        )
+        api.schema('Student', properties={"id": Int()})
+        api.schema('Tutor', properties={"id": Int()})
+        students = api.resource(path="/students", desc="Students")
+        students.add_model('Student')
+        self.assertEqual(['Student'], sorted(students.api_doc()['models']))
+
+        api.schema('Student', properties={"tutor": api.ref('Tutor')})
+        self.assertEqual(
+            ['Student', 'Tutor'], sorted(students.api_doc()['models'])
+        )
+
+        api.schema('Student', properties={"id": Int()})
+        self.assertEqual(['Student'], sorted(students.api_doc()['models']))
+
+    def test_incremental_render(self):
+        api = Api(
+            host="http://example.com/",
+            path='/api/v1/',
+            version='1'
+        )
+        api.schema('Student', properties={"id": Int()})
+        api.schema('Tutor', properties={"id": Int()})
+        students = api.resource(path="/students", desc="Students")
+        tutors = api.resource(path="/tutors", desc="Tutors")
+        students.add_model('Student')
+        tutors.add_model('Tutor')
+
+        schemas = api.schemas()
+        students_doc = students.api_doc()
+        tutors_doc = tutors.api_doc()
+        self.assertIs(schemas, api.schemas())
+        self.assertIs(students_doc, students.api_doc())
+
+        api.schema('Student', properties={"name": String()})
+        self.assertIsNot(schemas, api.schemas())
+        self.assertEqual(
+            {"name": {"type": "string"}},
+            api.schemas()['Student']['properties']
+        )
+        # only the changed definition is rendered again
+        self.assertIs(schemas['Tutor'], api.schemas()['Tutor'])
+        self.assertIs(tutors_doc, tutors.api_doc())
+        self.assertIsNot(students_doc, students.api_doc())
+        models = students.api_doc()['models']
+        self.assertEqual(['name'], models['Student']['properties'].keys())
+
+        tutors.add_model('Student')
+        self.assertIsNot(tutors_doc, tutors.api_doc())
+        self.assertIs(
+            students.api_doc()['models']['Student'],
+            tutors.api_doc()['models']['Student']
+        )
+
+    def test_lazy_docs(self):
+
+        def define(lazy_docs):
+            api = Api(
+                host="http://example.com/",
+                path='/api/v1/',
+                version='1',
+                lazy_docs=lazy_docs
+            )
+            api.max_cached_docs = 1
+            api.schema('Student', properties={"id": Int()})
+            for path in ('/tutors', '/students',):
+                resource = api.resource(path=path, desc=path)
+
+                class Handler(swagger.ApiRequestHandler):
+
+                    endpoint = resource.endpoint(path)
+
+                    @endpoint.operation(type_="Student", alias=path[1:])
+                    def get(self):
+                        """List"""
+
+            return api
+
+        expected = define(False)
+        api = define(True)
+        self.assertIs(api.api_doc(), api.api_doc())
+        expected_app = webapp2.WSGIApplication([expected.routes()])
+        app = webapp2.WSGIApplication([api.routes()])
+
+        students = api.resources['/students']
+        self.assertIsNone(students.api_doc_body)
+        self.assertEqual(0, len(api._resource_docs))
+
+        for path in ('/students', '/tutors', '/students',):
+            url = '/api/v1/api-docs%s' % path
+            for headers in ({}, {'Accept-Encoding': 'gzip'},):
+                resp = app.get_response(url, headers=headers)
+                self.assertEqual(
+                    expected_app.get_response(url, headers=headers).body,
+                    resp.body
+                )
+        self.assertEqual(1, len(api._resource_docs))
+        self.assertIs(students.api_doc(), students.api_doc())
+        self.assertEqual(
+            dict(expected.static_docs()), dict(api.static_docs())
+        )
+
+    def test_memory_report(self):
+        api = Api(
+            host="http://example.com/",
+            path='/api/v1/',
+            version='1'
+        )
+        api.schema('Student', properties={
+            "id": Int(), "tags": Array(items=String()),
+        })
+        resource = api.resource(path="/students", desc="Students")
+
+        class StudentHandler(swagger.ApiRequestHandler):
+
+            path = resource.endpoint('/students')
+
+            @path.operation(type_="Student", alias="getStudents")
+            def get(self):
+                """List students"""
+
+        report = api.memory_report()
+        self.assertEqual(
+            [
+                'schemas', 'documents', 'operations', 'resolver',
+                'validators', 'total',
+            ],
+            report.keys()
+        )
+        self.assertEqual(1, report['schemas']['count'])
+        self.assertEqual(4, report['schemas']['types'])
+        self.assertEqual(1, report['operations']['count'])
+        self.assertEqual(0, report['documents']['count'])
+        self.assertEqual(0, report['validators']['count'])
+
+        app = webapp2.WSGIApplication([api.routes(memory_report=True)])
+        api.validate('Student', {"id": 1})
+        report = api.memory_report()
+        self.assertEqual(3, report['documents']['count'])
+        self.assertEqual(1, report['validators']['count'])
+        self.assertGreater(report['validators']['bytes'], 0)
+        self.assertEqual(
+            sum(r['bytes'] for k, r in report.items() if k != 'total'),
+            report['total']['bytes']
+        )
+
+        resp = app.get_response('/api/v1/_memory')
+        self.assertEqual(403, resp.status_int)
+
+        self.login(is_admin=True)
+        resp = app.get_response('/api/v1/_memory')
+        self.assertEqual(200, resp.status_int)
+        self.assertEqual(
+            report['schemas'], json.loads(resp.body)['schemas']
+        )
+
+class TestCompiledValidator(TestCase):
+
+    def setUp(self):
+        super(TestCompiledValidator, self).setUp()
+        self.api = Api(
+            host="http://example.com/",
+            path='/api/v1/',
+            version='1'
+        )
+        self.api.schema('Student', properties={
+            "id": Int(required=True, minimum=1),
+            "name": String(required=True),
+            "score": swagger.Float(
+                minimum=0, maximum=20, exclusive_maximum=True,
+                multiple_of=0.5
+            ),
+            "grade": String(enum=["A", "B", "C"]),
+            "active": swagger.Boolean(),
+            "tags": Array(items=String(), unique_items=True),
+            "tutor": self.api.ref('Student'),
+            "address": swagger.Object(
+                properties={"city": String()},
+                pattern_properties={"^x-": Int()},
+            ),
+        })
+        self.api.schema(
+            'StudentList',
+            properties={"students": Array(items=self.api.ref('Student'))},
+            pattern_properties={"^x-": String()},
+        )
+        self.api.schema(
+            'Extras', properties={}, additional_properties={"type": "integer"}
+        )
+
+    def assertSameErrors(self, name, data):
+        validate = self.api.compiled_validator(name)
+        try:
+            self.api.validate(name, data)
+        except ValidationError as e:
+            with self.assertRaises(ValidationError) as ctx:
+                validate(data)
+            self.assertEqual(e.message, ctx.exception.message)
+            self.assertEqual(list(e.path), list(ctx.exception.path))
+        else:
+            validate(data)
+
+    def test_valid(self):
+        student = {
+            "id": 1,
+            "name": "bob",
+            "score": 12.5,
+            "grade": "A",
+            "active": True,
+            "tags": ["a", "b"],
+            "tutor": {"id": 2, "name": "alice"},
+            "address": {"city": "London", "x-zip": 1},
+        }
+        self.api.compiled_validator('Student')(student)
+        self.api.compiled_validator('StudentList')(
+            {"students": [student], "x-page": "1"}
+        )
+        self.api.compiled_validator('Extras')({"a": 1})
+
+    def test_invalid(self):
+        cases = [
+            ('Student', None),
+            ('Student', []),
+            ('Student', {"name": "bob"}),
+            ('Student', {"id": True, "name": "bob"}),
+            ('Student', {"id": 1.0, "name": "bob"}),
+            ('Student', {"id": 0, "name": "bob"}),
+            ('Student', {"id": 1, "name": 1}),
+            ('Student', {"id": 1, "name": "bob", "score": 20}),
+            ('Student', {"id": 1, "name": "bob", "score": -1}),
+            ('Student', {"id": 1, "name": "bob", "score": 1.2}),
+            ('Student', {"id": 1, "name": "bob", "grade": "D"}),
+            ('Student', {"id": 1, "name": "bob", "active": 1}),
+            ('Student', {"id": 1, "name": "bob", "tags": ["a", "a"]}),
+            ('Student', {"id": 1, "name": "bob", "tags": [1]}),
+            ('Student', {"id": 1, "name": "bob", "tutor": {"id": 2}}),
+            ('Student', {"id": 1, "name": "bob", "other": 1}),
+            (
+                'Student',
+                {"id": 1, "name": "bob", "address": {"x-zip": "1"}}
+            ),
+            ('StudentList', {"students": [{"id": 1}]}),
+            ('StudentList', {"x-page": 1}),
+            ('StudentList', {"page": "1"}),
+            ('Extras', {"a": "1"}),
+        ]
+        for name, data in cases:
+            self.assertRaises(
+                ValidationError, self.api.compiled_validator(name), data
+            )
+            self.assertSameErrors(name, data)
+
+    def test_cache(self):
+        validate = self.api.compiled_validator('Student')
+        self.assertIs(validate, self.api.compiled_validator('Student'))
+        self.assertIsNot(validate, self.api.validator('Student').validate)
+
+        self.api.schema('Tutor', properties={})
+        self.assertIsNot(validate, self.api.compiled_validator('Student'))
+
+    def test_unsupported(self):
+        schemas = {"Student": {"type": "string", "minLength": 1}}
+        compiler = swagger._ValidatorCompiler(schemas, "http://example.com")
+        self.assertRaises(swagger._Unsupported, compiler.compile, 'Student')
+
+
+class TestModel(TestCase):
+
+    def setUp(self):
+        super(TestModel, self).setUp()
+        self.api = Api(
+            host="http://example.com/",
+            path='/api/v1/',
+            version='1'
+        )
+        self.api.schema('Student', properties={
+            "id": Int(required=True),
+            "class": String(),
+            "tutor": self.api.ref('Student'),
+            "address": swagger.Object(properties={"city": String()}),
+        })
+        self.api.schema('StudentList', properties={
+            "students": Array(items=self.api.ref('Student')),
+            "tags": Array(items=String()),
+        })
+        self.api.schema(
+            'Extras',
+            properties={"id": Int()},
+            additional_properties={"type": "string", "minLength": 1}
+        )
+
+    def test_model_class(self):
+        cls = self.api.model_class('Student')
+        self.assertTrue(issubclass(cls, swagger.Model))
+        self.assertEqual('Student', cls.__name__)
+        self.assertEqual(('address', 'class', 'id', 'tutor',), cls._names)
+        self.assertEqual(('address', 'p_class', 'id', 'tutor',), cls._fields)
+        self.assertIs(cls, self.api.model_class('Student'))
+
+        student = cls(id=1)
+        self.assertFalse(hasattr(student, '__dict__'))
+        self.assertEqual(
+            "Student(address=None, p_class=None, id=1, tutor=None)",
+            repr(student)
+        )
+        self.assertRaises(ValueError, self.api.model_class, 'Tutor')
+
+    def test_load(self):
+        data = {
+            "students": [{
+                "id": 1,
+                "class": "1A",
+                "tutor": {"id": 2},
+                "address": {"city": "London"},
+            }],
+            "tags": ["a"],
+        }
+        students = self.api.load('StudentList', data)
+        Student = self.api.model_class('Student')
+
+        self.assertEqual(['a'], students.tags)
+        student = students.students[0]
+        self.assertIsInstance(student, Student)
+        self.assertEqual((1, "1A",), (student.id, student.p_class,))
+        self.assertEqual(Student(id=2), student.tutor)
+        self.assertEqual({"city": "London"}, student.address)
+        self.assertEqual(data, students._asdict())
+
+    def test_load_invalid(self):
+        for data in ({"students": [{}]}, {"students": {}}, {"tags": [1]},):
+            with self.assertRaises(ValidationError) as ctx:
+                self.api.load('StudentList', data)
+            with self.assertRaises(ValidationError) as expected:
+                self.api.validate('StudentList', data)
+            self.assertEqual(
+                expected.exception.message, ctx.exception.message
+            )
+
+    def test_load_unsupported(self):
+        extras = self.api.load('Extras', {"id": 1, "name": "bob"})
+        self.assertEqual(1, extras.id)
+        self.assertEqual({"name": "bob"}, extras._extra_properties)
+        self.assertEqual({"id": 1, "name": "bob"}, extras._asdict())
+        self.assertRaises(
+            ValidationError, self.api.load, 'Extras', {"name": ""}
+        )
+
+    def test_decode(self):
+        students = self.api.decode(
+            'StudentList', '{"students": [{"id": 1}]}'
+        )
+        self.assertEqual(1, students.students[0].id)
+
+    def test_parse_model(self):
+        resource = self.api.resource(path="/students", desc="Students")
+
+        class StudentHandler(swagger.ApiRequestHandler):
+
+            path = resource.endpoint('/students')
+
+            @path.operation(type_="Student", alias="addStudent")
+            def post(self):
+                """Add a student"""
+                student = self.parse_model('Student')
+                self.render_json({"id": student.id})
+
+        app = webapp2.WSGIApplication([self.api.routes()])
+        resp = app.get_response(
+            '/api/v1/students', method='POST', body='{"id": 1}'
+        )
+        self.assertEqual({"id": 1}, json.loads(resp.body))
+
+        resp = app.get_response(
+            '/api/v1/students', method='POST', body='{"id": "1"}'
+        )
+        self.assertEqual(400, resp.status_int)
+        self.assertIn("is not of type", json.loads(resp.body)['error'])
+
+
+class TestEncoder(TestCase):
+
+    def setUp(self):
+        super(TestEncoder, self).setUp()
+        self.api = Api(
+            host="http://example.com/",
+            path='/api/v1/',
+            version='1'
+        )
+        self.api.schema('Student', properties={
+            "id": Int(required=True),
+            "name": String(),
+            "score": swagger.Float(),
+            "active": swagger.Boolean(),
+            "tutor": self.api.ref('Student'),
+            "tags": Array(items=String()),
+            "address": swagger.Object(properties={"city": String()}),
+        })
+        self.api.schema(
+            'Extras',
+            properties={"id": Int()},
+            additional_properties={"type": "string"}
+        )
+        self.data = {
+            "id": 1,
+            "name": u"B\xf6b \"1\"",
+            "score": 0.1,
+            "active": False,
+            "tutor": {"id": 2, "name": "alice"},
+            "tags": ["a", "b"],
+            "address": {"city": "London"},
+        }
+
+    def test_encode_dict(self):
+        encode = self.api.encoder('Student')
+        body = encode(self.data)
+        self.assertEqual(self.data, json.loads(body))
+        self.assertTrue(body.startswith('{"active":false,"address":'))
+        self.assertIs(encode, self.api.encoder('Student'))
+
+    def test_encode_model(self):
+        student = self.api.load('Student', self.data)
+        self.assertEqual(
+            self.data, json.loads(self.api.encoder('Student')(student))
+        )
+
+        extras = self.api.load('Extras', {"id": 1, "name": "bob"})
+        self.assertEqual(
+            {"id": 1, "name": "bob"},
+            json.loads(self.api.encoder('Extras')(extras))
+        )
+
+    def test_encode_object(self):
+
+        class Entity(object):
+            id = 1
+            name = "bob"
+            score = 2
+            other = "skipped"
+
+        self.assertEqual(
+            '{"id":1,"name":"bob","score":2}',
+            self.api.encoder('Student')(Entity())
+        )
+
+    def test_encode_many(self):
+        students = [self.data, {"id": 3, "tags": []}]
+        encode = self.api.encoder('Student', many=True)
+        self.assertEqual(students, json.loads(encode(students)))
+        self.assertEqual('[]', encode([]))
+
+    def test_encode_unexpected_types(self):
+        data = {"id": 1L, "name": 2, "score": 1L, "tags": "a"}
+        self.assertEqual(
+            '{"id":1,"name":2,"score":1,"tags":"a"}',
+            self.api.encoder('Student')(data)
+        )
+
+    def test_redefined_schema(self):
+        encode = self.api.encoder('Extras')
+        self.api.schema('Extras', properties={"name": String()})
+        self.assertIsNot(encode, self.api.encoder('Extras'))
+        self.assertEqual(
+            '{"name":"bob"}', self.api.encoder('Extras')({"name": "bob"})
+        )
+        self.assertRaises(ValueError, self.api.encoder, 'Tutor')
+
+    def test_render_json(self):
+        resource = self.api.resource(path="/students", desc="Students")
+        api = self.api
+
+        class StudentHandler(swagger.ApiRequestHandler):
+
+            path = resource.endpoint('/students')
+
+            @path.operation(type_="Student", alias="getStudents")
+            def get(self):
+                """List students"""
+                self.render_json([api.load('Student', {"id": 1})])
+
+            @path.operation(type_="Student", alias="addStudent")
+            def post(self):
+                """Add a student"""
+                self.render_json(
+                    {"id": 2, "secret": True}, 201, type_='Student'
+                )
+
+        app = webapp2.WSGIApplication([self.api.routes()])
+        resp = app.get_response('/api/v1/students')
+        self.assertEqual('[{"id":1}]', resp.body)
+
+        resp = app.get_response('/api/v1/students', method='POST')
+        self.assertEqual(201, resp.status_int)
+        self.assertEqual('{"id":2}', resp.body)
+
+
 class TestType(TestCase):
 
     def test_empty_type(self):
@@ -607,3 +1321,1523 @@ class TestToDict(TestCase):
             swagger.to_dict(subject)
         )
         self.assertTrue(isinstance(subject['list'][0], Int))
+
+
+class TestSingleFlight(TestCase):
+
+    def setUp(self):
+        super(TestSingleFlight, self).setUp()
+        self.api = Api(
+            host="http://example.com/",
+            path='/api/v1/',
+            version='1'
+        )
+        self.api.schema('Item', properties={"name": String()})
+        self.calls = []
+        self.release = threading.Event()
+        resource = self.api.resource(path="/items", desc="Items")
+        test = self
+
+        class ItemHandler(swagger.ApiRequestHandler):
+
+            path = resource.endpoint('/items')
+
+            @path.operation(
+                type_="Item", alias="getItem", single_flight=True
+            )
+            def get(self):
+                """Get an item"""
+                test.calls.append(self.request.path_qs)
+                test.release.wait(1)
+                self.render_json({"name": "item %d" % len(test.calls)})
+
+        class UserItemHandler(swagger.ApiRequestHandler):
+
+            path = resource.endpoint('/items/mine')
+
+            def get_current_user(self):
+                return HeaderUser.from_request(self.request)
+
+            @path.operation(
+                type_="Item",
+                alias="getUserItem",
+                single_flight=True,
+                auth=swagger.AUTH_LOGIN
+            )
+            def get(self):
+                """Get the current user item"""
+                user = self.get_current_user().user_id()
+                test.calls.append(user)
+                test.release.wait(1)
+                self.response.set_cookie('session', user)
+                self.render_json({"name": user})
+
+        self.app = webapp2.WSGIApplication([self.api.routes()])
+
+    def _get_concurrently(self, urls, headers=None):
+        results = [None] * len(urls)
+        headers = headers or [{}] * len(urls)
+
+        def get(i, url):
+            results[i] = self.app.get_response(url, headers=headers[i])
+
+        threads = [
+            threading.Thread(target=get, args=(i, url,))
+            for i, url in enumerate(urls)
+        ]
+        for t in threads:
+            t.start()
+        time.sleep(0.1)
+        self.release.set()
+        for t in threads:
+            t.join()
+        return results
+
+    def test_share_response(self):
+        responses = self._get_concurrently(['/api/v1/items'] * 4)
+        self.assertEqual(['/api/v1/items'], self.calls)
+        for resp in responses:
+            self.assertEqual(200, resp.status_int)
+            self.assertEqual('application/json', resp.content_type)
+            self.assertEqual({"name": "item 1"}, json.loads(resp.body))
+
+    def test_key_by_query(self):
+        self._get_concurrently(['/api/v1/items?a=1', '/api/v1/items?a=2'])
+        self.assertEqual(
+            ['/api/v1/items?a=1', '/api/v1/items?a=2'],
+            sorted(self.calls)
+        )
+
+    def test_key_by_user(self):
+        responses = self._get_concurrently(
+            ['/api/v1/items/mine'] * 3,
+            [{'X-User': 'alice'}, {'X-User': 'alice'}, {'X-User': 'bob'}]
+        )
+        self.assertEqual(['alice', 'bob'], sorted(self.calls))
+        self.assertEqual(
+            ['alice', 'alice', 'bob'],
+            [json.loads(r.body)['name'] for r in responses]
+        )
+        # the leader cookie is not replayed
+        self.assertEqual(
+            [1, 0, 1],
+            sorted(
+                [len(r.headers.getall('Set-Cookie')) for r in responses[:2]],
+                reverse=True
+            ) + [len(responses[2].headers.getall('Set-Cookie'))]
+        )
+
+    def test_no_caching(self):
+        self.release.set()
+        self.app.get_response('/api/v1/items')
+        self.app.get_response('/api/v1/items')
+        self.assertEqual(2, len(self.calls))
+
+
+class TestAdmission(TestCase):
+
+    def setUp(self):
+        super(TestAdmission, self).setUp()
+        self.api = Api(
+            host="http://example.com/",
+            path='/api/v1/',
+            version='1'
+        )
+        self.api.schema('Item', properties={"name": String()})
+        self.calls = []
+        self.release = threading.Event()
+        resource = self.api.resource(path="/items", desc="Items")
+        test = self
+
+        class ItemHandler(swagger.ApiRequestHandler):
+
+            path = resource.endpoint('/items')
+
+            @path.operation(
+                type_="Item", alias="getItems", max_concurrent=1,
+                retry_after=5
+            )
+            def get(self):
+                """Get items"""
+                test.calls.append(self.request.path_qs)
+                test.release.wait(1)
+                self.render_json({"name": "item"})
+
+            @path.operation(
+                type_="Item", alias="addItem", max_concurrent=1,
+                queue_timeout=1
+            )
+            def post(self):
+                """Add an item"""
+                test.calls.append(self.request.path_qs)
+                test.release.wait(1)
+                self.render_json({"name": "item"}, 201)
+
+        self.app = webapp2.WSGIApplication([self.api.routes()])
+
+    def _concurrently(self, method, count, wait=0.1):
+        results = [None] * count
+
+        def request(i):
+            results[i] = self.app.get_response(
+                '/api/v1/items?i=%d' % i, method=method
+            )
+
+        threads = [
+            threading.Thread(target=request, args=(i,))
+            for i in range(count)
+        ]
+        for t in threads:
+            t.start()
+            time.sleep(0.05)
+        time.sleep(wait)
+        self.release.set()
+        for t in threads:
+            t.join()
+        return results
+
+    def test_shed_requests(self):
+        responses = self._concurrently('GET', 3)
+        self.assertEqual(
+            [200, 503, 503], [r.status_int for r in responses]
+        )
+        self.assertEqual(['/api/v1/items?i=0'], self.calls)
+        self.assertEqual('5', responses[1].headers['Retry-After'])
+        self.assertEqual(swagger._error_body(503, None), responses[1].body)
+
+        # the slot is released
+        resp = self.app.get_response('/api/v1/items')
+        self.assertEqual(200, resp.status_int)
+
+    def test_queue_timeout(self):
+        responses = self._concurrently('POST', 2)
+        self.assertEqual([201, 201], [r.status_int for r in responses])
+        self.assertEqual(2, len(self.calls))
+
+    def test_release(self):
+        op = self.api.resources['/items'].apis['/items'].get_operation('GET')
+        self.release.set()
+        self.app.get_response('/api/v1/items')
+        self.assertEqual(0, op.admission.running)
+
+
+class TestRateLimit(TestCase):
+
+    def setUp(self):
+        super(TestRateLimit, self).setUp()
+        self.api = Api(
+            host="http://example.com/",
+            path='/api/v1/',
+            version='1'
+        )
+        self.api.schema('Item', properties={"name": String()})
+        self.calls = []
+        self.limit = limit = swagger.RateLimit(2, period=60)
+        resource = self.api.resource(path="/items", desc="Items")
+        test = self
+
+        class ItemHandler(swagger.ApiRequestHandler):
+
+            path = resource.endpoint('/items')
+
+            @path.operation(type_="Item", alias="getItems", rate_limit=limit)
+            def get(self):
+                """Get items"""
+                test.calls.append(self.get_current_user_id())
+                self.render_json({"name": "item"})
+
+            @path.operation(
+                type_="Item",
+                alias="addItem",
+                rate_limit=swagger.RateLimit(
+                    1,
+                    period=60,
+                    key=swagger.RATE_BY_API_KEY,
+                    api_key_validator=lambda key: key in ('a', 'b',),
+                    max_keys=3
+                )
+            )
+            def post(self):
+                """Add an item"""
+                self.render_json({"name": "item"}, 201)
+
+        self.app = webapp2.WSGIApplication([self.api.routes()])
+
+    def _get(self, **kw):
+        return self.app.get_response('/api/v1/items', **kw)
+
+    def test_throttle(self):
+        self.login(user_id=1)
+        self.assertEqual(
+            [200, 200], [self._get().status_int for _ in range(2)]
+        )
+
+        resp = self._get()
+        self.assertEqual(429, resp.status_int)
+        self.assertEqual('30', resp.headers['Retry-After'])
+        self.assertEqual(
+            {"error": "Too Many Requests"}, json.loads(resp.body)
+        )
+        self.assertEqual([1, 1], self.calls)
+
+        self.login(user_id=2)
+        self.assertEqual(200, self._get().status_int)
+
+    def test_key(self):
+        post = lambda **kw: self.app.get_response(
+            '/api/v1/items', method='POST', **kw
+        ).status_int
+        self.assertEqual(201, post(headers={'X-Api-Key': 'a'}))
+        self.assertEqual(429, post(headers={'X-Api-Key': 'a'}))
+        self.assertEqual(201, post(headers={'X-Api-Key': 'b'}))
+
+        # clients without api key are limited by ip address
+        self.assertEqual(201, post(remote_addr='10.0.0.1'))
+        self.assertEqual(429, post(remote_addr='10.0.0.1'))
+        self.assertEqual(201, post(remote_addr='10.0.0.2'))
+
+        self.assertRaises(ValueError, swagger.RateLimit, 1, key='foo')
+        self.assertRaises(
+            ValueError, swagger.RateLimit, 1, key=swagger.RATE_BY_API_KEY
+        )
+
+    def test_unknown_api_key(self):
+        post = lambda key: self.app.get_response(
+            '/api/v1/items',
+            method='POST',
+            headers={'X-Api-Key': key},
+            remote_addr='10.0.0.1'
+        ).status_int
+        self.assertEqual(201, post('a'))
+
+        # rotating unknown keys uses the client ip address bucket...
+        self.assertEqual(201, post('c'))
+        self.assertEqual([429] * 5, [post('k%d' % i) for i in range(5)])
+
+        # ... and doesn't evict the known clients' buckets
+        self.assertEqual(429, post('a'))
+
+    def test_refill(self):
+        limit = swagger.RateLimit(2, period=1, burst=1)
+        self.assertEqual(0, limit.take('a', now=0))
+        self.assertEqual(0.25, limit.take('a', now=0.25))
+        self.assertEqual(0, limit.take('a', now=0.5))
+
+    def test_max_keys(self):
+        limit = swagger.RateLimit(1, max_keys=2)
+        for key in ('a', 'b', 'c',):
+            limit.take(key, now=0)
+        self.assertEqual(['b', 'c'], limit._buckets.keys())
+        self.assertEqual(0, limit.take('a', now=0))
+
+    def test_memcache_sync(self):
+        instances = [
+            swagger.RateLimit(10, period=60, sync_interval=10)
+            for _ in range(2)
+        ]
+        for _ in range(6):
+            self.assertEqual(0, instances[0].take('a', now=0))
+        self.assertEqual(0, instances[1].take('a', now=0))
+
+        instances[0].sync(now=1)
+        instances[1].sync(now=1)
+
+        # 7 tokens taken across the instances
+        results = [instances[1].take('a', now=1) for _ in range(4)]
+        self.assertEqual([0, 0, 0], results[:3])
+        self.assertGreater(results[3], 0)
+        instances[1].sync(now=2)
+
+        # counters are synced at most every 10s
+        self.assertEqual(0, instances[0].take('a', now=11))
+        self.assertGreater(instances[0].take('a', now=11), 0)
+        self.assertEqual({'a': 1}, instances[0]._pending)
+        self.assertEqual(10, memcache.get(
+            '0:a', namespace='webapp2ext.swagger.rate'
+        ))
+
+
+class TestAuth(TestCase):
+
+    def setUp(self):
+        super(TestAuth, self).setUp()
+        self.api = Api(
+            host="http://example.com/",
+            path='/api/v1/',
+            version='1'
+        )
+        self.api.schema('User', properties={"id": Int()})
+        resource = self.api.resource(path="/users", desc="Users")
+        self.handlers = handlers = []
+
+        class UserHandler(swagger.ApiRequestHandler):
+
+            path = resource.endpoint('/users/me')
+
+            @path.operation(
+                type_="User", alias="getUser", auth=swagger.AUTH_LOGIN
+            )
+            def get(self):
+                """Get current user"""
+                handlers.append(self)
+                self.render_json({"id": self.get_current_user_id()})
+
+            @path.operation(
+                type_="User", alias="deleteUser", auth=swagger.AUTH_ADMIN
+            )
+            def delete(self):
+                """Delete current user"""
+                self.render_json({"id": self.get_current_user_id()})
+
+        self.app = webapp2.WSGIApplication([self.api.routes()])
+
+    def test_login_required(self):
+        resp = self.app.get_response('/api/v1/users/me')
+        self.assertEqual(401, resp.status_int)
+        self.assertEqual([], self.handlers)
+
+        self.login(user_id=1234)
+        resp = self.app.get_response('/api/v1/users/me')
+        self.assertEqual(200, resp.status_int)
+        self.assertEqual({"id": 1234}, json.loads(resp.body))
+
+    def test_admin_required(self):
+        self.login()
+        resp = self.app.get_response('/api/v1/users/me', method='DELETE')
+        self.assertEqual(403, resp.status_int)
+
+        self.login(is_admin=True)
+        resp = self.app.get_response('/api/v1/users/me', method='DELETE')
+        self.assertEqual(200, resp.status_int)
+
+    def test_user_lookup_memoized(self):
+        self.login()
+        self.app.get_response('/api/v1/users/me')
+        handler = self.handlers[0]
+        self.assertTrue(
+            handler.get_current_user() is handler.get_current_user()
+        )
+
+    def test_user_override(self):
+        api = Api(host="http://example.com/", path='/api/v1/', version='1')
+        api.schema('User', properties={"id": Int()})
+        resource = api.resource(path="/users")
+
+        class UserHandler(swagger.ApiRequestHandler):
+
+            path = resource.endpoint('/users/me')
+
+            def get_current_user(self):
+                return HeaderUser.from_request(self.request)
+
+            @path.operation(
+                type_="User", alias="getUser", auth=swagger.AUTH_LOGIN
+            )
+            def get(self):
+                """Get current user"""
+                self.render_json({"id": self.get_current_user_id()})
+
+        app = webapp2.WSGIApplication([api.routes()])
+        self.assertEqual(401, app.get_response('/api/v1/users/me').status_int)
+        resp = app.get_response('/api/v1/users/me', headers={'X-User': '7'})
+        self.assertEqual({"id": 7}, json.loads(resp.body))
+
+    def test_unknown_auth(self):
+        api = Api(host="http://example.com/", path='/api/v1/', version='1')
+        api.schema('User', properties={"id": Int()})
+        endpoint = api.resource(path="/users").endpoint('/users')
+        self.assertRaises(
+            ValueError, endpoint.operation, "User", "getUsers", auth="foo"
+        )
+
+
+class TestErrors(TestCase):
+
+    def setUp(self):
+        super(TestErrors, self).setUp()
+        self.api = Api(
+            host="http://example.com/",
+            path='/api/v1/',
+            version='1'
+        )
+        self.api.schema('Student', properties={"id": Int()})
+        resource = self.api.resource(path="/students", desc="Students")
+
+        class StudentHandler(swagger.ApiRequestHandler):
+
+            path = resource.endpoint('/students/<studentId>')
+
+            @path.operation(
+                type_="Student",
+                alias="getStudent",
+                auth=swagger.AUTH_LOGIN,
+                responses=[
+                    Message(200, "Ok"),
+                    Message(401, "Login required"),
+                    Message(404, "Student not found"),
+                ]
+            )
+            def get(self, studentId):
+                """Get a student"""
+                if studentId == "unknown":
+                    self.abort(404)
+                self.abort(404, "No student with id %s" % studentId)
+
+        self.app = webapp2.WSGIApplication([self.api.routes()])
+
+    def test_declared_message(self):
+        resp = self.app.get_response('/api/v1/students/1')
+        self.assertEqual(401, resp.status_int)
+        self.assertEqual({"error": "Login required"}, json.loads(resp.body))
+
+        self.login()
+        resp = self.app.get_response('/api/v1/students/unknown')
+        self.assertEqual(404, resp.status_int)
+        self.assertEqual('application/json', resp.content_type)
+        self.assertEqual(
+            {"error": "Student not found"}, json.loads(resp.body)
+        )
+
+    def test_custom_message(self):
+        self.login()
+        resp = self.app.get_response('/api/v1/students/1')
+        self.assertEqual(404, resp.status_int)
+        self.assertEqual(
+            {"error": "No student with id 1"}, json.loads(resp.body)
+        )
+
+    def test_error_body_table(self):
+        body = swagger._error_body(403, "Forbidden")
+        self.assertEqual({"error": "Forbidden"}, json.loads(body))
+        self.assertTrue(body is swagger._error_body(403, None))
+
+
+class TestBodyLimit(TestCase):
+
+    def setUp(self):
+        super(TestBodyLimit, self).setUp()
+        self.api = Api(
+            host="http://example.com/",
+            path='/api/v1/',
+            version='1',
+            max_body_bytes=20
+        )
+        self.api.schema('Student', properties={"name": String()})
+        resource = self.api.resource(path="/students", desc="Students")
+        self.bodies = bodies = []
+
+        class StudentHandler(swagger.ApiRequestHandler):
+
+            path = resource.endpoint('/students')
+
+            @path.operation(type_="Student", alias="addStudent")
+            def post(self):
+                """Add a student"""
+                bodies.append(self.parse_json())
+                self.render_json(bodies[-1], 201)
+
+            @path.operation(
+                type_="Student", alias="putStudent", max_body_bytes=40
+            )
+            def put(self):
+                """Replace a student"""
+                bodies.append(self.parse_json())
+                self.render_json(bodies[-1])
+
+            def delete(self):
+                bodies.append(self.request.body)
+
+        self.app = webapp2.WSGIApplication([self.api.routes(batch=True)])
+
+    def _request(self, method, body, streamed=False):
+        request = webapp2.Request.blank(
+            '/api/v1/students', method=method, body=body
+        )
+        if streamed:
+            del request.environ['CONTENT_LENGTH']
+            request.environ['HTTP_TRANSFER_ENCODING'] = 'chunked'
+        return request, request.get_response(self.app)
+
+    def test_content_length(self):
+        body = json.dumps({"name": "x" * 20})
+        _, resp = self._request('POST', body)
+        self.assertEqual(413, resp.status_int)
+        self.assertEqual(swagger._error_body(413, None), resp.body)
+        self.assertEqual([], self.bodies)
+
+        _, resp = self._request('PUT', body)
+        self.assertEqual(200, resp.status_int)
+        self.assertEqual([{"name": "x" * 20}], self.bodies)
+
+        _, resp = self._request('PUT', json.dumps({"name": "x" * 40}))
+        self.assertEqual(413, resp.status_int)
+
+    def test_streamed_body(self):
+        _, resp = self._request('POST', '{"name": "bob"}', streamed=True)
+        self.assertEqual(201, resp.status_int)
+        self.assertEqual([{"name": "bob"}], self.bodies)
+
+        request, resp = self._request('POST', 'x' * 1000, streamed=True)
+        self.assertEqual(413, resp.status_int)
+        self.assertEqual(21, request.body_file_raw.tell())
+
+    def test_undocumented_method(self):
+        _, resp = self._request('DELETE', 'x' * 1000)
+        self.assertEqual(413, resp.status_int)
+        self.assertEqual([], self.bodies)
+
+        _, resp = self._request('DELETE', 'x' * 10)
+        self.assertEqual(200, resp.status_int)
+        self.assertEqual(['x' * 10], self.bodies)
+
+    def test_batch(self):
+        resp = self.app.get_response(
+            '/api/v1/batch', method='POST', body=json.dumps([
+                {"path": "/students/%d" % i} for i in range(10)
+            ])
+        )
+        self.assertEqual(413, resp.status_int)
+
+
+class TestCodec(TestCase):
+
+    def setUp(self):
+        super(TestCodec, self).setUp()
+        self.codec = RecordingCodec()
+        self.api = Api(
+            host="http://example.com/",
+            path='/api/v1/',
+            version='1',
+            codec=self.codec
+        )
+        self.api.schema('Item', properties={"name": String()})
+        resource = self.api.resource(path="/items", desc="Items")
+
+        class ItemHandler(swagger.ApiRequestHandler):
+
+            path = resource.endpoint('/items')
+
+            @path.operation(type_="Item", alias="addItem")
+            def post(self):
+                """Add an item"""
+                self.render_json(self.parse_json())
+
+        self.app = webapp2.WSGIApplication([self.api.routes()])
+
+    def test_default_codec(self):
+        codec = swagger.default_codec
+        self.assertEqual("application/json", codec.content_type)
+        self.assertEqual({"a": [1]}, codec.decode(codec.encode({"a": [1]})))
+
+    def test_default_codec_is_strict(self):
+        codec = swagger.default_codec
+        self.assertEqual('json', codec.name)
+        data = {"x": 0.1234567890123, "f": 1e-12, "url": "/a/b"}
+        body = codec.encode(data)
+        self.assertEqual(data, codec.decode(body))
+        self.assertIn('"/a/b"', body)
+        self.assertRaises(TypeError, codec.encode, {"a": object()})
+
+    @unittest.skipIf(ujson is None, "ujson is not installed")
+    def test_ujson_codec(self):
+        codec = swagger.JsonCodec(ujson)
+        data = {"x": 0.1234567890123, "f": 1e-12, "url": "/a/b"}
+        body = codec.encode(data)
+        self.assertEqual(data, codec.decode(body))
+        self.assertIn('"/a/b"', body)
+        self.assertIn('"/a/b"', codec.encode(data, pretty=True))
+
+    @unittest.skipIf(simplejson is None, "simplejson is not installed")
+    def test_simplejson_codec(self):
+        Point = collections.namedtuple('Point', 'x y')
+        codec = swagger.JsonCodec(simplejson)
+        self.assertEqual('[1, 2]', codec.encode(Point(1, 2)))
+        self.assertEqual('NaN', codec.encode(float('nan')))
+
+    def test_stdlib_codec(self):
+        codec = swagger.JsonCodec()
+        self.assertEqual("json", codec.name)
+        self.assertEqual('{\n    "a": 1\n}', codec.encode({"a": 1}, True))
+
+    def test_api_codec(self):
+        # the docs are encoded when the api is frozen
+        self.assertEqual(
+            ['encode', 'encode', 'encode'],
+            [call[0] for call in self.codec.calls]
+        )
+        self.codec.calls = []
+
+        resp = self.app.get_response(
+            '/api/v1/items', method='POST', body='{"name": "foo"}'
+        )
+        self.assertEqual(200, resp.status_int)
+        self.assertEqual({"name": "foo"}, json.loads(resp.body))
+        self.assertEqual(
+            [('decode', '{"name": "foo"}'), ('encode', {"name": "foo"})],
+            self.codec.calls
+        )
+
+    def test_invalid_body(self):
+        resp = self.app.get_response(
+            '/api/v1/items', method='POST', body='{"name":'
+        )
+        self.assertEqual(400, resp.status_int)
+        self.assertEqual(
+            {"error": "Invalid json body"}, json.loads(resp.body)
+        )
+
+
+class RecordingCodec(swagger.JsonCodec):
+
+    def __init__(self):
+        super(RecordingCodec, self).__init__()
+        self.calls = []
+
+    def encode(self, data, pretty=False):
+        self.calls.append(('encode', data,))
+        return super(RecordingCodec, self).encode(data, pretty)
+
+    def decode(self, text):
+        self.calls.append(('decode', text,))
+        return super(RecordingCodec, self).decode(text)
+
+
+@unittest.skipIf(msgpack is None, "msgpack is not installed")
+class TestNegotiation(TestCase):
+
+    def setUp(self):
+        super(TestNegotiation, self).setUp()
+        self.api = Api(
+            host="http://example.com/",
+            path='/api/v1/',
+            version='1',
+            codecs=[swagger.MsgPackCodec()]
+        )
+        self.api.schema('Item', properties={"name": String()})
+        self.resource = self.api.resource(path="/items", desc="Items")
+
+        class ItemHandler(swagger.ApiRequestHandler):
+
+            path = self.resource.endpoint('/items')
+
+            @path.operation(type_="Item", alias="addItem")
+            def post(self):
+                """Add an item"""
+                self.render_json(self.parse_json())
+
+        self.app = webapp2.WSGIApplication([self.api.routes()])
+
+    def test_default_to_json(self):
+        for accept in (None, '*/*', 'text/html'):
+            headers = {'Accept': accept} if accept else {}
+            resp = self.app.get_response(
+                '/api/v1/items',
+                method='POST',
+                body='{"name": "foo"}',
+                headers=headers
+            )
+            self.assertEqual('application/json', resp.content_type)
+            self.assertEqual('Accept', resp.headers['Vary'])
+            self.assertEqual({"name": "foo"}, json.loads(resp.body))
+
+    def test_msgpack(self):
+        resp = self.app.get_response(
+            '/api/v1/items',
+            method='POST',
+            body=msgpack.packb({"name": "foo"}),
+            headers={
+                'Accept': 'application/x-msgpack',
+                'Content-Type': 'application/x-msgpack',
+            }
+        )
+        self.assertEqual(200, resp.status_int)
+        self.assertEqual('application/x-msgpack', resp.content_type)
+        self.assertEqual('Accept', resp.headers['Vary'])
+        # keys and text are msgpack str (not bin) values
+        self.assertEqual('\x81\xa4name\xa3foo', resp.body)
+        self.assertEqual(
+            {"name": "foo"}, msgpack.unpackb(resp.body, raw=False)
+        )
+
+    def test_error_vary(self):
+        resp = self.app.get_response(
+            '/api/v1/items', method='POST', body='{"name":'
+        )
+        self.assertEqual(400, resp.status_int)
+        self.assertEqual('Accept', resp.headers['Vary'])
+
+    def test_json_only_api(self):
+        api = Api(host="http://example.com/", path='/api/v2/', version='2')
+        api.schema('Item', properties={"name": String()})
+        resource = api.resource(path="/items", desc="Items")
+
+        class ItemHandler(swagger.ApiRequestHandler):
+
+            path = resource.endpoint('/items')
+
+            @path.operation(type_="Item", alias="getItem")
+            def get(self):
+                """Get an item"""
+                self.render_json({"name": "foo"})
+
+        app = webapp2.WSGIApplication([api.routes()])
+        resp = app.get_response('/api/v2/items')
+        self.assertEqual(200, resp.status_int)
+        self.assertNotIn('Vary', resp.headers)
+
+    def test_operation_doc(self):
+        operation = self.resource.api_doc()['apis'][0]['operations'][0]
+        self.assertEqual(
+            ['application/json', 'application/x-msgpack'],
+            operation['produces']
+        )
+        self.assertEqual(
+            ['application/json', 'application/x-msgpack'],
+            operation['consumes']
+        )
+
+
+class TestProjection(TestCase):
+
+    def setUp(self):
+        super(TestProjection, self).setUp()
+        self.api = Api(
+            host="http://example.com/",
+            path='/api/v1/',
+            version='1'
+        )
+        self.api.schema(
+            'Student',
+            properties={
+                "name": String(required=True),
+                "id": Int(required=True),
+                "tutor": self.api.ref('Tutor'),
+            },
+        )
+        self.api.schema(
+            'Tutor',
+            properties={"name": String(), "email": String()}
+        )
+        self.api.schema(
+            'StudentList',
+            properties={
+                'students': Array(self.api.ref('Student'), required=True),
+                'cursor': String(),
+            }
+        )
+        resource = self.api.resource(path="/students", desc="Students")
+
+        class StudentListHandler(swagger.ApiRequestHandler):
+
+            path = resource.endpoint('/students')
+
+            @path.operation(type_="StudentList", alias="getStudents")
+            def get(self):
+                """List students"""
+                self.render_json({
+                    "cursor": "abc",
+                    "students": [
+                        {
+                            "id": 1,
+                            "name": "alice",
+                            "tutor": {"name": "bob", "email": "bob@x.com"}
+                        },
+                        {"id": 2, "name": "carol", "tutor": None},
+                    ]
+                })
+
+        self.app = webapp2.WSGIApplication([self.api.routes()])
+
+    def test_projection(self):
+        func = self.api.projection(
+            'StudentList', 'students.name,students.tutor.email'
+        )
+        self.assertEqual(
+            {"students": [{"name": "a", "tutor": {"email": "b"}}]},
+            func({
+                "cursor": "abc",
+                "students": [
+                    {"id": 1, "name": "a", "tutor": {"name": "c", "email": "b"}}
+                ]
+            })
+        )
+        self.assertTrue(
+            func is self.api.projection(
+                'StudentList', 'students.name,students.tutor.email'
+            )
+        )
+
+    def test_whole_field(self):
+        func = self.api.projection('StudentList', 'students.id,students')
+        data = {"students": [{"id": 1, "name": "a"}]}
+        self.assertEqual(data, func(data))
+
+    def test_unknown_field(self):
+        self.assertRaises(
+            ValueError, self.api.projection, 'StudentList', 'students.foo'
+        )
+        self.assertRaises(
+            ValueError, self.api.projection, 'StudentList', 'cursor.foo'
+        )
+        self.assertRaises(ValueError, self.api.projection, 'StudentList', ',')
+        # a selected parent doesn't skip the validation of a sub-field
+        self.assertRaises(
+            ValueError,
+            self.api.projection, 'StudentList', 'students,students.foo'
+        )
+
+    def test_redefined_model(self):
+        api = Api(host="http://example.com/", path='/api/v2/', version='2')
+        api.schema('Tutor', properties={"name": String(), "email": String()})
+        api.projection('Tutor', 'email')
+        api.schema('Tutor', properties={"name": String()})
+        self.assertRaises(ValueError, api.projection, 'Tutor', 'email')
+
+    def test_fields_query(self):
+        resp = self.app.get_response(
+            '/api/v1/students?fields=students.id,students.tutor.name'
+        )
+        self.assertEqual(200, resp.status_int)
+        self.assertEqual(
+            {
+                "students": [
+                    {"id": 1, "tutor": {"name": "bob"}},
+                    {"id": 2, "tutor": None},
+                ]
+            },
+            json.loads(resp.body)
+        )
+
+    def test_invalid_fields_query(self):
+        resp = self.app.get_response('/api/v1/students?fields=foo')
+        self.assertEqual(400, resp.status_int)
+        self.assertEqual(
+            {"error": "Unknown field (foo)."}, json.loads(resp.body)
+        )
+
+
+class StudentModel(ndb.Model):
+    name = ndb.StringProperty()
+
+
+class TestPagination(TestCase):
+
+    def setUp(self):
+        super(TestPagination, self).setUp()
+        self.api = Api(
+            host="http://example.com/",
+            path='/api/v1/',
+            version='1'
+        )
+        self.api.schema('Student', properties={"name": String()})
+        self.api.schema(
+            'StudentList',
+            properties={
+                'students': Array(self.api.ref('Student'), required=True),
+                'cursor': String(),
+            }
+        )
+        self.resource = self.api.resource(path="/students", desc="Students")
+
+        class StudentListHandler(swagger.ApiRequestHandler):
+
+            path = self.resource.endpoint('/students')
+
+            @path.operation(
+                type_="StudentList", alias="getStudents", paginate=2
+            )
+            def get(self):
+                """List students"""
+                self.render_page(
+                    StudentModel.query().order(StudentModel.name),
+                    items="students"
+                )
+
+        self.app = webapp2.WSGIApplication([self.api.routes()])
+
+        for name in ("alice", "bob", "carol", "dan", "eve"):
+            StudentModel(name=name).put()
+
+    def _get_names(self, url):
+        resp = self.app.get_response(url)
+        self.assertEqual(200, resp.status_int)
+        body = json.loads(resp.body)
+        return [s['name'] for s in body['students']], body['cursor']
+
+    def test_pages(self):
+        names, cursor = self._get_names('/api/v1/students')
+        self.assertEqual(["alice", "bob"], names)
+
+        names, cursor = self._get_names(
+            '/api/v1/students?cursor=%s&limit=3' % cursor
+        )
+        self.assertEqual(["carol", "dan", "eve"], names)
+        self.assertEqual(None, cursor)
+
+    def test_invalid_params(self):
+        for query in ('limit=0', 'limit=101', 'limit=foo', 'cursor=%%%'):
+            resp = self.app.get_response('/api/v1/students?%s' % query)
+            self.assertEqual(400, resp.status_int)
+
+    def test_doc(self):
+        operation = self.resource.api_doc()['apis'][0]['operations'][0]
+        self.assertEqual(
+            [
+                {
+                    "name": "limit",
+                    "description": "Maximum number of items to return",
+                    "type": "integer",
+                    "paramType": "query",
+                    "default": 2,
+                    "minimum": 1,
+                    "maximum": 100,
+                },
+                {
+                    "name": "cursor",
+                    "description": "Cursor of the page to return",
+                    "type": "string",
+                    "paramType": "query",
+                },
+            ],
+            operation['parameters']
+        )
+
+
+class TestBatch(TestCase):
+
+    def setUp(self):
+        super(TestBatch, self).setUp()
+        self.api = Api(
+            host="http://example.com/",
+            path='/api/v1/',
+            version='1'
+        )
+        self.api.schema('Item', properties={"name": String()})
+        resource = self.api.resource(path="/items", desc="Items")
+        self.items = items = {"1": {"name": "foo"}}
+
+        class ItemHandler(swagger.ApiRequestHandler):
+
+            path = resource.endpoint('/items/<itemId>')
+
+            @path.operation(type_="Item", alias="getItem")
+            def get(self, itemId):
+                """Get an item"""
+                if itemId not in items:
+                    self.abort(404)
+                self.render_json(items[itemId])
+
+            @path.operation(type_="Item", alias="putItem")
+            def put(self, itemId):
+                """Save an item"""
+                items[itemId] = self.parse_json()
+                self.render_json(items[itemId])
+
+        class HeaderHandler(swagger.ApiRequestHandler):
+
+            path = resource.endpoint('/headers')
+
+            @path.operation(type_="Item", alias="getHeaders")
+            def get(self):
+                """Get some of the request headers"""
+                headers = self.request.headers
+                self.render_json({
+                    "cron": headers.get('X-AppEngine-Cron'),
+                    "country": headers.get('X-AppEngine-Country'),
+                    "custom": headers.get('X-Custom'),
+                    "active": webapp2.get_request() == self.request,
+                })
+
+    def _batch(self, batch, **kw):
+        app = webapp2.WSGIApplication([self.api.routes(batch=True, **kw)])
+        return app.get_response(
+            '/api/v1/batch', method='POST', body=json.dumps(batch)
+        )
+
+    def test_batch(self):
+        resp = self._batch([
+            {"path": "/items/1"},
+            {"path": "/items/2", "method": "PUT", "body": {"name": "bar"}},
+            {"path": "items/2"},
+            {"path": "/items/3"},
+            {"path": "/unknown"},
+        ])
+        self.assertEqual(200, resp.status_int)
+        self.assertEqual('application/json', resp.content_type)
+        self.assertEqual(
+            [
+                {"status": 200, "body": {"name": "foo"}},
+                {"status": 200, "body": {"name": "bar"}},
+                {"status": 200, "body": {"name": "bar"}},
+                {"status": 404, "body": {"error": "Not Found"}},
+                {"status": 404, "body": {"error": "Not Found"}},
+            ],
+            json.loads(resp.body)
+        )
+
+    def test_concurrent_batch(self):
+        self.items.update((str(i), {"name": str(i)},) for i in range(10))
+        resp = self._batch(
+            [{"path": "/items/%d" % i} for i in range(10)],
+            batch_workers=4
+        )
+        self.assertEqual(
+            [{"status": 200, "body": {"name": str(i)}} for i in range(10)],
+            json.loads(resp.body)
+        )
+
+    def test_sub_request_headers(self):
+        app = webapp2.WSGIApplication([self.api.routes(batch=True)])
+        request = webapp2.Request.blank(
+            '/api/v1/batch',
+            method='POST',
+            headers={'X-AppEngine-Country': 'FR', 'X-Custom': 'a'},
+            body=json.dumps([
+                {
+                    "path": "/headers",
+                    "headers": {"X-AppEngine-Cron": "true", "X-Custom": "b"},
+                },
+                {"path": "/headers"},
+            ])
+        )
+        resp = request.get_response(app)
+        self.assertEqual(
+            [
+                {
+                    "status": 200,
+                    "body": {
+                        "cron": None,
+                        "country": None,
+                        "custom": "b",
+                        "active": True,
+                    },
+                },
+                {
+                    "status": 200,
+                    "body": {
+                        "cron": None,
+                        "country": None,
+                        "custom": "a",
+                        "active": True,
+                    },
+                },
+            ],
+            json.loads(resp.body)
+        )
+
+    def test_invalid_batch(self):
+        for batch in (
+            {},
+            [],
+            [{"method": "GET"}],
+            [{"path": "/items/1", "headers": ["X-Custom"]}],
+            [{"path": "/batch"}],
+            [{"path": "/items/1"}] * 21,
+        ):
+            self.assertEqual(400, self._batch(batch).status_int)
+
+    def test_no_batch_route(self):
+        app = webapp2.WSGIApplication([self.api.routes()])
+        resp = app.get_response('/api/v1/batch', method='POST', body='[]')
+        self.assertEqual(404, resp.status_int)
+
+
+class TestFreeze(TestCase):
+
+    def setUp(self):
+        super(TestFreeze, self).setUp()
+        self.api = Api(
+            host="http://example.com/",
+            path='/api/v1/',
+            version='1'
+        )
+        self.api.schema('Student', properties={"name": String()})
+        self.resource = self.api.resource(path="/students", desc="Students")
+        self.endpoint = self.resource.endpoint('/students')
+        self.endpoint.operation(type_="Student", alias="getStudents")(
+            Handler.get
+        )
+        self.endpoint.bind(Handler)
+
+    def test_copy_on_write(self):
+        schemas = self.api._schemas
+        self.api.schema('Tutor', properties={"name": String()})
+        self.assertEqual(['Student'], schemas.keys())
+        self.assertEqual(['Student', 'Tutor'], sorted(self.api._schemas))
+
+        resources = self.api.resources
+        self.assertTrue(self.resource is self.api.resource("/students"))
+        self.assertTrue(resources is self.api.resources)
+        self.api.resource("/tutors")
+        self.assertEqual(['/students'], resources.keys())
+
+    def test_freeze_on_routes(self):
+        self.assertFalse(self.api.frozen)
+        self.api.routes()
+        self.assertTrue(self.api.frozen)
+        self.assertTrue(self.resource.frozen)
+
+        self.assertTrue(self.api.api_doc() is self.api.api_doc())
+        self.assertTrue(self.api.schemas() is self.api.schemas())
+        self.assertTrue(self.resource.api_doc() is self.resource.api_doc())
+        self.assertEqual(
+            ("GET",), tuple(op.method for op in self.endpoint.operations)
+        )
+
+        # the registry can still be read
+        self.assertTrue(self.resource is self.api.resource("/students"))
+        self.assertTrue(self.endpoint is self.resource.endpoint('/students'))
+        self.assertEqual('Student', self.api.ref('Student').name)
+
+        # ... but not modified
+        self.assertRaises(
+            RuntimeError,
+            self.api.schema, 'Tutor', properties={"name": String()}
+        )
+        self.assertRaises(RuntimeError, self.api.ref, 'Tutor')
+        self.assertRaises(RuntimeError, self.api.resource, '/tutors')
+        self.assertRaises(RuntimeError, self.resource.endpoint, '/tutors')
+        self.assertRaises(
+            RuntimeError, self.endpoint.operation, "Student", "addStudent"
+        )
+        self.assertRaises(TypeError, self.api.resources.pop, '/students')
+
+    def test_pre_encoded_docs(self):
+        app = webapp2.WSGIApplication([self.api.routes()])
+        for path, doc in (
+            ('/api/v1/api-docs', self.api.api_doc(),),
+            ('/api/v1/api-docs/students', self.resource.api_doc(),),
+            ('/api/v1/json-schemas', self.api.schemas(),),
+        ):
+            resp = app.get_response(path)
+            self.assertEqual(200, resp.status_int)
+            self.assertEqual(doc, json.loads(resp.body))
+
+    def test_no_doc_routes(self):
+        self.api.routes(doc_routes=False)
+        self.assertTrue(self.resource.frozen)
+        self.assertEqual(None, self.resource.api_doc_body)
+
+        # still rendered on demand
+        doc = self.resource.api_doc()
+        self.assertEqual('/students', doc['resourcePath'])
+        self.assertTrue(doc is self.resource.api_doc())
+
+
+class TestSchemaRegistry(TestCase):
+
+    def setUp(self):
+        super(TestSchemaRegistry, self).setUp()
+        self.registry = swagger.SchemaRegistry()
+        self.registry.schema('Student', properties={"name": String()})
+        self.registry.schema(
+            'StudentList',
+            properties={"students": Array(items=self.registry.ref('Student'))}
+        )
+        self.v1 = self.api('1')
+        self.v2 = self.api('2')
+
+    def api(self, version):
+        api = Api(
+            host="http://example.com/",
+            path='/api/v%s/' % version,
+            version=version,
+            registry=self.registry
+        )
+        resource = api.resource(path="/students", desc="Students")
+        resource.endpoint('/students').operation(
+            type_="StudentList", alias="getStudents"
+        )(Handler.get)
+        return api
+
+    def test_shared_definitions(self):
+        self.registry.schema('Tutor', properties={"name": String()})
+
+        for api in (self.v1, self.v2,):
+            schemas = api.schemas()
+            self.assertEqual(
+                "%s#/Student" % api.schema_path,
+                schemas['StudentList']['properties']['students']['items'][
+                    '$ref'
+                ]
+            )
+            self.assertEqual(
+                {"name": {"type": "string"}}, schemas['Tutor']['properties']
+            )
+        self.assertIs(self.v1._schemas['Student'], self.v2._schemas['Student'])
+
+    def test_override(self):
+        self.v2.schema('Student', properties={"id": Int()})
+        self.registry.schema('Student', properties={"email": String()})
+
+        self.assertEqual(
+            ['email'], self.v1.schemas()['Student']['properties'].keys()
+        )
+        self.assertEqual(
+            ['id'], self.v2.schemas()['Student']['properties'].keys()
+        )
+        self.v1.validate('StudentList', {"students": [{"email": "a@b.c"}]})
+        self.assertRaises(
+            ValidationError,
+            self.v2.validate, 'StudentList', {"students": [{"id": "1"}]}
+        )
+
+    def test_shared_models(self):
+        self.v1.freeze()
+        self.v2.freeze()
+
+        self.assertIs(
+            self.v1.resource('/students').api_doc()['models']['Student'],
+            self.v2.resource('/students').api_doc()['models']['Student']
+        )
+
+    def test_shared_validators(self):
+        self.v2.schema('Student', properties={"id": Int()})
+        self.v1.freeze()
+        self.v2.freeze()
+        v3 = self.api('3')
+        v3.freeze()
+
+        self.assertIs(
+            self.v1.validator('StudentList'), v3.validator('StudentList')
+        )
+        self.assertIsNot(
+            self.v1.validator('StudentList'),
+            self.v2.validator('StudentList')
+        )
+        self.assertRaises(
+            ValidationError,
+            v3.validate, 'StudentList', {"students": [{"name": 1}]}
+        )
+        self.v2.validate('StudentList', {"students": [{"id": 1}]})
+
+    def test_frozen(self):
+        self.v1.routes()
+        self.assertTrue(self.registry.frozen)
+        self.assertRaises(
+            RuntimeError,
+            self.registry.schema, 'Tutor', properties={"name": String()}
+        )
+        self.assertEqual(
+            self.v1.schemas()['Student']['properties'],
+            self.api('3').schemas()['Student']['properties']
+        )
+
+    def test_concurrent_freeze(self):
+        def define():
+            for i in range(200):
+                try:
+                    self.registry.schema(
+                        'Tutor', properties={"name%d" % i: String()}
+                    )
+                except RuntimeError:
+                    return
+
+        def freeze():
+            for api in (self.v1, self.v2,):
+                api.schemas()
+                api.freeze()
+
+        threads = [
+            threading.Thread(target=define), threading.Thread(target=freeze)
+        ]
+        for thread in threads:
+            thread.daemon = True
+            thread.start()
+        for thread in threads:
+            thread.join(5)
+            self.assertFalse(thread.is_alive())
+        self.assertTrue(self.registry.frozen)
+
+
+class TestSnapshot(TestCase):
+
+    def define_api(self, description="Student", **kw):
+        api = Api(
+            host="http://example.com/",
+            path='/api/v1/',
+            version='1',
+            **kw
+        )
+        api.schema(
+            'Student',
+            description=description,
+            properties={
+                "name": String(),
+                "tutor": api.ref('Tutor'),
+            }
+        )
+        api.schema('Tutor', properties={"name": String()})
+        students = api.resource(path="/students", desc="Students")
+        endpoint = students.endpoint('/students')
+        endpoint.operation(type_="Student", alias="getStudents")(Handler.get)
+        endpoint.bind(Handler)
+        return api
+
+    def test_fingerprint(self):
+        self.assertEqual(
+            self.define_api().fingerprint(), self.define_api().fingerprint()
+        )
+        self.assertNotEqual(
+            self.define_api().fingerprint(),
+            self.define_api("A student").fingerprint()
+        )
+
+        # the rendering options change the rendered documents too
+        self.assertNotEqual(
+            self.define_api().fingerprint(),
+            self.define_api(hoist_inline=True).fingerprint()
+        )
+
+    @unittest.skipIf(ujson is None, "ujson is not installed")
+    def test_codec_fingerprint(self):
+        self.assertNotEqual(
+            self.define_api(codec=swagger.JsonCodec(json)).fingerprint(),
+            self.define_api(codec=swagger.JsonCodec(ujson)).fingerprint()
+        )
+
+    def test_load_snapshot(self):
+        expected = self.define_api()
+        data = expected.snapshot()
+        self.assertTrue(expected.frozen)
+
+        api = self.define_api()
+        self.assertTrue(api.load_snapshot(data))
+        self.assertTrue(api.frozen)
+        self.assertEqual(expected.api_doc(), api.api_doc())
+        self.assertEqual(expected.schemas(), api.schemas())
+        self.assertEqual(
+            expected.resources['/students'].api_doc(),
+            api.resources['/students'].api_doc()
+        )
+        self.assertEqual(
+            frozenset(['Student', 'Tutor']), api.resources['/students'].models
+        )
+
+        app = webapp2.WSGIApplication([api.routes()])
+        resp = app.get_response('/api/v1/api-docs/students')
+        self.assertEqual(
+            expected.resources['/students'].api_doc(), json.loads(resp.body)
+        )
+
+        # the decoded schemas can be compiled
+        data = {"name": "bob", "tutor": {"name": "alice"}}
+        api.validate('Student', data)
+        student = api.load('Student', data)
+        self.assertEqual('alice', student.tutor.name)
+        self.assertEqual(data, json.loads(api.encoder('Student')(student)))
+
+    def test_lazy_snapshot(self):
+        data = self.define_api(lazy_docs=True).snapshot()
+        api = self.define_api(lazy_docs=True)
+        self.assertTrue(api.load_snapshot(data))
+        resource = api.resources['/students']
+        self.assertEqual(None, resource.api_doc_body)
+        expected = self.define_api()
+        self.assertEqual(
+            expected.resources['/students'].api_doc(), resource.api_doc()
+        )
+
+    def test_stale_snapshot(self):
+        data = self.define_api().snapshot()
+        api = self.define_api("A student")
+        self.assertFalse(api.load_snapshot(data))
+        self.assertFalse(api.frozen)
+        self.assertFalse(api.load_snapshot('foo'))
+
+    def test_hoisted_snapshot(self):
+        data = self.define_api(hoist_inline=True).snapshot()
+        self.assertFalse(self.define_api().load_snapshot(data))
+        self.assertTrue(
+            self.define_api(hoist_inline=True).load_snapshot(data)
+        )
+
+    def test_custom_fingerprint(self):
+        data = self.define_api().snapshot(fingerprint='v1')
+        self.assertFalse(self.define_api().load_snapshot(data))
+        self.assertFalse(self.define_api().load_snapshot(data, 'v2'))
+        self.assertTrue(self.define_api().load_snapshot(data, 'v1'))
+
+
+class TestWarmup(TestCase):
+
+    def setUp(self):
+        super(TestWarmup, self).setUp()
+        self.api = Api(
+            host="http://example.com/",
+            path='/api/v1/',
+            version='1'
+        )
+        self.api.schema(
+            'Student',
+            properties={
+                "name": String(required=True),
+                "tutor": self.api.ref('Tutor'),
+            }
+        )
+        students = self.api.resource(path="/students", desc="Students")
+        endpoint = students.endpoint('/students')
+        endpoint.operation(type_="Student", alias="getStudents")(Handler.get)
+        endpoint.bind(Handler)
+
+    def test_warmup(self):
+        timings = self.api.warmup()
+        self.assertEqual(
+            [
+                'freeze', 'resolver', 'validators', 'compiled validators',
+                'model classes', 'loaders', 'encoders', 'compression',
+            ],
+            timings.keys()
+        )
+        self.assertTrue(self.api.frozen)
+        self.assertNotEqual(None, self.api._resolver)
+        self.assertEqual(['Student'], self.api._validators.keys())
+        self.assertEqual(['Student'], self.api._compiled.keys())
+        self.assertEqual(['Student'], self.api._model_classes.keys())
+        self.assertEqual(['Student'], self.api._loaders.keys())
+        # the Student encoder requires the undefined Tutor schema
+        self.assertEqual({}, self.api._encoders)
+
+    def test_warmup_compilers(self):
+        self.api.schema('Tutor', properties={"name": String()})
+        self.api.warmup()
+        self.assertEqual(
+            [('Student', False,), ('Tutor', False,)],
+            sorted(self.api._encoders.keys())
+        )
+        self.assertEqual(3, len(self.api._gzipped))
+
+    def test_warmup_route(self):
+        app = webapp2.WSGIApplication(
+            [swagger.warmup_route([self.api]), self.api.routes()]
+        )
+        resp = app.get_response('/_ah/warmup')
+        self.assertEqual(200, resp.status_int)
+        self.assertEqual(
+            [
+                'compiled validators', 'compression', 'encoders', 'freeze',
+                'loaders', 'model classes', 'resolver', 'validators',
+            ],
+            sorted(json.loads(resp.body)['/api/v1'])
+        )
+
+    def test_gzipped_docs(self):
+        app = webapp2.WSGIApplication([self.api.routes()])
+        resp = app.get_response(
+            '/api/v1/json-schemas', headers={'Accept-Encoding': 'gzip'}
+        )
+        self.assertEqual('gzip', resp.headers['Content-Encoding'])
+        self.assertEqual(
+            self.api.schemas(),
+            json.loads(gzip.GzipFile(fileobj=StringIO(resp.body)).read())
+        )
+
+    def test_validator_cache(self):
+        validator = self.api.validator('Student')
+        self.assertTrue(validator is self.api.validator('Student'))
+        self.api.schema('Tutor', properties={"name": String(required=True)})
+        self.assertFalse(validator is self.api.validator('Student'))
+        self.assertRaises(
+            ValidationError,
+            self.api.validate, 'Student', {"name": "alice", "tutor": {}}
+        )